@@ -0,0 +1,35 @@
+"""Add composite indexes for notebook/user and created_at filters
+
+Revision ID: a9c3e5f7b104
+Revises: f1b4d6e8a273
+Create Date: 2026-10-14 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9c3e5f7b104'
+down_revision: Union[str, None] = 'f1b4d6e8a273'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_documents_notebook_user', 'documents', ['notebook_id', 'user_id'], unique=False)
+    op.create_index('ix_documents_user_id_id', 'documents', ['user_id', 'id'], unique=False)
+    op.create_index('ix_messages_chat_created', 'messages', ['chat_id', 'created_at'], unique=False)
+    # summary_packs is created by create_tables.py, so it may not exist yet
+    if sa.inspect(op.get_bind()).has_table('summary_packs'):
+        op.create_index('ix_summary_packs_notebook_created', 'summary_packs', ['notebook_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table('summary_packs'):
+        op.drop_index('ix_summary_packs_notebook_created', table_name='summary_packs')
+    op.drop_index('ix_messages_chat_created', table_name='messages')
+    op.drop_index('ix_documents_user_id_id', table_name='documents')
+    op.drop_index('ix_documents_notebook_user', table_name='documents')
@@ -0,0 +1,66 @@
+"""Use timezone-aware, database-stamped created_at/updated_at
+
+Revision ID: b2d4f6a8c015
+Revises: a9c3e5f7b104
+Create Date: 2026-10-14 11:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b2d4f6a8c015'
+down_revision: Union[str, None] = 'a9c3e5f7b104'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# table -> timestamp columns it carries
+TIMESTAMP_COLUMNS = {
+    'users': ('created_at', 'updated_at'),
+    'notebooks': ('created_at', 'updated_at'),
+    'documents': ('created_at', 'updated_at'),
+    'chats': ('created_at', 'updated_at'),
+    'messages': ('created_at', 'updated_at'),
+    'citations': ('created_at',),
+    'summary_packs': ('created_at', 'updated_at'),
+    'discovery_question_sets': ('created_at', 'updated_at'),
+    'discovery_questions': ('created_at', 'updated_at'),
+}
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    for table, columns in TIMESTAMP_COLUMNS.items():
+        # summary/discovery tables are created by create_tables.py, so they may not exist yet
+        if not inspector.has_table(table):
+            continue
+        for column in columns:
+            # Existing values were written with datetime.utcnow(), i.e. naive UTC
+            op.alter_column(
+                table, column,
+                type_=sa.DateTime(timezone=True),
+                existing_type=sa.DateTime(),
+                existing_nullable=False,
+                server_default=sa.func.now(),
+                postgresql_using=f"{column} AT TIME ZONE 'UTC'",
+            )
+
+
+def downgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    for table, columns in TIMESTAMP_COLUMNS.items():
+        if not inspector.has_table(table):
+            continue
+        for column in columns:
+            op.alter_column(
+                table, column,
+                type_=sa.DateTime(),
+                existing_type=sa.DateTime(timezone=True),
+                existing_nullable=False,
+                server_default=None,
+                postgresql_using=f"{column} AT TIME ZONE 'UTC'",
+            )
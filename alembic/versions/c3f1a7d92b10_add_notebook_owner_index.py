@@ -0,0 +1,25 @@
+"""Add notebooks (user_id, id) ownership index
+
+Revision ID: c3f1a7d92b10
+Revises: a8418e533c9c
+Create Date: 2026-10-14 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f1a7d92b10'
+down_revision: Union[str, None] = 'a8418e533c9c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_notebooks_user_id_id', 'notebooks', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notebooks_user_id_id', table_name='notebooks')
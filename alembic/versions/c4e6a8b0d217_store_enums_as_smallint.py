@@ -0,0 +1,69 @@
+"""Store document/message/summary pack enums as SMALLINT codes
+
+Revision ID: c4e6a8b0d217
+Revises: b2d4f6a8c015
+Create Date: 2026-10-14 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e6a8b0d217'
+down_revision: Union[str, None] = 'b2d4f6a8c015'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (table, column, Postgres enum type, member names in code order, check constraint)
+ENUM_COLUMNS = (
+    ('documents', 'status', 'documentstatus', ('PENDING', 'INGESTING', 'READY', 'ERROR'), 'ck_documents_status'),
+    ('messages', 'role', 'messagerole', ('USER', 'ASSISTANT', 'SYSTEM'), 'ck_messages_role'),
+    ('summary_packs', 'scope_type', 'summarypackscope', ('NOTEBOOK', 'DOCUMENT_LIST'), 'ck_summary_packs_scope_type'),
+    ('summary_packs', 'status', 'summarypackstatus', ('PENDING', 'IN_PROGRESS', 'DONE', 'FAILED'), 'ck_summary_packs_status'),
+)
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    for table, column, enum_name, names, check_name in ENUM_COLUMNS:
+        # summary_packs is created by create_tables.py, so it may not exist yet
+        if not inspector.has_table(table):
+            continue
+        cases = " ".join(f"WHEN '{name}' THEN {code}" for code, name in enumerate(names))
+        op.alter_column(
+            table, column,
+            type_=sa.SmallInteger(),
+            existing_nullable=False,
+            postgresql_using=f"CASE {column}::text {cases} END",
+        )
+        op.execute(f"DROP TYPE IF EXISTS {enum_name}")
+        codes = ", ".join(str(code) for code in range(len(names)))
+        op.create_check_constraint(check_name, table, f"{column} IN ({codes})")
+    
+    op.create_index(
+        'ix_documents_pending', 'documents', ['status'],
+        unique=False, postgresql_where=sa.text('status = 0')
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_documents_pending', table_name='documents')
+    
+    inspector = sa.inspect(op.get_bind())
+    for table, column, enum_name, names, check_name in ENUM_COLUMNS:
+        if not inspector.has_table(table):
+            continue
+        op.drop_constraint(check_name, table, type_='check')
+        enum_type = sa.Enum(*names, name=enum_name)
+        enum_type.create(op.get_bind(), checkfirst=True)
+        cases = " ".join(f"WHEN {code} THEN '{name}'" for code, name in enumerate(names))
+        op.alter_column(
+            table, column,
+            type_=enum_type,
+            existing_nullable=False,
+            postgresql_using=f"(CASE {column} {cases} END)::{enum_name}",
+        )
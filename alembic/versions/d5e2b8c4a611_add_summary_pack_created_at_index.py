@@ -0,0 +1,29 @@
+"""Add summary_packs.created_at index
+
+Revision ID: d5e2b8c4a611
+Revises: c3f1a7d92b10
+Create Date: 2026-10-14 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5e2b8c4a611'
+down_revision: Union[str, None] = 'c3f1a7d92b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # summary_packs is created by create_tables.py, so it may not exist yet
+    if sa.inspect(op.get_bind()).has_table('summary_packs'):
+        op.create_index(op.f('ix_summary_packs_created_at'), 'summary_packs', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table('summary_packs'):
+        op.drop_index(op.f('ix_summary_packs_created_at'), table_name='summary_packs')
@@ -0,0 +1,80 @@
+"""Move summary_packs.sections JSON into a summary_pack_sections table
+
+Revision ID: d6f8b0c2e329
+Revises: c4e6a8b0d217
+Create Date: 2026-10-14 12:30:00.000000
+
+"""
+import uuid
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd6f8b0c2e329'
+down_revision: Union[str, None] = 'c4e6a8b0d217'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+EXECUTIVE_SUMMARY_KEY = 'executive_summary'
+
+
+def upgrade() -> None:
+    # summary_packs is created by create_tables.py, so it may not exist yet
+    if not sa.inspect(op.get_bind()).has_table('summary_packs'):
+        return
+    
+    sections_table = op.create_table('summary_pack_sections',
+    sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('summary_pack_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('idx', sa.SmallInteger(), nullable=False),
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('title', sa.String(length=255), nullable=True),
+    sa.Column('body', sa.Text(), nullable=False),
+    sa.ForeignKeyConstraint(['summary_pack_id'], ['summary_packs.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_summary_pack_sections_pack_idx', 'summary_pack_sections', ['summary_pack_id', 'idx'], unique=True)
+    
+    # Copy existing section blobs into rows
+    bind = op.get_bind()
+    rows = []
+    for pack_id, sections in bind.execute(sa.text("SELECT id, sections FROM summary_packs WHERE sections IS NOT NULL")):
+        for idx, (key, value) in enumerate((sections or {}).items()):
+            if key == EXECUTIVE_SUMMARY_KEY:
+                rows.append({'id': uuid.uuid4(), 'summary_pack_id': pack_id, 'idx': idx, 'key': key, 'title': None, 'body': str(value)})
+            elif isinstance(value, dict):
+                rows.append({
+                    'id': uuid.uuid4(), 'summary_pack_id': pack_id, 'idx': idx, 'key': key,
+                    'title': value.get('document_name'), 'body': value.get('summary', '')
+                })
+    if rows:
+        op.bulk_insert(sections_table, rows)
+    
+    op.drop_column('summary_packs', 'sections')
+
+
+def downgrade() -> None:
+    if not sa.inspect(op.get_bind()).has_table('summary_pack_sections'):
+        return
+    
+    op.add_column('summary_packs', sa.Column('sections', sa.JSON(), nullable=True))
+    
+    bind = op.get_bind()
+    packs = {}
+    for pack_id, key, title, body in bind.execute(sa.text(
+        "SELECT summary_pack_id, key, title, body FROM summary_pack_sections ORDER BY summary_pack_id, idx"
+    )):
+        sections = packs.setdefault(pack_id, {})
+        sections[key] = body if key == EXECUTIVE_SUMMARY_KEY else {'document_name': title, 'summary': body}
+    
+    summary_packs = sa.table('summary_packs', sa.column('id', postgresql.UUID(as_uuid=True)), sa.column('sections', sa.JSON()))
+    for pack_id, sections in packs.items():
+        bind.execute(summary_packs.update().where(summary_packs.c.id == pack_id).values(sections=sections))
+    
+    op.drop_index('ix_summary_pack_sections_pack_idx', table_name='summary_pack_sections')
+    op.drop_table('summary_pack_sections')
@@ -0,0 +1,26 @@
+"""Add documents.ingestion_task_id
+
+Revision ID: e7a9c0d3f482
+Revises: d5e2b8c4a611
+Create Date: 2026-10-14 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a9c0d3f482'
+down_revision: Union[str, None] = 'd5e2b8c4a611'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('documents', sa.Column('ingestion_task_id', sa.String(length=255), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('documents', 'ingestion_task_id')
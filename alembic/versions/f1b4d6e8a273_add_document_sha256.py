@@ -0,0 +1,28 @@
+"""Add documents.sha256 for duplicate upload detection
+
+Revision ID: f1b4d6e8a273
+Revises: e7a9c0d3f482
+Create Date: 2026-10-14 10:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1b4d6e8a273'
+down_revision: Union[str, None] = 'e7a9c0d3f482'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('documents', sa.Column('sha256', sa.String(length=64), nullable=True))
+    op.create_index('ix_documents_notebook_id_sha256', 'documents', ['notebook_id', 'sha256'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_documents_notebook_id_sha256', table_name='documents')
+    op.drop_column('documents', 'sha256')
@@ -1,16 +1,26 @@
 """Compatibility endpoints for existing frontend."""
+import re
 from typing import List, Dict, Any
 from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
+from app.api.responses import ORJSONResponse
 from app.database import get_db
-from app.models import User, Document, DocumentStatus
-from app.services.auth_service import get_current_user
+from app.models import Document, DocumentStatus, MessageRole
+from app.services.auth_service import get_current_user_id
+from app.services.rag_service import answer_question, EphemeralMessage
 
 router = APIRouter()
 
+# Canonical hyphenated UUID; ids are checked against this before UUID() so bad
+# client input is rejected without raising and unwinding a ValueError
+_UUID_RE = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+
+# Precomputed status -> wire string, so the per-row loop is a dict lookup
+_STATUS_STR = {s: s.value for s in DocumentStatus}
+
 
 # Legacy schemas for compatibility
 class LegacyDocumentResponse(BaseModel):
@@ -40,82 +50,82 @@ class LegacyChatResponse(BaseModel):
 @router.get("/api/documents", response_model=List[LegacyDocumentResponse])
 def list_documents_legacy(
     notebook_id: str = None,
-    current_user: User = Depends(get_current_user),
+    current_user_id: UUID = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """List documents (legacy endpoint for existing frontend)."""
-    query = db.query(Document).filter(Document.user_id == current_user.id)
+    query = db.query(
+        Document.id,
+        Document.title,
+        Document.original_filename,
+        Document.status,
+        Document.notebook_id,
+        Document.created_at
+    ).filter(Document.user_id == current_user_id)
     
     if notebook_id:
-        try:
-            query = query.filter(Document.notebook_id == UUID(notebook_id))
-        except ValueError:
+        if not _UUID_RE.fullmatch(notebook_id):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Invalid notebook_id format"
             )
+        query = query.filter(Document.notebook_id == UUID(notebook_id))
     
     documents = query.all()
     
     # Transform to legacy format
-    legacy_docs = []
-    for doc in documents:
-        legacy_docs.append(LegacyDocumentResponse(
-            id=str(doc.id),
-            title=doc.title,
-            filename=doc.original_filename,
-            status=doc.status.value,
-            notebook_id=str(doc.notebook_id),
-            uploaded_at=doc.created_at.isoformat()
-        ))
+    legacy_docs = [
+        {
+            'id': doc.id,
+            'title': doc.title,
+            'filename': doc.original_filename,
+            'status': _STATUS_STR[doc.status],
+            'notebook_id': doc.notebook_id,
+            'uploaded_at': doc.created_at.isoformat()
+        }
+        for doc in documents
+    ]
     
-    return legacy_docs
+    return ORJSONResponse(content=legacy_docs)
 
 
 @router.post("/api/chat", response_model=LegacyChatResponse)
 def chat_legacy(
     request: LegacyChatRequest,
-    current_user: User = Depends(get_current_user),
+    current_user_id: UUID = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """Chat endpoint (legacy endpoint for existing frontend)."""
-    from app.services.rag_service import answer_question
-    from app.models import Message, MessageRole
-    
-    try:
-        notebook_id = UUID(request.notebook_id)
-    except ValueError:
+    if not _UUID_RE.fullmatch(request.notebook_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid notebook_id format"
         )
+    notebook_id = UUID(request.notebook_id)
     
     # Convert selected document IDs
     selected_doc_ids = None
     if request.selectedDocumentIds:
-        try:
-            selected_doc_ids = [UUID(doc_id) for doc_id in request.selectedDocumentIds]
-        except ValueError:
+        bad_indexes = [i for i, doc_id in enumerate(request.selectedDocumentIds) if not _UUID_RE.fullmatch(doc_id)]
+        if bad_indexes:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid document ID format"
+                detail=f"Invalid document ID format at index {bad_indexes[0]}"
             )
+        selected_doc_ids = list(map(UUID, request.selectedDocumentIds))
     
-    # Convert history to Message objects (simplified)
-    history_messages = []
-    for hist_msg in request.history:
-        role = MessageRole.USER if hist_msg.get('role') == 'user' else MessageRole.ASSISTANT
-        msg = Message(
-            role=role,
-            content=hist_msg.get('content', ''),
-            user_id=current_user.id,
-            chat_id=None  # Not persisted
+    # Client-supplied history is never persisted, so skip building ORM entities
+    history_messages = [
+        EphemeralMessage(
+            role=MessageRole.USER if hist_msg.get('role') == 'user' else MessageRole.ASSISTANT,
+            content=hist_msg.get('content', '')
         )
-        history_messages.append(msg)
+        for hist_msg in request.history
+    ]
     
     # Call RAG service
     answer, chunks = answer_question(
-        user_id=current_user.id,
+        user_id=current_user_id,
         notebook_id=notebook_id,
         question=request.message,
         history=history_messages,
@@ -134,7 +144,7 @@ def chat_legacy(
             'score': chunk.get('score', 0.0)
         })
     
-    return LegacyChatResponse(
-        answer=answer,
-        sources=sources
-    )
+    return ORJSONResponse(content={
+        'answer': answer,
+        'sources': sources
+    })
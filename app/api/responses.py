@@ -0,0 +1,21 @@
+"""Response classes shared by the API routers."""
+from typing import Any
+
+import orjson
+from fastapi.responses import ORJSONResponse as _ORJSONResponse
+
+
+class ORJSONResponse(_ORJSONResponse):
+    """ORJSONResponse that writes UTC datetimes with a "Z" suffix.
+
+    List endpoints hand rows straight to orjson, while single-object
+    endpoints serialize through their pydantic response model, which writes
+    UTC as "Z". orjson defaults to "+00:00", so without OPT_UTC_Z the same
+    field would be formatted differently depending on the endpoint.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_UTC_Z
+        )
@@ -33,7 +33,6 @@ def signup(user_data: UserCreate, db: Session = Depends(get_db)):
     )
     db.add(new_user)
     db.commit()
-    db.refresh(new_user)
     
     return new_user
 
@@ -1,33 +1,103 @@
 """Chat and message endpoints."""
-from typing import List
+import logging
+from typing import Any, Dict, List, Tuple
 from uuid import UUID
+import orjson
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import bindparam, select
 from sqlalchemy.orm import Session
 
-from app.database import get_db
-from app.models import User, Notebook, Chat, Message, MessageRole, Citation, Document
+from app.api.responses import ORJSONResponse
+from app.database import SessionLocal, get_db
+from app.models import Notebook, Chat, Message, MessageRole, Citation, Document
 from app.schemas.chat import ChatCreate, ChatResponse, MessageCreate, MessageResponse
-from app.services.auth_service import get_current_user
-from app.services.rag_service import answer_question
+from app.services.auth_service import get_current_user_id
+from app.services.rag_service import PreparedAnswer, answer_question, astream_answer, prepare_answer
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
+# Columns serialized by MessageResponse, selected as plain tuples for list endpoints
+MESSAGE_RESPONSE_COLUMNS = (
+    Message.id,
+    Message.chat_id,
+    Message.user_id,
+    Message.role,
+    Message.content,
+    Message.metadata_,
+    Message.created_at,
+    Message.updated_at,
+)
+
+# Hot statements are built once at import time; only their bind values change
+# per request, so SQLAlchemy reuses the cached compiled SQL every time.
+NOTEBOOK_OWNED_STMT = select(Notebook.id).where(
+    Notebook.id == bindparam("notebook_id"),
+    Notebook.user_id == bindparam("user_id")
+)
+
+CHAT_OWNED_STMT = select(Chat.id).where(
+    Chat.id == bindparam("chat_id"),
+    Chat.user_id == bindparam("user_id")
+)
+
+LIST_CHATS_STMT = select(
+    Chat.id,
+    Chat.notebook_id,
+    Chat.user_id,
+    Chat.title,
+    Chat.created_at,
+    Chat.updated_at
+).join(Notebook, Notebook.id == Chat.notebook_id).where(
+    Notebook.id == bindparam("notebook_id"),
+    Notebook.user_id == bindparam("user_id")
+)
+
+LIST_MESSAGES_STMT = select(*MESSAGE_RESPONSE_COLUMNS).join(Chat, Chat.id == Message.chat_id).where(
+    Chat.id == bindparam("chat_id"),
+    Chat.user_id == bindparam("user_id")
+).order_by(Message.created_at)
+
+CHAT_HISTORY_STMT = select(Message).where(
+    Message.chat_id == bindparam("chat_id"),
+    Message.id != bindparam("exclude_message_id")
+).order_by(Message.created_at)
+
+EXISTING_DOCUMENT_IDS_STMT = select(Document.id).where(
+    Document.id.in_(bindparam("document_ids", expanding=True))
+)
+
+
+def message_to_dict(message) -> dict:
+    """Convert a Message (or MESSAGE_RESPONSE_COLUMNS row) into a MessageResponse-shaped dict."""
+    return {
+        "role": message.role,
+        "content": message.content,
+        "metadata": message.metadata_,
+        "id": message.id,
+        "chat_id": message.chat_id,
+        "user_id": message.user_id,
+        "created_at": message.created_at,
+        "updated_at": message.updated_at,
+    }
+
+
 @router.post("/notebooks/{notebook_id}/chats", response_model=ChatResponse, status_code=status.HTTP_201_CREATED)
 def create_chat(
     notebook_id: UUID,
     chat_data: ChatCreate,
-    current_user: User = Depends(get_current_user),
+    current_user_id: UUID = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """Create a new chat in a notebook."""
     # Verify notebook ownership
-    notebook = db.query(Notebook).filter(
-        Notebook.id == notebook_id,
-        Notebook.user_id == current_user.id
-    ).first()
+    notebook = db.get(Notebook, notebook_id)
     
-    if not notebook:
+    if not notebook or notebook.user_id != current_user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Notebook not found"
@@ -35,12 +105,11 @@ def create_chat(
     
     new_chat = Chat(
         notebook_id=notebook_id,
-        user_id=current_user.id,
+        user_id=current_user_id,
         title=chat_data.title
     )
     db.add(new_chat)
     db.commit()
-    db.refresh(new_chat)
     
     return new_chat
 
@@ -48,39 +117,36 @@ def create_chat(
 @router.get("/notebooks/{notebook_id}/chats", response_model=List[ChatResponse])
 def list_chats(
     notebook_id: UUID,
-    current_user: User = Depends(get_current_user),
+    current_user_id: UUID = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """List all chats in a notebook."""
-    # Verify notebook ownership
-    notebook = db.query(Notebook).filter(
-        Notebook.id == notebook_id,
-        Notebook.user_id == current_user.id
-    ).first()
+    # Fetch chats with notebook ownership enforced in the same statement
+    params = {"notebook_id": notebook_id, "user_id": current_user_id}
+    chats = db.execute(LIST_CHATS_STMT, params).all()
     
-    if not notebook:
+    # An empty result is either an empty notebook or one the user can't see
+    if not chats and not db.execute(NOTEBOOK_OWNED_STMT, params).first():
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Notebook not found"
         )
     
-    chats = db.query(Chat).filter(Chat.notebook_id == notebook_id).all()
-    return chats
+    # Rows come straight from the DB and were validated at write time, so
+    # return them as a ready response instead of re-validating each one
+    return ORJSONResponse(content=[chat._asdict() for chat in chats])
 
 
 @router.get("/chats/{chat_id}", response_model=ChatResponse)
 def get_chat(
     chat_id: UUID,
-    current_user: User = Depends(get_current_user),
+    current_user_id: UUID = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """Get a specific chat."""
-    chat = db.query(Chat).filter(
-        Chat.id == chat_id,
-        Chat.user_id == current_user.id
-    ).first()
+    chat = db.get(Chat, chat_id)
     
-    if not chat:
+    if not chat or chat.user_id != current_user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Chat not found"
@@ -92,72 +158,138 @@ def get_chat(
 @router.get("/chats/{chat_id}/messages", response_model=List[MessageResponse])
 def list_messages(
     chat_id: UUID,
-    current_user: User = Depends(get_current_user),
+    current_user_id: UUID = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """List all messages in a chat."""
-    # Verify chat ownership
-    chat = db.query(Chat).filter(
-        Chat.id == chat_id,
-        Chat.user_id == current_user.id
-    ).first()
+    # Fetch messages with chat ownership enforced in the same statement
+    params = {"chat_id": chat_id, "user_id": current_user_id}
+    messages = db.execute(LIST_MESSAGES_STMT, params).all()
     
-    if not chat:
+    # An empty result is either an empty chat or one the user can't see
+    if not messages and not db.execute(CHAT_OWNED_STMT, params).first():
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Chat not found"
         )
     
-    messages = db.query(Message).filter(Message.chat_id == chat_id).order_by(Message.created_at).all()
-    return messages
+    return ORJSONResponse(content=[message_to_dict(message) for message in messages])
+
+
+def _save_user_message(db: Session, chat_id: UUID, user_id: UUID, message_data: MessageCreate) -> Tuple[Chat, List[Message]]:
+    """Store the user's message and load the chat history before it.
+    
+    Returns:
+        Tuple of (chat, history excluding the new message)
+    """
+    # Verify chat ownership and get notebook
+    chat = db.get(Chat, chat_id)
+    
+    if not chat or chat.user_id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Chat not found"
+        )
+    
+    # Create user message
+    user_message = Message(
+        chat_id=chat_id,
+        user_id=user_id,
+        role=MessageRole.USER,
+        content=message_data.content,
+        metadata_={"selected_document_ids": list(map(str, message_data.selected_document_ids))} if message_data.selected_document_ids else None
+    )
+    db.add(user_message)
+    db.commit()
+    
+    # Get chat history (exclude current message)
+    history = db.execute(
+        CHAT_HISTORY_STMT,
+        {"chat_id": chat_id, "exclude_message_id": user_message.id}
+    ).scalars().all()
+    
+    return chat, history
+
+
+def _save_assistant_message(
+    db: Session,
+    chat_id: UUID,
+    user_id: UUID,
+    answer: Any,
+    retrieved_chunks: List[Dict[str, Any]]
+) -> Message:
+    """Store the assistant's answer and its citations."""
+    # Ensure answer is a string
+    if isinstance(answer, (list, dict)):
+        answer = orjson.dumps(answer, option=orjson.OPT_NON_STR_KEYS).decode()
+        
+    # Create assistant message
+    assistant_message = Message(
+        chat_id=chat_id,
+        user_id=user_id,
+        role=MessageRole.ASSISTANT,
+        content=str(answer),
+        metadata_={"model": "gemini", "chunks_retrieved": len(retrieved_chunks)}
+    )
+    db.add(assistant_message)
+    db.commit()
+    
+    # Store citations
+    # Resolve all referenced document IDs first so existence is checked in one query
+    chunk_doc_ids = []
+    for chunk in retrieved_chunks:
+        doc_id_str = chunk.get('metadata', {}).get('document_id')
+        doc_id = None
+        if doc_id_str:
+            try:
+                doc_id = UUID(doc_id_str)
+            except (ValueError, TypeError, AttributeError) as e:
+                # Log error but don't fail the request
+                logger.error(f"Error creating citation: {e}")
+        chunk_doc_ids.append(doc_id)
+    
+    ids = {doc_id for doc_id in chunk_doc_ids if doc_id}
+    existing = set()
+    if ids:
+        existing = set(db.execute(EXISTING_DOCUMENT_IDS_STMT, {"document_ids": list(ids)}).scalars())
+    
+    citations = [
+        Citation(
+            message_id=assistant_message.id,
+            document_id=doc_id,
+            source_chunk_id=chunk.get('chunk_id', 'unknown'),
+            snippet=chunk.get('content', '')[:500],  # Limit snippet length
+            location=chunk.get('location', {})
+        )
+        for chunk, doc_id in zip(retrieved_chunks, chunk_doc_ids)
+        if doc_id in existing
+    ]
+    if citations:
+        db.bulk_save_objects(citations)
+    
+    db.commit()
+    return assistant_message
+
+
+def _sse(event: str, data: Any) -> bytes:
+    """Encode one server-sent event."""
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data, option=orjson.OPT_UTC_Z) + b"\n\n"
 
 
 @router.post("/chats/{chat_id}/messages", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
 def send_message(
     chat_id: UUID,
     message_data: MessageCreate,
-    current_user: User = Depends(get_current_user),
+    current_user_id: UUID = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """Send a message in a chat and get AI response."""
-    import logging
-    import traceback
-    logger = logging.getLogger(__name__)
-    
     try:
-        # Verify chat ownership and get notebook
-        chat = db.query(Chat).filter(
-            Chat.id == chat_id,
-            Chat.user_id == current_user.id
-        ).first()
-        
-        if not chat:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Chat not found"
-            )
-        
-        # Create user message
-        user_message = Message(
-            chat_id=chat_id,
-            user_id=current_user.id,
-            role=MessageRole.USER,
-            content=message_data.content,
-            metadata_={"selected_document_ids": [str(doc_id) for doc_id in message_data.selected_document_ids]} if message_data.selected_document_ids else None
-        )
-        db.add(user_message)
-        db.commit()
-        db.refresh(user_message)
-        
-        # Get chat history (exclude current message)
-        history = db.query(Message).filter(
-            Message.chat_id == chat_id,
-            Message.id != user_message.id
-        ).order_by(Message.created_at).all()
+        chat, history = _save_user_message(db, chat_id, current_user_id, message_data)
         
         # Call RAG service
         answer, retrieved_chunks = answer_question(
-            user_id=current_user.id,
+            user_id=current_user_id,
             notebook_id=chat.notebook_id,
             question=message_data.content,
             history=history,
@@ -165,57 +297,73 @@ def send_message(
             mode=message_data.mode
         )
         
-        # Ensure answer is a string
-        if isinstance(answer, (list, dict)):
-            import json
-            answer = json.dumps(answer)
-            
-        # Create assistant message
-        assistant_message = Message(
-            chat_id=chat_id,
-            user_id=current_user.id,
-            role=MessageRole.ASSISTANT,
-            content=str(answer),
-            metadata_={"model": "gemini", "chunks_retrieved": len(retrieved_chunks)}
-        )
-        db.add(assistant_message)
-        db.commit()
-        db.refresh(assistant_message)
-        
-        # Store citations
-        for chunk in retrieved_chunks:
-            metadata = chunk.get('metadata', {})
-            doc_id_str = metadata.get('document_id')
-            
-            if doc_id_str:
-                try:
-                    # Find document in database
-                    document = db.query(Document).filter(
-                        Document.id == UUID(doc_id_str)
-                    ).first()
-                    
-                    if document:
-                        citation = Citation(
-                            message_id=assistant_message.id,
-                            document_id=document.id,
-                            source_chunk_id=chunk.get('chunk_id', 'unknown'),
-                            snippet=chunk.get('content', '')[:500],  # Limit snippet length
-                            location=chunk.get('location', {})
-                        )
-                        db.add(citation)
-                except Exception as e:
-                    # Log error but don't fail the request
-                    import logging
-                    logging.error(f"Error creating citation: {e}")
-        
-        db.commit()
+        assistant_message = _save_assistant_message(db, chat_id, current_user_id, answer, retrieved_chunks)
         
-        return assistant_message
+        return ORJSONResponse(
+            content=message_to_dict(assistant_message),
+            status_code=status.HTTP_201_CREATED
+        )
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error in send_message: {e}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error in send_message")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
         )
 
+
+@router.post("/chats/{chat_id}/messages/stream")
+def stream_message(
+    chat_id: UUID,
+    message_data: MessageCreate,
+    current_user_id: UUID = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """Send a message in a chat and stream the AI response as server-sent events.
+    
+    Emits "delta" events ({"text": ...}) as Gemini generates the answer, then
+    a "message" event with the stored assistant message (MessageResponse).
+    If generation fails midway, an "error" event precedes the message.
+    """
+    chat, history = _save_user_message(db, chat_id, current_user_id, message_data)
+    
+    # Retrieval happens up front, so citations are known before the first token
+    try:
+        prepared = prepare_answer(
+            user_id=current_user_id,
+            notebook_id=chat.notebook_id,
+            question=message_data.content,
+            history=history,
+            selected_document_ids=message_data.selected_document_ids,
+            mode=message_data.mode
+        )
+    except Exception as e:
+        logger.error(f"Error preparing answer: {e}")
+        prepared = PreparedAnswer(answer=f"I encountered an error while processing your question: {str(e)}")
+    
+    def save_answer(answer: str) -> Dict[str, Any]:
+        # The request's session may already be closed while the body streams
+        stream_db = SessionLocal()
+        try:
+            assistant_message = _save_assistant_message(
+                stream_db, chat_id, current_user_id, answer, prepared.chunks
+            )
+            return message_to_dict(assistant_message)
+        finally:
+            stream_db.close()
+    
+    async def events():
+        parts = []
+        try:
+            async for text in astream_answer(prepared):
+                parts.append(text)
+                yield _sse("delta", {"text": text})
+        except Exception as e:
+            logger.error(f"Error streaming answer: {e}")
+            parts = [f"I encountered an error while processing your question: {str(e)}"]
+            yield _sse("error", {"detail": str(e)})
+        
+        yield _sse("message", await run_in_threadpool(save_answer, "".join(parts)))
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -1,89 +1,106 @@
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload, raiseload, selectinload
 from typing import List
 from uuid import UUID
 
+from app.config import settings
 from app.database import get_db
-from app.api.v1.auth import get_current_user
-from app.models import User, DiscoveryQuestionSet, DiscoveryQuestion, Notebook, Document
+from app.services.auth_service import get_current_user_id
+from app.models import DiscoveryQuestionSet, DiscoveryQuestion, Notebook, Document
 from app.schemas.discovery import DiscoveryQuestionSetCreate, DiscoveryQuestionSet as DiscoveryQuestionSetSchema, DiscoveryQuestionUpdate, DiscoveryQuestion as DiscoveryQuestionSchema
 from app.services.discovery_service import generate_discovery_questions_task
 
 router = APIRouter()
 
+
+def _populate_related_document_titles(db: Session, questions: List[DiscoveryQuestion]) -> None:
+    """Attach related document titles to questions using a single IN query."""
+    doc_ids = {q.related_document_id for q in questions if q.related_document_id}
+    if not doc_ids:
+        return
+
+    rows = db.query(Document.id, Document.title).filter(Document.id.in_(doc_ids)).all()
+    title_map = dict(rows)
+    for q in questions:
+        if q.related_document_id:
+            q.related_document_title = title_map.get(q.related_document_id)
+
 @router.post("/notebooks/{notebook_id}/discovery-question-sets", response_model=DiscoveryQuestionSetSchema, status_code=status.HTTP_201_CREATED)
 def create_discovery_question_set(
     notebook_id: UUID,
     set_data: DiscoveryQuestionSetCreate,
     background_tasks: BackgroundTasks,
-    current_user: User = Depends(get_current_user),
+    current_user_id: UUID = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """Create a new discovery question set and start generation in background."""
-    notebook = db.query(Notebook).filter(Notebook.id == notebook_id, Notebook.user_id == current_user.id).first()
-    if not notebook:
+    notebook = db.get(Notebook, notebook_id)
+    if not notebook or notebook.user_id != current_user_id:
         raise HTTPException(status_code=404, detail="Notebook not found")
 
     new_set = DiscoveryQuestionSet(
         notebook_id=notebook_id,
-        created_by_user_id=current_user.id,
+        created_by_user_id=current_user_id,
         title=set_data.title,
         target_audience=set_data.target_audience,
         scope_type=set_data.scope_type,
-        scope_document_ids=set_data.scope_document_ids
+        scope_document_ids=set_data.scope_document_ids,
+        # A new set has no questions yet; an empty collection skips the lazy load on serialization
+        questions=[]
     )
     db.add(new_set)
     db.commit()
-    db.refresh(new_set)
 
     # Trigger background task
-    background_tasks.add_task(generate_discovery_questions_task, new_set.id)
+    if settings.CELERY_BROKER_URL:
+        from app.worker import generate_discovery_questions
+        generate_discovery_questions.delay(str(new_set.id))
+    else:
+        background_tasks.add_task(generate_discovery_questions_task, new_set.id)
 
     return new_set
 
 @router.get("/notebooks/{notebook_id}/discovery-question-sets", response_model=List[DiscoveryQuestionSetSchema])
 def list_discovery_question_sets(
     notebook_id: UUID,
-    current_user: User = Depends(get_current_user),
+    current_user_id: UUID = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """List all discovery question sets for a notebook."""
-    notebook = db.query(Notebook).filter(Notebook.id == notebook_id, Notebook.user_id == current_user.id).first()
-    if not notebook:
+    sets = db.query(DiscoveryQuestionSet).options(
+        selectinload(DiscoveryQuestionSet.questions),
+        raiseload('*')
+    ).join(Notebook, Notebook.id == DiscoveryQuestionSet.notebook_id).filter(
+        Notebook.id == notebook_id,
+        Notebook.user_id == current_user_id
+    ).order_by(DiscoveryQuestionSet.created_at.desc()).all()
+    if not sets and not db.query(Notebook.id).filter(Notebook.id == notebook_id, Notebook.user_id == current_user_id).first():
         raise HTTPException(status_code=404, detail="Notebook not found")
-
-    sets = db.query(DiscoveryQuestionSet).filter(DiscoveryQuestionSet.notebook_id == notebook_id).order_by(DiscoveryQuestionSet.created_at.desc()).all()
     
     # Populate document titles for all questions in all sets
-    for s in sets:
-        for q in s.questions:
-            if q.related_document_id:
-                doc = db.query(Document).filter(Document.id == q.related_document_id).first()
-                if doc:
-                    q.related_document_title = doc.title
+    _populate_related_document_titles(db, [q for s in sets for q in s.questions])
     
     return sets
 
 @router.get("/discovery-question-sets/{set_id}", response_model=DiscoveryQuestionSetSchema)
 def get_discovery_question_set(
     set_id: UUID,
-    current_user: User = Depends(get_current_user),
+    current_user_id: UUID = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """Get a specific discovery question set."""
-    q_set = db.query(DiscoveryQuestionSet).filter(DiscoveryQuestionSet.id == set_id).first()
+    q_set = db.query(DiscoveryQuestionSet).options(
+        selectinload(DiscoveryQuestionSet.questions),
+        raiseload('*')
+    ).filter(DiscoveryQuestionSet.id == set_id).first()
     if not q_set:
         raise HTTPException(status_code=404, detail="Discovery question set not found")
     
-    if q_set.created_by_user_id != current_user.id:
+    if q_set.created_by_user_id != current_user_id:
         raise HTTPException(status_code=403, detail="Not authorized to access this discovery question set")
 
     # Populate document titles for all questions
-    for q in q_set.questions:
-        if q.related_document_id:
-            doc = db.query(Document).filter(Document.id == q.related_document_id).first()
-            if doc:
-                q.related_document_title = doc.title
+    _populate_related_document_titles(db, q_set.questions)
 
     return q_set
 
@@ -91,25 +108,26 @@ def get_discovery_question_set(
 def update_discovery_question(
     question_id: UUID,
     update_data: DiscoveryQuestionUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user_id: UUID = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """Update a discovery question status."""
-    question = db.query(DiscoveryQuestion).join(DiscoveryQuestionSet).filter(DiscoveryQuestion.id == question_id).first()
+    # Owner check and related title come from one joined query
+    question = db.query(DiscoveryQuestion).options(
+        joinedload(DiscoveryQuestion.question_set).load_only(DiscoveryQuestionSet.created_by_user_id),
+        joinedload(DiscoveryQuestion.related_document).load_only(Document.title)
+    ).filter(DiscoveryQuestion.id == question_id).first()
     if not question:
         raise HTTPException(status_code=404, detail="Discovery question not found")
     
-    if question.question_set.created_by_user_id != current_user.id:
+    if question.question_set.created_by_user_id != current_user_id:
         raise HTTPException(status_code=403, detail="Not authorized to update this discovery question")
 
     question.status = update_data.status
     db.commit()
-    db.refresh(question)
     
     # Populate document title if available
-    if question.related_document_id:
-        doc = db.query(Document).filter(Document.id == question.related_document_id).first()
-        if doc:
-            question.related_document_title = doc.title
+    if question.related_document:
+        question.related_document_title = question.related_document.title
     
     return question
@@ -1,199 +1,401 @@
 """Document endpoints."""
-from typing import List
+import functools
+import hashlib
+import io
+import logging
+import mimetypes
+import os
+from pathlib import Path
+from typing import BinaryIO, List, Optional
 from uuid import UUID, uuid4
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Response, status, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.database import get_db
-from app.models import User, Notebook, Document, DocumentStatus
-from app.schemas.document import DocumentResponse
-from app.services.auth_service import get_current_user
-from app.services.s3_client import upload_file_to_s3, delete_file_from_s3
-from app.services.ingestion import trigger_ingestion
+from app.api.responses import ORJSONResponse
+from app.database import get_async_db, get_db
+from app.models import Notebook, Document, DocumentStatus
+from app.schemas.document import DocumentResponse, DocumentUploadInitiate, DocumentUploadInitiateResponse
+from app.services.auth_service import get_current_user_id
+from app.services.s3_client import delete_files_from_s3, generate_presigned_upload_url, s3_object_exists
+from app.services.pptx_converter import convert_pptx_to_pdf
+from app.services.ingestion import pptx_conversion_queued, submit_document_upload, submit_pptx_conversion
+from app.services.semantic_cache import invalidate_notebook
 from app.config import settings
 from app.services.bedrock_client import start_ingestion_job
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+# Read size when hashing uploads
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Lifetime of presigned direct-upload URLs
+PRESIGNED_UPLOAD_EXPIRES_IN = 900
+
+# Content-Type sent to S3 (and so to Bedrock) per file extension. Anything
+# not listed falls back to the stdlib mimetypes table, then to the client's type.
+MIME_TYPES = {
+    '.pdf': 'application/pdf',
+    '.txt': 'text/plain',
+    '.md': 'text/markdown',
+    '.html': 'text/html',
+    '.doc': 'application/msword',
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.csv': 'text/csv',
+    '.xls': 'application/vnd.ms-excel',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.ppt': 'application/vnd.ms-powerpoint',
+    '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+}
+
+mimetypes.init()
+
+# Columns serialized by DocumentResponse, selected as plain tuples for list endpoints
+DOCUMENT_RESPONSE_COLUMNS = (
+    Document.id,
+    Document.notebook_id,
+    Document.user_id,
+    Document.title,
+    Document.original_filename,
+    Document.s3_key,
+    Document.status,
+    Document.error_message,
+    Document.created_at,
+    Document.updated_at,
+)
+
+# Built once at import time so every request reuses the cached compiled SQL
+NOTEBOOK_OWNED_STMT = select(Notebook.id).where(
+    Notebook.id == bindparam("notebook_id"),
+    Notebook.user_id == bindparam("user_id")
+)
+
+LIST_DOCUMENTS_STMT = select(*DOCUMENT_RESPONSE_COLUMNS).join(Notebook, Notebook.id == Document.notebook_id).where(
+    Notebook.id == bindparam("notebook_id"),
+    Notebook.user_id == bindparam("user_id")
+)
+
+# Non-failed document in a notebook with the same content hash
+DUPLICATE_DOCUMENT_STMT = select(Document).where(
+    Document.notebook_id == bindparam("notebook_id"),
+    Document.sha256 == bindparam("sha256"),
+    Document.status != DocumentStatus.ERROR
+).limit(1)
+
+
+def build_document_s3_key(user_id: UUID, notebook_id: UUID, document_id: UUID, filename: str) -> str:
+    """Build the S3 key for a document, prefixed with its ID for uniqueness (flattened structure)."""
+    return f"users/{user_id}/notebooks/{notebook_id}/{document_id}_{filename}"
+
+
+def resolve_content_type(filename: str, file_ext: str, fallback: Optional[str]) -> Optional[str]:
+    """Pick the Content-Type for an upload from its extension."""
+    return MIME_TYPES.get(file_ext) or mimetypes.guess_type(filename)[0] or fallback
+
+
+def take_upload_file(file: UploadFile) -> BinaryIO:
+    """Take ownership of an UploadFile's spooled temp file, rewound.
+    
+    Starlette closes the request's files once the response is sent, but the
+    ingestion worker reads the upload later. Swapping in an empty placeholder
+    hands the original file over instead of copying it.
+    """
+    fileobj = file.file
+    file.file = io.BytesIO()
+    fileobj.seek(0)
+    return fileobj
+
+
+def hash_file(fileobj: BinaryIO) -> str:
+    """Return the SHA-256 hex digest of a file, read in chunks and left rewound."""
+    digest = hashlib.sha256()
+    for chunk in iter(functools.partial(fileobj.read, UPLOAD_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def document_row_to_dict(row) -> dict:
+    """Convert a DOCUMENT_RESPONSE_COLUMNS row into a DocumentResponse-shaped dict."""
+    return {
+        "title": row.title,
+        "id": row.id,
+        "notebook_id": row.notebook_id,
+        "user_id": row.user_id,
+        "original_filename": row.original_filename,
+        "s3_key": row.s3_key,
+        "status": row.status,
+        "error_message": row.error_message,
+        "created_at": row.created_at,
+        "updated_at": row.updated_at,
+    }
+
 
 @router.get("/notebooks/{notebook_id}/documents", response_model=List[DocumentResponse])
-def list_documents(
+async def list_documents(
     notebook_id: UUID,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user_id: UUID = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """List all documents in a notebook."""
-    # Verify notebook ownership
-    notebook = db.query(Notebook).filter(
-        Notebook.id == notebook_id,
-        Notebook.user_id == current_user.id
-    ).first()
+    # Fetch documents with notebook ownership enforced in the same statement
+    params = {"notebook_id": notebook_id, "user_id": current_user_id}
+    rows = (await db.execute(LIST_DOCUMENTS_STMT, params)).all()
     
-    if not notebook:
+    # An empty result is either an empty notebook or one the user can't see
+    if not rows and not (await db.execute(NOTEBOOK_OWNED_STMT, params)).first():
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Notebook not found"
         )
     
-    documents = db.query(Document).filter(Document.notebook_id == notebook_id).all()
-    return documents
+    return ORJSONResponse(content=[document_row_to_dict(row) for row in rows])
 
 
 @router.post("/notebooks/{notebook_id}/documents", response_model=DocumentResponse, status_code=status.HTTP_201_CREATED)
-async def upload_document(
+def upload_document(
     notebook_id: UUID,
+    response: Response,
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
+    current_user_id: UUID = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    """Upload a document to a notebook."""
+    """Upload a document to a notebook.
+    
+    Re-uploading content already in the notebook returns the existing
+    document (200) instead of storing and ingesting it again.
+    """
     # Verify notebook ownership
-    notebook = db.query(Notebook).filter(
-        Notebook.id == notebook_id,
-        Notebook.user_id == current_user.id
-    ).first()
+    notebook_exists = db.execute(
+        NOTEBOOK_OWNED_STMT,
+        {"notebook_id": notebook_id, "user_id": current_user_id}
+    ).scalar()
     
-    if not notebook:
+    if not notebook_exists:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Notebook not found"
         )
     
-    import logging
-    logger = logging.getLogger(__name__)
-    
     # Generate unique document ID first
     document_id = uuid4()
     
     # Generate S3 key using document ID and original filename
-    import os
     safe_filename = os.path.basename(file.filename)
-    # Prefix filename with document_id to ensure uniqueness (flattened structure)
-    unique_filename = f"{document_id}_{safe_filename}"
-    s3_key = f"users/{current_user.id}/notebooks/{notebook_id}/{unique_filename}"
+    s3_key = build_document_s3_key(current_user_id, notebook_id, document_id, safe_filename)
     
     logger.info(f"Processing upload for file: {safe_filename}")
     logger.info(f"Generated S3 key: {s3_key}")
     
     # Determine correct Content-Type for Bedrock
-    MIME_TYPES = {
-        '.pdf': 'application/pdf',
-        '.txt': 'text/plain',
-        '.md': 'text/markdown',
-        '.html': 'text/html',
-        '.doc': 'application/msword',
-        '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-        '.csv': 'text/csv',
-        '.xls': 'application/vnd.ms-excel',
-        '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        '.ppt': 'application/vnd.ms-powerpoint',
-        '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
-    }
-    
     file_ext = os.path.splitext(safe_filename)[1].lower()
-    content_type = MIME_TYPES.get(file_ext, file.content_type)
+    content_type = resolve_content_type(safe_filename, file_ext, file.content_type)
     
     logger.info(f"Detected extension: {file_ext}")
     logger.info(f"Resolved Content-Type: {content_type}")
     
-    # Read file content
-    file_content = await file.read()
-    logger.info(f"File size: {len(file_content)} bytes")
+    # Stream the upload's own spooled file (already on disk past 1MB) through
+    # the hash and on to the worker; the body is never read into memory
+    file_content = take_upload_file(file)
+    content_sha256 = hash_file(file_content)
+    logger.info(f"File size: {file.size} bytes, SHA-256: {content_sha256}")
     
-    # Convert PPTX to PDF if needed (Bedrock doesn't support PPTX)
-    if file_ext == '.pptx':
+    existing_document = db.execute(
+        DUPLICATE_DOCUMENT_STMT,
+        {"notebook_id": notebook_id, "sha256": content_sha256}
+    ).scalars().first()
+    if existing_document:
+        logger.info(f"Duplicate upload, reusing document {existing_document.id}")
+        file_content.close()
+        response.status_code = status.HTTP_200_OK
+        return existing_document
+    
+    # Bedrock doesn't support PPTX, so the document is stored as a PDF;
+    # with Celery the conversion itself happens on a worker
+    pptx_queued = file_ext == '.pptx' and pptx_conversion_queued()
+    if pptx_queued:
+        s3_key = build_document_s3_key(current_user_id, notebook_id, document_id, Path(safe_filename).stem + ".pdf")
+    elif file_ext == '.pptx':
         logger.info("PPTX file detected, converting to PDF...")
         try:
-            from app.services.pptx_converter import convert_pptx_to_pdf
-            pdf_content, pdf_filename = convert_pptx_to_pdf(file_content, safe_filename)
-            
-            # Update variables for PDF
-            file_content = pdf_content
-            safe_filename = pdf_filename
-            file_ext = '.pdf'
-            content_type = 'application/pdf'
-            
-            # Update S3 key to use PDF extension (flattened structure)
-            unique_filename = f"{document_id}_{pdf_filename}"
-            s3_key = f"users/{current_user.id}/notebooks/{notebook_id}/{unique_filename}"
-            
-            logger.info(f"Converted to PDF: {safe_filename} ({len(file_content)} bytes)")
+            pdf_file, pdf_filename = convert_pptx_to_pdf(file_content, safe_filename)
         except Exception as e:
             logger.error(f"Failed to convert PPTX to PDF: {e}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Failed to convert PPTX to PDF: {str(e)}"
             )
+        finally:
+            file_content.close()
+        
+        # Update variables for PDF
+        file_content = pdf_file
+        safe_filename = pdf_filename
+        file_ext = '.pdf'
+        content_type = 'application/pdf'
+        
+        # Update S3 key to use PDF extension
+        s3_key = build_document_s3_key(current_user_id, notebook_id, document_id, pdf_filename)
+        
+        logger.info(f"Converted to PDF: {safe_filename}")
     
-    
-    # Upload to S3
-    upload_success = upload_file_to_s3(
-        file_content=file_content,
+    # Create document record
+    new_document = Document(
+        id=document_id, # Use the pre-generated ID
+        notebook_id=notebook_id,
+        user_id=current_user_id,
+        title=file.filename,
+        original_filename=file.filename,
         s3_key=s3_key,
-        content_type=content_type
+        sha256=content_sha256,
+        status=DocumentStatus.PENDING
     )
+    db.add(new_document)
+    db.commit()
+    invalidate_notebook(notebook_id)
     
-    logger.info(f"S3 Upload Success: {upload_success}")
+    # Hand the S3 upload and ingestion off to the background workers
+    if pptx_queued:
+        submit_pptx_conversion(new_document, db, file_content)
+    else:
+        submit_document_upload(new_document, db, file_content, content_type)
     
-    if not upload_success:
-        logger.error("Upload failed.")
+    return new_document
+
+
+@router.post(
+    "/notebooks/{notebook_id}/documents/initiate",
+    response_model=DocumentUploadInitiateResponse,
+    status_code=status.HTTP_201_CREATED
+)
+def initiate_document_upload(
+    notebook_id: UUID,
+    upload_data: DocumentUploadInitiate,
+    current_user_id: UUID = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """Start a direct-to-S3 upload and return a presigned PUT URL.
+    
+    The file body never passes through the API; the client PUTs it to S3 and
+    then calls POST /documents/{document_id}/complete.
+    """
+    notebook_exists = db.execute(
+        NOTEBOOK_OWNED_STMT,
+        {"notebook_id": notebook_id, "user_id": current_user_id}
+    ).scalar()
+    
+    if not notebook_exists:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to upload file to S3"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Notebook not found"
+        )
+    
+    safe_filename = os.path.basename(upload_data.filename)
+    file_ext = os.path.splitext(safe_filename)[1].lower()
+    
+    # PPTX has to be converted to PDF server-side before Bedrock can ingest it
+    if file_ext == '.pptx':
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="PPTX files must be uploaded via POST /notebooks/{notebook_id}/documents"
+        )
+    
+    document_id = uuid4()
+    s3_key = build_document_s3_key(current_user_id, notebook_id, document_id, safe_filename)
+    content_type = resolve_content_type(safe_filename, file_ext, upload_data.content_type)
+    
+    upload_url = generate_presigned_upload_url(
+        s3_key,
+        content_type=content_type,
+        expires_in=PRESIGNED_UPLOAD_EXPIRES_IN
+    )
+    if not upload_url:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Direct uploads are not available"
         )
     
-    # Create document record
     new_document = Document(
-        id=document_id, # Use the pre-generated ID
+        id=document_id,
         notebook_id=notebook_id,
-        user_id=current_user.id,
-        title=file.filename,
-        original_filename=file.filename,
+        user_id=current_user_id,
+        title=upload_data.filename,
+        original_filename=upload_data.filename,
         s3_key=s3_key,
         status=DocumentStatus.PENDING
     )
     db.add(new_document)
     db.commit()
-    db.refresh(new_document)
-    
-    # Upload metadata file to S3 for Bedrock KB filtering
-    import json
-    metadata = {
-        "metadataAttributes": {
-            "user_id": str(current_user.id),
-            "notebook_id": str(notebook_id),
-            "document_id": str(new_document.id),
-            "filename": file.filename
-        }
-    }
     
-    metadata_key = f"{s3_key}.metadata.json"
-    upload_file_to_s3(
-        file_content=json.dumps(metadata).encode('utf-8'),
-        s3_key=metadata_key,
-        content_type='application/json'
+    return DocumentUploadInitiateResponse(
+        document_id=document_id,
+        upload_url=upload_url,
+        content_type=content_type,
+        expires_in=PRESIGNED_UPLOAD_EXPIRES_IN
     )
+
+
+@router.post("/documents/{document_id}/complete", response_model=DocumentResponse)
+def complete_document_upload(
+    document_id: UUID,
+    current_user_id: UUID = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """Finish a direct-to-S3 upload and queue the document for ingestion."""
+    document = db.get(Document, document_id)
     
-    # Trigger ingestion job in background
-    import asyncio
-    asyncio.create_task(trigger_ingestion(new_document, db))
+    if not document or document.user_id != current_user_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
     
-    return new_document
+    upload_completed = HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Document upload already completed"
+    )
+    if document.status != DocumentStatus.PENDING:
+        raise upload_completed
+    
+    if not s3_object_exists(document.s3_key):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Uploaded file not found in S3"
+        )
+    
+    # Claim the document in one conditional UPDATE, so a retried or
+    # concurrent /complete can't queue it a second time
+    claimed = db.execute(
+        update(Document)
+        .where(Document.id == document_id, Document.status == DocumentStatus.PENDING)
+        .values(status=DocumentStatus.INGESTING, error_message=None)
+    ).rowcount
+    db.commit()
+    if not claimed:
+        raise upload_completed
+    
+    # The object is already in S3, so the worker only writes the KB metadata
+    # sidecar and triggers ingestion
+    invalidate_notebook(document.notebook_id)
+    submit_document_upload(document, db, None, None)
+    
+    return document
 
 
 @router.get("/documents/{document_id}", response_model=DocumentResponse)
-def get_document(
+async def get_document(
     document_id: UUID,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user_id: UUID = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get a specific document."""
-    document = db.query(Document).filter(
-        Document.id == document_id,
-        Document.user_id == current_user.id
-    ).first()
+    document = await db.get(Document, document_id)
     
-    if not document:
+    if not document or document.user_id != current_user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Document not found"
@@ -203,32 +405,30 @@ def get_document(
 
 
 @router.delete("/documents/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_document(
+async def delete_document(
     document_id: UUID,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user_id: UUID = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a document."""
-    document = db.query(Document).filter(
-        Document.id == document_id,
-        Document.user_id == current_user.id
-    ).first()
+    document = await db.get(Document, document_id)
     
-    if not document:
+    if not document or document.user_id != current_user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Document not found"
         )
     
-    # Delete from S3
-    delete_file_from_s3(document.s3_key)
-    delete_file_from_s3(f"{document.s3_key}.metadata.json")
+    # Delete the object and its metadata sidecar from S3 in one request
+    # (boto3 blocks, so keep it off the event loop)
+    await run_in_threadpool(delete_files_from_s3, [document.s3_key, f"{document.s3_key}.metadata.json"])
     
     # Trigger ingestion job to sync KB (remove deleted document)
     if settings.BEDROCK_KB_ID and settings.BEDROCK_DATA_SOURCE_ID:
         
         s3_uri = f"s3://{settings.S3_BUCKET_NAME}/{document.s3_key}"
-        start_ingestion_job(
+        await run_in_threadpool(
+            start_ingestion_job,
             knowledge_base_id=settings.BEDROCK_KB_ID,
             data_source_id=settings.BEDROCK_DATA_SOURCE_ID,
             document_id=document.id,
@@ -238,7 +438,8 @@ def delete_document(
         )
     
     # Delete from database
-    db.delete(document)
-    db.commit()
+    await db.delete(document)
+    await db.commit()
+    invalidate_notebook(document.notebook_id)
     
     return None
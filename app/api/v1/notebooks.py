@@ -2,58 +2,73 @@
 from typing import List
 from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
-from app.models import User, Notebook
+from app.api.responses import ORJSONResponse
+from app.database import get_async_db
+from app.models import Notebook, Document
 from app.schemas.notebook import NotebookCreate, NotebookUpdate, NotebookResponse
-from app.services.auth_service import get_current_user
+from app.services.auth_service import get_current_user_id
+from app.services.s3_client import delete_files_from_s3
+from app.services.semantic_cache import invalidate_notebook
 
 router = APIRouter()
 
+# Columns serialized by NotebookResponse, selected as plain tuples for list endpoints
+NOTEBOOK_RESPONSE_COLUMNS = (
+    Notebook.id,
+    Notebook.user_id,
+    Notebook.name,
+    Notebook.description,
+    Notebook.created_at,
+    Notebook.updated_at,
+)
+
 
 @router.get("/notebooks", response_model=List[NotebookResponse])
-def list_notebooks(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def list_notebooks(
+    current_user_id: UUID = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """List all notebooks for the current user."""
-    notebooks = db.query(Notebook).filter(Notebook.user_id == current_user.id).all()
-    return notebooks
+    # Select just the response columns and return them as a ready response:
+    # rows were validated at write time, so re-validating each one buys nothing
+    result = await db.execute(
+        select(*NOTEBOOK_RESPONSE_COLUMNS).where(Notebook.user_id == current_user_id)
+    )
+    return ORJSONResponse(content=[row._asdict() for row in result])
 
 
 @router.post("/notebooks", response_model=NotebookResponse, status_code=status.HTTP_201_CREATED)
-def create_notebook(
+async def create_notebook(
     notebook_data: NotebookCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user_id: UUID = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new notebook."""
     new_notebook = Notebook(
-        user_id=current_user.id,
+        user_id=current_user_id,
         name=notebook_data.name,
         description=notebook_data.description
     )
     db.add(new_notebook)
-    db.commit()
-    db.refresh(new_notebook)
+    await db.commit()
     
     return new_notebook
 
 
 @router.get("/notebooks/{notebook_id}", response_model=NotebookResponse)
-def get_notebook(
+async def get_notebook(
     notebook_id: UUID,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user_id: UUID = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get a specific notebook."""
-    notebook = db.query(Notebook).filter(
-        Notebook.id == notebook_id,
-        Notebook.user_id == current_user.id
-    ).first()
+    notebook = await db.get(Notebook, notebook_id)
     
-    if not notebook:
+    if not notebook or notebook.user_id != current_user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Notebook not found"
@@ -63,19 +78,16 @@ def get_notebook(
 
 
 @router.patch("/notebooks/{notebook_id}", response_model=NotebookResponse)
-def update_notebook(
+async def update_notebook(
     notebook_id: UUID,
     notebook_data: NotebookUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user_id: UUID = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update a notebook."""
-    notebook = db.query(Notebook).filter(
-        Notebook.id == notebook_id,
-        Notebook.user_id == current_user.id
-    ).first()
+    notebook = await db.get(Notebook, notebook_id)
     
-    if not notebook:
+    if not notebook or notebook.user_id != current_user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Notebook not found"
@@ -87,31 +99,36 @@ def update_notebook(
     if notebook_data.description is not None:
         notebook.description = notebook_data.description
     
-    db.commit()
-    db.refresh(notebook)
+    await db.commit()
     
     return notebook
 
 
 @router.delete("/notebooks/{notebook_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_notebook(
+async def delete_notebook(
     notebook_id: UUID,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user_id: UUID = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a notebook."""
-    notebook = db.query(Notebook).filter(
-        Notebook.id == notebook_id,
-        Notebook.user_id == current_user.id
-    ).first()
+    notebook = await db.get(Notebook, notebook_id)
     
-    if not notebook:
+    if not notebook or notebook.user_id != current_user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Notebook not found"
         )
     
-    db.delete(notebook)
-    db.commit()
+    # The DB cascade only removes rows, so delete the documents' S3 objects
+    # and metadata sidecars first (batched, off the event loop)
+    result = await db.execute(select(Document.s3_key).where(Document.notebook_id == notebook_id))
+    s3_keys = [key for s3_key in result.scalars() for key in (s3_key, f"{s3_key}.metadata.json")]
+    if s3_keys:
+        await run_in_threadpool(delete_files_from_s3, s3_keys)
+    
+    # AsyncSession.delete loads the cascaded children before deleting
+    await db.delete(notebook)
+    await db.commit()
+    invalidate_notebook(notebook_id)
     
     return None
@@ -3,90 +3,140 @@ from sqlalchemy.orm import Session
 from typing import List
 from uuid import UUID
 
+from app.api.responses import ORJSONResponse
+from app.config import settings
 from app.database import get_db
-from app.api.v1.auth import get_current_user
-from app.models import User, SummaryPack, Notebook
-from app.schemas.summary_pack import SummaryPackCreate, SummaryPackResponse
-from app.services.summary_service import generate_summary_pack_task
+from app.services.auth_service import get_current_user_id
+from app.models import SummaryPack, SummaryPackSection, Notebook
+from app.schemas.summary_pack import SummaryPackCreate, SummaryPackResponse, SummaryPackSections
+from app.services.summary_service import generate_summary_pack_task, load_pack_sections
 
 router = APIRouter()
 
+# Columns serialized by SummaryPackResponse, selected as plain tuples for list endpoints
+SUMMARY_PACK_RESPONSE_COLUMNS = (
+    SummaryPack.id,
+    SummaryPack.notebook_id,
+    SummaryPack.created_by_user_id,
+    SummaryPack.title,
+    SummaryPack.scope_type,
+    SummaryPack.scope_document_ids,
+    SummaryPack.status,
+    SummaryPack.error_message,
+    SummaryPack.created_at,
+    SummaryPack.updated_at,
+)
+
 @router.post("/notebooks/{notebook_id}/summary-packs", response_model=SummaryPackResponse, status_code=status.HTTP_201_CREATED)
 def create_summary_pack(
     notebook_id: UUID,
     pack_data: SummaryPackCreate,
     background_tasks: BackgroundTasks,
-    current_user: User = Depends(get_current_user),
+    current_user_id: UUID = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """Create a new summary pack and start generation in background."""
-    # Verify notebook exists and belongs to user
-    notebook = db.query(Notebook).filter(Notebook.id == notebook_id, Notebook.user_id == current_user.id).first()
-    if not notebook:
+    # Verify notebook exists and belongs to user (PK-only lookup)
+    notebook_exists = db.query(Notebook.id).filter(
+        Notebook.id == notebook_id,
+        Notebook.user_id == current_user_id
+    ).scalar()
+    if not notebook_exists:
         raise HTTPException(status_code=404, detail="Notebook not found")
 
     new_pack = SummaryPack(
         notebook_id=notebook_id,
-        created_by_user_id=current_user.id,
+        created_by_user_id=current_user_id,
         title=pack_data.title,
         scope_type=pack_data.scope_type,
         scope_document_ids=pack_data.scope_document_ids
     )
     db.add(new_pack)
     db.commit()
-    db.refresh(new_pack)
 
     # Trigger background task
-    print(f"DEBUG: Triggering background task for pack {new_pack.id}")
-    background_tasks.add_task(generate_summary_pack_task, new_pack.id)
-    print("DEBUG: Background task added")
+    if settings.CELERY_BROKER_URL:
+        from app.worker import generate_summary_pack
+        generate_summary_pack.delay(str(new_pack.id))
+    else:
+        background_tasks.add_task(generate_summary_pack_task, new_pack.id)
 
     return new_pack
 
 @router.get("/notebooks/{notebook_id}/summary-packs", response_model=List[SummaryPackResponse])
 def list_summary_packs(
     notebook_id: UUID,
-    current_user: User = Depends(get_current_user),
+    current_user_id: UUID = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """List all summary packs for a notebook."""
-    # Verify notebook exists and belongs to user
-    notebook = db.query(Notebook).filter(Notebook.id == notebook_id, Notebook.user_id == current_user.id).first()
-    if not notebook:
+    # Fetch packs with notebook ownership enforced in the same statement
+    packs = db.query(*SUMMARY_PACK_RESPONSE_COLUMNS).join(Notebook, Notebook.id == SummaryPack.notebook_id).filter(
+        Notebook.id == notebook_id,
+        Notebook.user_id == current_user_id
+    ).order_by(SummaryPack.created_at.desc()).all()
+
+    # An empty result is either an empty notebook or one the user can't see
+    if not packs and not db.query(Notebook.id).filter(
+        Notebook.id == notebook_id,
+        Notebook.user_id == current_user_id
+    ).scalar():
         raise HTTPException(status_code=404, detail="Notebook not found")
 
-    packs = db.query(SummaryPack).filter(SummaryPack.notebook_id == notebook_id).order_by(SummaryPack.created_at.desc()).all()
-    return packs
+    # Rows were validated at write time, so skip response-model re-validation
+    return ORJSONResponse(content=[pack._asdict() for pack in packs])
 
 @router.get("/summary-packs/{pack_id}", response_model=SummaryPackResponse)
 def get_summary_pack(
     pack_id: UUID,
-    current_user: User = Depends(get_current_user),
+    current_user_id: UUID = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """Get a specific summary pack."""
-    pack = db.query(SummaryPack).filter(SummaryPack.id == pack_id).first()
+    pack = db.get(SummaryPack, pack_id)
     if not pack:
         raise HTTPException(status_code=404, detail="Summary pack not found")
     
-    if pack.created_by_user_id != current_user.id:
+    if pack.created_by_user_id != current_user_id:
         raise HTTPException(status_code=403, detail="Not authorized to access this summary pack")
 
     return pack
 
 
+@router.get("/summary-packs/{pack_id}/sections", response_model=SummaryPackSections)
+def get_summary_pack_sections(
+    pack_id: UUID,
+    current_user_id: UUID = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """Get the generated sections of a summary pack (the heavy payload)."""
+    # Owner-only lookup, so the pack header row is not hydrated
+    owner_id = db.query(SummaryPack.created_by_user_id).filter(SummaryPack.id == pack_id).scalar()
+    if owner_id is None:
+        raise HTTPException(status_code=404, detail="Summary pack not found")
+    
+    if owner_id != current_user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this summary pack")
+
+    rows = db.query(SummaryPackSection).filter(
+        SummaryPackSection.summary_pack_id == pack_id
+    ).order_by(SummaryPackSection.idx).all()
+
+    return load_pack_sections(rows)
+
+
 @router.delete("/summary-packs/{pack_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_summary_pack(
     pack_id: UUID,
-    current_user: User = Depends(get_current_user),
+    current_user_id: UUID = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """Delete a summary pack."""
-    pack = db.query(SummaryPack).filter(SummaryPack.id == pack_id).first()
+    pack = db.get(SummaryPack, pack_id)
     if not pack:
         raise HTTPException(status_code=404, detail="Summary pack not found")
     
-    if pack.created_by_user_id != current_user.id:
+    if pack.created_by_user_id != current_user_id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this summary pack")
 
     db.delete(pack)
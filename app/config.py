@@ -1,8 +1,14 @@
 """Application configuration using Pydantic Settings."""
-from pydantic_settings import BaseSettings
-from pydantic import model_validator
-from typing import List, Optional
+from functools import lru_cache
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from pydantic import PrivateAttr, model_validator
+from typing import Optional, Tuple
 from urllib.parse import quote_plus
+from sqlalchemy.engine import make_url
+
+
+# PostgreSQL drivers that create_async_engine accepts
+ASYNC_POSTGRES_DRIVERS = ("psycopg", "asyncpg")
 
 
 class Settings(BaseSettings):
@@ -17,6 +23,17 @@ class Settings(BaseSettings):
     
     # Database URL (can be provided directly or constructed)
     DATABASE_URL: Optional[str] = None
+    # URL for the asyncio engine used by async endpoints. Defaults to
+    # DATABASE_URL, since psycopg 3 serves both sync and async connections.
+    ASYNC_DATABASE_URL: Optional[str] = None
+    
+    # Connection pool
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 40
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    # psycopg 3 switches a query to a server-side prepared statement after it
+    # has run this many times on a connection
+    DB_PREPARE_THRESHOLD: int = 5
     
     # JWT
     SECRET_KEY: str
@@ -32,33 +49,85 @@ class Settings(BaseSettings):
     BEDROCK_KB_ID: Optional[str] = None
     BEDROCK_DATA_SOURCE_ID: Optional[str] = None
     
+    # Ingestion workers
+    INGESTION_WORKERS: int = 4
+    INGESTION_QUEUE_MAX_SIZE: int = 100
+    
+    # Concurrent PPTX to PDF conversions (LibreOffice; PowerPoint runs one at a time)
+    PPTX_CONVERSION_WORKERS: int = 2
+    
+    # Celery task queue (optional). When a broker is set, ingestion and
+    # summary/discovery generation run on Celery workers instead of in-process.
+    CELERY_BROKER_URL: Optional[str] = None
+    CELERY_RESULT_BACKEND: Optional[str] = None
+    
+    # Redis (optional). Coordinates ingestion batching and job tracking across workers.
+    REDIS_URL: Optional[str] = None
+    
+    # SQS queue that an EventBridge rule sends Bedrock ingestion job state
+    # changes to. When set, job completion is event-driven instead of polled.
+    INGESTION_EVENTS_QUEUE_URL: Optional[str] = None
+    
     # Gemini
     GEMINI_API_KEY: str
+    # Discovery questions use JSON mode on gemini-1.5 and later; gemini-pro and
+    # gemini-1.0 fall back to parsing the array out of free-form text
     GEMINI_MODEL: str = "gemini-pro"
     
+    # Approximate answer cache for questions asked without chat history
+    # (optional). Entries per process; 0 disables it.
+    SEMANTIC_CACHE_SIZE: int = 0
+    SEMANTIC_CACHE_THRESHOLD: float = 0.86
+    SEMANTIC_CACHE_TTL_SECONDS: int = 600
+    SEMANTIC_CACHE_EMBEDDING_MODEL: str = "models/gemini-embedding-001"
+    # Answer the common questions in rag_service.WARM_QUESTIONS ahead of time
+    # whenever a notebook's documents finish ingesting
+    SEMANTIC_CACHE_WARM: bool = False
+    
     # Application
     DEBUG: bool = False
     ALLOWED_ORIGINS: str = "http://localhost:3000"
     
+    # Parsed once from ALLOWED_ORIGINS at validation time
+    _cors_origins: Tuple[str, ...] = PrivateAttr(default=())
+    
     @property
-    def cors_origins(self) -> List[str]:
-        """Parse CORS origins from comma-separated string."""
-        return [origin.strip() for origin in self.ALLOWED_ORIGINS.split(",")]
+    def cors_origins(self) -> Tuple[str, ...]:
+        """CORS origins parsed from the comma-separated ALLOWED_ORIGINS."""
+        return self._cors_origins
     
     @model_validator(mode='after')
     def assemble_db_connection(self) -> 'Settings':
-        """Construct DATABASE_URL if not provided."""
+        """Construct or normalize DATABASE_URL and parse CORS origins."""
         if not self.DATABASE_URL and self.DB_USER and self.DB_PASSWORD and self.DB_HOST:
             encoded_password = quote_plus(self.DB_PASSWORD)
-            self.DATABASE_URL = f"postgresql://{self.DB_USER}:{encoded_password}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+            self.DATABASE_URL = f"postgresql+psycopg://{self.DB_USER}:{encoded_password}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+        elif self.DATABASE_URL and self.DATABASE_URL.startswith("postgresql://"):
+            # A bare postgresql:// URL would select psycopg2; use psycopg 3 instead
+            self.DATABASE_URL = "postgresql+psycopg://" + self.DATABASE_URL[len("postgresql://"):]
+        if not self.ASYNC_DATABASE_URL and self.DATABASE_URL:
+            url = make_url(self.DATABASE_URL)
+            if url.get_backend_name() == "postgresql" and url.get_driver_name() not in ASYNC_POSTGRES_DRIVERS:
+                # e.g. an explicit +psycopg2 URL; psycopg 3 serves the same
+                # database from the async engine
+                url = url.set(drivername="postgresql+psycopg")
+            self.ASYNC_DATABASE_URL = url.render_as_string(hide_password=False)
+        self._cors_origins = tuple(origin.strip() for origin in self.ALLOWED_ORIGINS.split(","))
         return self
     
-    class Config:
-        env_file = ".env"
-        case_sensitive = True
-        extra = "ignore"  # Ignore extra fields in .env
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        case_sensitive=True,
+        extra="ignore"  # Ignore extra fields in .env
+    )
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """Return the cached settings instance (.env is parsed only once)."""
+    return Settings()
 
 
 # Global settings instance
-settings = Settings()
+settings = get_settings()
 
@@ -1,26 +1,50 @@
 """Main FastAPI application."""
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.config import settings
+from app.api.responses import ORJSONResponse
+from app.config import get_settings
+from app.services.ingestion import start_ingestion_workers, stop_ingestion_workers
+from app.services.ingestion_events import start_ingestion_event_consumer, stop_ingestion_event_consumer
+from app.services.pptx_converter import shutdown_pptx_converter
+
+settings = get_settings()
 
 # Create FastAPI app
 app = FastAPI(
     title="NotebookLM-Style RAG API",
     description="Backend for NotebookLM-style RAG application with AWS Bedrock and Gemini",
     version="1.0.0",
-    debug=settings.DEBUG
+    debug=settings.DEBUG,
+    # orjson encodes UUIDs/datetimes natively and much faster than the stdlib json
+    default_response_class=ORJSONResponse
 )
 
-# Configure CORS
+# Configure CORS. Methods and headers are listed explicitly (the API only uses
+# these) so preflight checks are set lookups rather than echoing the request.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.cors_origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PATCH", "DELETE", "OPTIONS"],
+    allow_headers=["authorization", "content-type"],
 )
 
 
+@app.on_event("startup")
+async def startup_event():
+    """Start background ingestion workers."""
+    start_ingestion_workers()
+    start_ingestion_event_consumer()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background ingestion workers."""
+    await stop_ingestion_event_consumer()
+    await stop_ingestion_workers()
+    shutdown_pptx_converter()
+
+
 @app.get("/api/v1/health")
 async def health_check():
     """Health check endpoint."""
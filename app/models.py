@@ -1,14 +1,46 @@
 """SQLAlchemy database models."""
 import uuid
-from datetime import datetime
-from sqlalchemy import Column, String, DateTime, Text, ForeignKey, Enum, JSON
+from sqlalchemy import Column, String, DateTime, Text, ForeignKey, Enum, JSON, Index, CheckConstraint, SmallInteger, func, text
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.orm import relationship
 import enum
 
 from app.database import Base
 
 
+class SmallIntEnum(TypeDecorator):
+    """Store a Python enum as a SMALLINT code instead of a Postgres ENUM.
+    
+    Codes are the members' positions in the enum (0, 1, 2, ...), so new
+    members must only ever be appended. Python code keeps using the enum.
+    """
+    impl = SmallInteger
+    cache_ok = True
+    
+    def __init__(self, enum_class):
+        super().__init__()
+        self.enum_class = enum_class
+        self._members = tuple(enum_class)
+        self._codes = {member: code for code, member in enumerate(self._members)}
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return self._codes[self.enum_class(value)]
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return self._members[value]
+
+
+def enum_check(column: str, enum_class, name: str) -> CheckConstraint:
+    """CHECK constraint limiting a SmallIntEnum column to the enum's codes."""
+    codes = ", ".join(str(code) for code in range(len(enum_class)))
+    return CheckConstraint(f"{column} IN ({codes})", name=name)
+
+
 class DocumentStatus(str, enum.Enum):
     """Document ingestion status."""
     PENDING = "pending"
@@ -45,8 +77,8 @@ class User(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     email = Column(String(255), unique=True, nullable=False, index=True)
     password_hash = Column(String(255), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
     
     # Relationships
     notebooks = relationship("Notebook", back_populates="user", cascade="all, delete-orphan")
@@ -65,8 +97,8 @@ class Notebook(Base):
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     name = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
     
     # Relationships
     user = relationship("User", back_populates="notebooks")
@@ -74,6 +106,11 @@ class Notebook(Base):
     chats = relationship("Chat", back_populates="notebook", cascade="all, delete-orphan")
     summary_packs = relationship("SummaryPack", back_populates="notebook", cascade="all, delete-orphan")
     discovery_question_sets = relationship("DiscoveryQuestionSet", back_populates="notebook", cascade="all, delete-orphan")
+    
+    # Covers the (id, user_id) ownership checks run by most endpoints as an index-only scan
+    __table_args__ = (
+        Index("ix_notebooks_user_id_id", "user_id", "id"),
+    )
 
 
 class Document(Base):
@@ -86,15 +123,28 @@ class Document(Base):
     title = Column(String(255), nullable=False)
     original_filename = Column(String(255), nullable=False)
     s3_key = Column(String(512), nullable=False)
-    status = Column(Enum(DocumentStatus), default=DocumentStatus.PENDING, nullable=False, index=True)
+    status = Column(SmallIntEnum(DocumentStatus), default=DocumentStatus.PENDING, nullable=False, index=True)
     error_message = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    sha256 = Column(String(64), nullable=True)  # Hex digest of the uploaded content
+    ingestion_task_id = Column(String(255), nullable=True)  # Celery task ID, when a task queue is used
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
     
     # Relationships
     user = relationship("User", back_populates="documents")
     notebook = relationship("Notebook", back_populates="documents")
     citations = relationship("Citation", back_populates="document", cascade="all, delete-orphan")
+    
+    # Composite indexes for the (notebook_id, user_id) / (user_id, id) filters
+    # and the duplicate-upload lookup within a notebook; the partial index keeps
+    # scans for pending documents off the (much larger) set of finished ones
+    __table_args__ = (
+        Index("ix_documents_notebook_user", "notebook_id", "user_id"),
+        Index("ix_documents_user_id_id", "user_id", "id"),
+        Index("ix_documents_notebook_id_sha256", "notebook_id", "sha256"),
+        Index("ix_documents_pending", "status", postgresql_where=text("status = 0")),
+        enum_check("status", DocumentStatus, "ck_documents_status"),
+    )
 
 
 class Chat(Base):
@@ -105,8 +155,8 @@ class Chat(Base):
     notebook_id = Column(UUID(as_uuid=True), ForeignKey("notebooks.id", ondelete="CASCADE"), nullable=False, index=True)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     title = Column(String(255), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
     
     # Relationships
     user = relationship("User", back_populates="chats")
@@ -121,16 +171,22 @@ class Message(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     chat_id = Column(UUID(as_uuid=True), ForeignKey("chats.id", ondelete="CASCADE"), nullable=False, index=True)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
-    role = Column(Enum(MessageRole), nullable=False)
+    role = Column(SmallIntEnum(MessageRole), nullable=False)
     content = Column(Text, nullable=False)
     metadata_ = Column("metadata", JSON, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
     
     # Relationships
     user = relationship("User", back_populates="messages")
     chat = relationship("Chat", back_populates="messages")
     citations = relationship("Citation", back_populates="message", cascade="all, delete-orphan")
+    
+    # Chat history is read in created_at order per chat
+    __table_args__ = (
+        Index("ix_messages_chat_created", "chat_id", "created_at"),
+        enum_check("role", MessageRole, "ck_messages_role"),
+    )
 
 
 class Citation(Base):
@@ -143,7 +199,7 @@ class Citation(Base):
     source_chunk_id = Column(String(255), nullable=False)
     snippet = Column(Text, nullable=False)
     location = Column(JSON, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     
     # Relationships
     message = relationship("Message", back_populates="citations")
@@ -158,17 +214,51 @@ class SummaryPack(Base):
     notebook_id = Column(UUID(as_uuid=True), ForeignKey("notebooks.id", ondelete="CASCADE"), nullable=False, index=True)
     created_by_user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     title = Column(String(255), nullable=False)
-    scope_type = Column(Enum(SummaryPackScope), nullable=False)
+    scope_type = Column(SmallIntEnum(SummaryPackScope), nullable=False)
     scope_document_ids = Column(JSON, nullable=True)
-    status = Column(Enum(SummaryPackStatus), default=SummaryPackStatus.PENDING, nullable=False)
-    sections = Column(JSON, nullable=True)
+    status = Column(SmallIntEnum(SummaryPackStatus), default=SummaryPackStatus.PENDING, nullable=False)
     error_message = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
     
     # Relationships
     notebook = relationship("Notebook", back_populates="summary_packs")
     user = relationship("User", back_populates="summary_packs")
+    # Section bodies live in their own table so header reads skip them
+    sections = relationship(
+        "SummaryPackSection",
+        back_populates="summary_pack",
+        order_by="SummaryPackSection.idx",
+        cascade="all, delete-orphan",
+        passive_deletes=True
+    )
+    
+    # Supports listing a notebook's packs ordered by created_at DESC
+    __table_args__ = (
+        Index("ix_summary_packs_notebook_created", "notebook_id", "created_at"),
+        enum_check("scope_type", SummaryPackScope, "ck_summary_packs_scope_type"),
+        enum_check("status", SummaryPackStatus, "ck_summary_packs_status"),
+    )
+
+
+class SummaryPackSection(Base):
+    """Summary Pack section model: the executive summary or one document's summary."""
+    __tablename__ = "summary_pack_sections"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    summary_pack_id = Column(UUID(as_uuid=True), ForeignKey("summary_packs.id", ondelete="CASCADE"), nullable=False)
+    idx = Column(SmallInteger, nullable=False)  # Position within the pack
+    key = Column(String(64), nullable=False)  # Document ID, or "executive_summary"
+    title = Column(String(255), nullable=True)  # Document name, for document sections
+    body = Column(Text, nullable=False)
+    
+    # Relationships
+    summary_pack = relationship("SummaryPack", back_populates="sections")
+    
+    # Sections are always read per pack in order
+    __table_args__ = (
+        Index("ix_summary_pack_sections_pack_idx", "summary_pack_id", "idx", unique=True),
+    )
 
 
 class DiscoveryQuestionSetStatus(str, enum.Enum):
@@ -230,8 +320,8 @@ class DiscoveryQuestionSet(Base):
     scope_document_ids = Column(JSON, nullable=True)
     status = Column(Enum(DiscoveryQuestionSetStatus), default=DiscoveryQuestionSetStatus.PENDING, nullable=False)
     error_message = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
     
     # Relationships
     notebook = relationship("Notebook", back_populates="discovery_question_sets")
@@ -250,8 +340,8 @@ class DiscoveryQuestion(Base):
     priority = Column(Enum(DiscoveryQuestionPriority), nullable=False)
     status = Column(Enum(DiscoveryQuestionStatus), default=DiscoveryQuestionStatus.OPEN, nullable=False)
     related_document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="SET NULL"), nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
     
     # Relationships
     question_set = relationship("DiscoveryQuestionSet", back_populates="questions")
@@ -1,7 +1,7 @@
 """Pydantic schemas for chats and messages."""
 from datetime import datetime
 from uuid import UUID
-from pydantic import BaseModel, Field, field_validator, ValidationInfo, model_validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator, ValidationInfo, model_validator
 from typing import Optional, List, Dict, Any
 from app.models import MessageRole
 
@@ -24,8 +24,7 @@ class ChatResponse(ChatBase):
     created_at: datetime
     updated_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
 
 class MessageBase(BaseModel):
@@ -51,8 +50,7 @@ class MessageResponse(MessageBase):
     created_at: datetime
     updated_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
 
 class CitationResponse(BaseModel):
@@ -65,8 +63,7 @@ class CitationResponse(BaseModel):
     location: Optional[Dict[str, Any]] = None
     created_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
 
 class MessageWithCitations(MessageResponse):
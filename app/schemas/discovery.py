@@ -1,7 +1,7 @@
 from typing import List, Optional
 from uuid import UUID
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, RootModel, field_validator
 from app.models import (
     DiscoveryQuestionSetStatus,
     DiscoveryQuestionTargetAudience,
@@ -31,8 +31,7 @@ class DiscoveryQuestion(DiscoveryQuestionBase):
     created_at: datetime
     updated_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
 
 class DiscoveryQuestionSetBase(BaseModel):
@@ -56,5 +55,32 @@ class DiscoveryQuestionSet(DiscoveryQuestionSetBase):
     updated_at: datetime
     questions: List[DiscoveryQuestion] = []
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+
+class GeneratedQuestion(BaseModel):
+    """One question as returned by the discovery LLM."""
+    text: str = "Unknown Question"
+    category: DiscoveryQuestionCategory = DiscoveryQuestionCategory.OTHER
+    priority: DiscoveryQuestionPriority = DiscoveryQuestionPriority.MEDIUM
+    related_document_name: Optional[str] = None
+
+    @field_validator("category", mode="before")
+    @classmethod
+    def normalize_category(cls, value):
+        value = str(value).lower()
+        if value not in DiscoveryQuestionCategory._value2member_map_:
+            return DiscoveryQuestionCategory.OTHER
+        return value
+
+    @field_validator("priority", mode="before")
+    @classmethod
+    def normalize_priority(cls, value):
+        value = str(value).lower()
+        if value not in DiscoveryQuestionPriority._value2member_map_:
+            return DiscoveryQuestionPriority.MEDIUM
+        return value
+
+
+class GeneratedQuestions(RootModel[List[GeneratedQuestion]]):
+    """JSON array of generated questions, validated straight from the LLM output."""
@@ -1,7 +1,7 @@
 """Pydantic schemas for documents."""
 from datetime import datetime
 from uuid import UUID
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional
 from app.models import DocumentStatus
 
@@ -28,5 +28,24 @@ class DocumentResponse(DocumentBase):
     created_at: datetime
     updated_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+
+class DocumentUploadInitiate(BaseModel):
+    """Schema for starting a direct-to-S3 document upload."""
+    filename: str = Field(..., min_length=1, max_length=255)
+    content_type: Optional[str] = None
+
+
+class DocumentUploadInitiateResponse(BaseModel):
+    """Schema for a presigned direct-to-S3 upload.
+    
+    The client PUTs the file body to upload_url with the given Content-Type,
+    then calls the complete endpoint for document_id.
+    """
+    document_id: UUID
+    upload_url: str
+    content_type: Optional[str] = None
+    expires_in: int
+    
+    model_config = ConfigDict(frozen=True)
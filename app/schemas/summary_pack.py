@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict
+from typing import Dict, List, Optional
 from uuid import UUID
 from datetime import datetime
 from app.models import SummaryPackStatus, SummaryPackScope
@@ -15,7 +15,6 @@ class SummaryPackCreate(SummaryPackBase):
 class SummaryPackUpdate(BaseModel):
     title: Optional[str] = None
     status: Optional[SummaryPackStatus] = None
-    sections: Optional[Dict[str, Any]] = None
     error_message: Optional[str] = None
 
 class SummaryPackResponse(SummaryPackBase):
@@ -23,10 +22,20 @@ class SummaryPackResponse(SummaryPackBase):
     notebook_id: UUID
     created_by_user_id: UUID
     status: SummaryPackStatus
-    sections: Optional[Dict[str, Any]] = None
     error_message: Optional[str] = None
     created_at: datetime
     updated_at: datetime
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+class DocumentSection(BaseModel):
+    document_name: str
+    summary: str
+
+    model_config = ConfigDict(frozen=True)
+
+class SummaryPackSections(BaseModel):
+    executive_summary: str = ""
+    documents: Dict[UUID, DocumentSection] = {}
+
+    model_config = ConfigDict(frozen=True)
@@ -1,24 +1,80 @@
 """Authentication service with JWT and password hashing."""
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from uuid import UUID
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.config import settings
-from app.database import get_db
+from app.database import get_async_db
 from app.models import User
 from app.schemas.auth import TokenData
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# Password hashing context. argon2id is pinned to the OWASP minimum (19 MiB,
+# 2 passes, 1 lane) instead of passlib's heavier defaults, so a login costs a
+# fraction of the CPU and memory. Hashes made with other parameters are
+# re-hashed on the next successful login.
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__time_cost=2,
+    argon2__memory_cost=19456,
+    argon2__parallelism=1
+)
 
 # HTTP Bearer token scheme
 security = HTTPBearer()
 
+# Decoded tokens and loaded users are cached in-process so that repeated
+# requests with the same bearer token skip the JWT decode and the User SELECT.
+TOKEN_CACHE_MAX_SIZE = 10_000
+USER_CACHE_TTL_SECONDS = 60
+
+# Both caches are LRU-ordered: hits move to the end, evictions pop the front.
+_valid_token_cache: "OrderedDict[str, Tuple[UUID, float]]" = OrderedDict()
+_user_cache: "OrderedDict[UUID, Tuple[User, float]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_put(cache: OrderedDict, key, value) -> None:
+    """Store a cache entry, evicting the least recently used one when the cache is full."""
+    with _cache_lock:
+        if key in cache:
+            cache.move_to_end(key)
+        elif len(cache) >= TOKEN_CACHE_MAX_SIZE:
+            cache.popitem(last=False)
+        cache[key] = value
+
+
+def _cache_get(cache: OrderedDict, key):
+    """Return a cached value if it has not expired, dropping it otherwise."""
+    with _cache_lock:
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.time():
+            cache.pop(key, None)
+            return None
+        cache.move_to_end(key)
+        return value
+
+
+def invalidate_cached_user(user_id: UUID) -> None:
+    """Drop a user and any of their cached tokens (e.g. after a password change)."""
+    with _cache_lock:
+        _user_cache.pop(user_id, None)
+        for token in [t for t, (uid, _) in _valid_token_cache.items() if uid == user_id]:
+            _valid_token_cache.pop(token, None)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
@@ -45,6 +101,10 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 
 def decode_token(token: str) -> TokenData:
     """Decode and validate a JWT token."""
+    cached_user_id = _cache_get(_valid_token_cache, token)
+    if cached_user_id is not None:
+        return TokenData(user_id=cached_user_id)
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -59,27 +119,51 @@ def decode_token(token: str) -> TokenData:
         token_data = TokenData(user_id=UUID(user_id))
     except JWTError:
         raise credentials_exception
+
+    expires_at = payload.get("exp")
+    if expires_at is not None:
+        _cache_put(_valid_token_cache, token, (token_data.user_id, float(expires_at)))
     
     return token_data
 
 
 from fastapi.security import HTTPAuthorizationCredentials
 
+async def get_current_user_id(
+    token: HTTPAuthorizationCredentials = Depends(security)
+) -> UUID:
+    """Get the authenticated user's ID from the token alone, without a DB query.
+    
+    For endpoints that only need the ID for ownership checks; those that
+    return user fields use get_current_user.
+    """
+    return decode_token(token.credentials).user_id
+
+
 async def get_current_user(
     token: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
-    """Get the current authenticated user."""
+    """Get the current authenticated user (cached for USER_CACHE_TTL_SECONDS)."""
     token_data = decode_token(token.credentials)
-    
-    user = db.query(User).filter(User.id == token_data.user_id).first()
+
+    user = _cache_get(_user_cache, token_data.user_id)
+    if user is not None:
+        return user
+
+    # Cache misses are awaited, so they no longer block the event loop
+    user = await db.get(User, token_data.user_id)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
+
+    # Detach the row so a commit in one request cannot expire the shared copy.
+    db.expunge(user)
+    _cache_put(_user_cache, user.id, (user, time.time() + USER_CACHE_TTL_SECONDS))
+
     return user
 
 
@@ -88,6 +172,11 @@ def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
     user = db.query(User).filter(User.email == email).first()
     if not user:
         return None
-    if not verify_password(password, user.password_hash):
+    verified, new_hash = pwd_context.verify_and_update(password, user.password_hash)
+    if not verified:
         return None
+    if new_hash:
+        # Stored hash used outdated parameters; upgrade it while we have the password
+        user.password_hash = new_hash
+        db.commit()
     return user
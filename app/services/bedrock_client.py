@@ -1,5 +1,7 @@
 """AWS Bedrock Knowledge Base client and utilities."""
+from functools import lru_cache
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from typing import Dict, Any, Optional
 from uuid import UUID
@@ -9,13 +11,34 @@ from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Shared client config: a pool large enough for concurrent ingestion polling,
+# short timeouts instead of botocore's 60s, and adaptive (throttle-aware) retries
+BEDROCK_CLIENT_CONFIG = Config(
+    max_pool_connections=50,
+    connect_timeout=5,
+    read_timeout=15,
+    retries={'mode': 'adaptive', 'max_attempts': 5},
+    tcp_keepalive=True
+)
+
 # Initialize Bedrock Agent client
 bedrock_agent_client = boto3.client(
     'bedrock-agent',
     aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
     aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
     aws_session_token=settings.AWS_SESSION_TOKEN,
-    region_name=settings.AWS_REGION
+    region_name=settings.AWS_REGION,
+    config=BEDROCK_CLIENT_CONFIG
+)
+
+# Shared Knowledge Base retrieval client (boto3 clients are thread-safe)
+bedrock_agent_runtime_client = boto3.client(
+    'bedrock-agent-runtime',
+    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+    aws_session_token=settings.AWS_SESSION_TOKEN,
+    region_name=settings.AWS_REGION,
+    config=BEDROCK_CLIENT_CONFIG
 )
 
 
@@ -134,6 +157,30 @@ def get_ingestion_job_status(
         }
 
 
+@lru_cache(maxsize=4096)
+def _notebook_filter(user_id: UUID, notebook_id: UUID) -> Dict[str, Any]:
+    """Tenant-isolation filter for a (user, notebook) pair, built once and reused.
+    
+    Callers must treat the returned dict as read-only since it is shared.
+    """
+    return {
+        "andAll": [
+            {
+                "equals": {
+                    "key": "user_id",
+                    "value": str(user_id)
+                }
+            },
+            {
+                "equals": {
+                    "key": "notebook_id",
+                    "value": str(notebook_id)
+                }
+            }
+        ]
+    }
+
+
 def create_metadata_filter(
     user_id: UUID,
     notebook_id: UUID,
@@ -141,7 +188,9 @@ def create_metadata_filter(
 ) -> Dict[str, Any]:
     """Create metadata filter for retrieval.
     
-    This filter ensures multi-tenancy isolation during retrieval.
+    This filter ensures multi-tenancy isolation during retrieval. The
+    notebook-wide filter is cached per (user, notebook); only the document
+    clause is built per call.
     
     Args:
         user_id: User UUID
@@ -151,31 +200,19 @@ def create_metadata_filter(
     Returns:
         Metadata filter dict for Bedrock KB retrieval
     """
-    # Build filter with AND conditions
-    filters = [
-        {
-            "equals": {
-                "key": "user_id",
-                "value": str(user_id)
-            }
-        },
-        {
-            "equals": {
-                "key": "notebook_id",
-                "value": str(notebook_id)
-            }
-        }
-    ]
+    notebook_filter = _notebook_filter(user_id, notebook_id)
+    if not document_ids:
+        return notebook_filter
     
     # Add document filter if specified
-    if document_ids:
-        filters.append({
-            "in": {
-                "key": "document_id",
-                "value": [str(doc_id) for doc_id in document_ids]
-            }
-        })
-    
     return {
-        "andAll": filters
+        "andAll": [
+            *notebook_filter["andAll"],
+            {
+                "in": {
+                    "key": "document_id",
+                    "value": [str(doc_id) for doc_id in document_ids]
+                }
+            }
+        ]
     }
@@ -1,72 +1,147 @@
 import logging
-import json
+from concurrent.futures import ThreadPoolExecutor
 from uuid import UUID
-from typing import List, Optional
-from sqlalchemy.orm import Session
+from typing import TYPE_CHECKING, List, Optional
+from pydantic import ValidationError
+from sqlalchemy import Row, insert, select
+from sqlalchemy.orm import Session, selectinload
 from app.database import SessionLocal
 from app.models import (
     DiscoveryQuestionSet, DiscoveryQuestionSetStatus, DiscoveryQuestion,
     Document, DiscoveryQuestionScope, SummaryPack, SummaryPackStatus,
-    DiscoveryQuestionCategory, DiscoveryQuestionPriority, DiscoveryQuestionStatus
+    DiscoveryQuestionStatus
 )
+from app.schemas.discovery import GeneratedQuestions
 from app.services.rag_service import answer_question
+from app.services.summary_service import load_pack_sections
 from app.config import settings
 
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage
 
+if TYPE_CHECKING:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
 logger = logging.getLogger(__name__)
 
+# Upper bound on the context sent to Gemini, to bound token usage and latency
+MAX_CONTEXT_CHARS = 40_000
+
+# Response schema for Gemini's JSON mode, so the model returns a parseable array
+QUESTIONS_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "text": {"type": "string"},
+            "category": {
+                "type": "string",
+                "enum": ["requirements", "data", "architecture", "risks", "operations", "other"]
+            },
+            "priority": {"type": "string", "enum": ["low", "medium", "high"]},
+            "related_document_name": {"type": "string"}
+        },
+        "required": ["text", "category", "priority"]
+    }
+}
+
+# Documents summarized (concurrently) for context when there is no summary pack
+MAX_CONTEXT_DOCUMENTS = 5
+
+# Models without JSON mode; they reject response_mime_type/response_schema
+LEGACY_GEMINI_MODELS = ("gemini-pro", "gemini-1.0")
+
+# Question generator, created on first use and shared by later tasks
+_llm = None
+
+
+def _supports_json_mode(model: str) -> bool:
+    """Whether the Gemini model accepts a JSON response schema (1.5 and later)."""
+    name = model.removeprefix("models/")
+    return not name.startswith(LEGACY_GEMINI_MODELS)
+
+
+def _extract_json_array(content: str) -> str:
+    """Strip markdown fences and surrounding prose from a JSON array reply."""
+    clean_content = content.strip()
+    if "```json" in clean_content:
+        clean_content = clean_content.split("```json")[1].split("```")[0].strip()
+    elif "```" in clean_content:
+        clean_content = clean_content.split("```")[1].split("```")[0].strip()
+
+    # Fallback: Try to find the first [ and last ]
+    if not clean_content.startswith("["):
+        start_idx = clean_content.find("[")
+        end_idx = clean_content.rfind("]")
+        if start_idx != -1 and end_idx != -1:
+            clean_content = clean_content[start_idx:end_idx+1]
+    return clean_content
+
+
+def get_llm() -> "ChatGoogleGenerativeAI":
+    """Get or create the Gemini client used to generate discovery questions."""
+    global _llm
+    if _llm is None:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        _llm = ChatGoogleGenerativeAI(
+            model=settings.GEMINI_MODEL,
+            google_api_key=settings.GEMINI_API_KEY,
+            temperature=0.4,
+            response_mime_type="application/json",
+            response_schema=QUESTIONS_SCHEMA
+        )
+    return _llm
+
+
 def generate_discovery_questions_task(question_set_id: UUID):
     """Background task to generate discovery questions."""
-    print(f"DEBUG: Starting generate_discovery_questions_task for {question_set_id}", flush=True)
+    logger.debug(f"Starting generate_discovery_questions_task for {question_set_id}")
     db = SessionLocal()
     try:
-        q_set = db.query(DiscoveryQuestionSet).filter(DiscoveryQuestionSet.id == question_set_id).first()
+        q_set = db.get(DiscoveryQuestionSet, question_set_id)
         if not q_set:
             logger.error(f"DiscoveryQuestionSet {question_set_id} not found")
             return
 
         q_set.status = DiscoveryQuestionSetStatus.IN_PROGRESS
         db.commit()
+        # Read up front; the workers mustn't touch the (not thread-safe) session
+        user_id, notebook_id = q_set.created_by_user_id, q_set.notebook_id
+        target_audience = q_set.target_audience
 
         # 1. Gather Context
-        context_text = ""
+        context_parts: List[str] = []
         
         # Option A: Reuse most recent successful SummaryPack
-        latest_summary = db.query(SummaryPack).filter(
-            SummaryPack.notebook_id == q_set.notebook_id,
+        latest_summary = db.query(SummaryPack).options(selectinload(SummaryPack.sections)).filter(
+            SummaryPack.notebook_id == notebook_id,
             SummaryPack.status == SummaryPackStatus.DONE
         ).order_by(SummaryPack.created_at.desc()).first()
 
         if latest_summary and latest_summary.sections:
-            print("DEBUG: Using existing SummaryPack for context", flush=True)
+            logger.debug("Using existing SummaryPack for context")
             # Extract relevant parts from summary pack
-            sections = latest_summary.sections
-            if isinstance(sections, dict):
-                exec_summary = sections.get("executive_summary", "")
-                context_text += f"Executive Summary:\n{exec_summary}\n\n"
-                
-                # Add individual document summaries if available
-                for key, value in sections.items():
-                    if key != "executive_summary" and isinstance(value, dict):
-                        doc_name = value.get("document_name", "Document")
-                        doc_summary = value.get("summary", "")
-                        context_text += f"Document: {doc_name}\nSummary: {doc_summary}\n\n"
+            sections = load_pack_sections(latest_summary.sections)
+            context_parts.append(f"Executive Summary:\n{sections.executive_summary}\n\n")
+            
+            # Add individual document summaries if available
+            for section in sections.documents.values():
+                context_parts.append(f"Document: {section.document_name}\nSummary: {section.summary}\n\n")
 
         # Option B: If no summary pack, or if we want more detail, we could sample documents.
         # For now, let's rely on SummaryPack if available, otherwise fetch summaries for documents.
         
-        if not context_text:
-            print("DEBUG: No SummaryPack found, generating fresh context from documents", flush=True)
-            # Identify documents
+        if not context_parts:
+            logger.debug("No SummaryPack found, generating fresh context from documents")
+            # Identify documents (only id and title are needed, as plain rows)
             docs_to_process = []
+            doc_columns = select(Document.id, Document.title)
             if q_set.scope_type == DiscoveryQuestionScope.NOTEBOOK:
-                docs_to_process = db.query(Document).filter(Document.notebook_id == q_set.notebook_id).all()
+                docs_to_process = db.execute(doc_columns.where(Document.notebook_id == notebook_id)).all()
             elif q_set.scope_type == DiscoveryQuestionScope.DOCUMENT_LIST:
                 if q_set.scope_document_ids:
                     doc_ids = [UUID(str(id)) for id in q_set.scope_document_ids]
-                    docs_to_process = db.query(Document).filter(Document.id.in_(doc_ids)).all()
+                    docs_to_process = db.execute(doc_columns.where(Document.id.in_(doc_ids))).all()
             
             if not docs_to_process:
                 q_set.status = DiscoveryQuestionSetStatus.FAILED
@@ -74,22 +149,33 @@ def generate_discovery_questions_task(question_set_id: UUID):
                 db.commit()
                 return
 
+            # End the read transaction so no connection is held while summarizing
+            db.commit()
+
             # Generate quick summaries for context
             # Limit to 5 docs to avoid context limit if too many
-            for doc in docs_to_process[:5]: 
+            def summarize(doc: Row) -> Optional[str]:
                 try:
                     summary, _ = answer_question(
-                        user_id=q_set.created_by_user_id,
-                        notebook_id=q_set.notebook_id,
+                        user_id=user_id,
+                        notebook_id=notebook_id,
                         question="Summarize this document for discovery analysis.",
                         history=[],
                         selected_document_ids=[doc.id],
                         mode="plan"
                     )
-                    context_text += f"Document: {doc.title}\nSummary: {summary}\n\n"
+                    return f"Document: {doc.title}\nSummary: {summary}\n\n"
                 except Exception as e:
                     logger.error(f"Failed to summarize doc {doc.id}: {e}")
+                    return None
+            
+            # The summaries are independent LLM calls, so run them side by side
+            with ThreadPoolExecutor(max_workers=MAX_CONTEXT_DOCUMENTS) as executor:
+                for part in executor.map(summarize, docs_to_process[:MAX_CONTEXT_DOCUMENTS]):
+                    if part:
+                        context_parts.append(part)
 
+        context_text = "".join(context_parts)[:MAX_CONTEXT_CHARS]
         if not context_text:
              q_set.status = DiscoveryQuestionSetStatus.FAILED
              q_set.error_message = "Failed to gather context from documents."
@@ -97,17 +183,15 @@ def generate_discovery_questions_task(question_set_id: UUID):
              return
 
         # 2. Generate Questions with Gemini
-        print("DEBUG: Calling Gemini to generate questions...", flush=True)
-        llm = ChatGoogleGenerativeAI(
-            model=settings.GEMINI_MODEL,
-            google_api_key=settings.GEMINI_API_KEY,
-            temperature=0.4
-        )
+        # As above, don't hold the summary-pack read open across the LLM call
+        db.commit()
+        logger.debug("Calling Gemini to generate questions...")
+        llm = get_llm()
 
         prompt = f"""
         You are a senior consultant. Based on the following project context, create a list of discovery questions to clarify gaps, assumptions, and risks.
         
-        Target Audience: {q_set.target_audience}
+        Target Audience: {target_audience}
         
         Context:
         {context_text}
@@ -145,76 +229,57 @@ def generate_discovery_questions_task(question_set_id: UUID):
                     new_content.append(str(item))
             content = "".join(new_content)
 
-        print(f"DEBUG: Raw Gemini content: {content!r}", flush=True)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Raw Gemini content: {content!r}")
         
-        # Parse JSON
-        questions_data = []
+        # Parse JSON (JSON mode returns the bare array; older models may wrap it
+        # in markdown fences or prose, so extract the array first)
         try:
-            # Clean up potential markdown code blocks
-            clean_content = content.strip()
-            if "```json" in clean_content:
-                clean_content = clean_content.split("```json")[1].split("```")[0].strip()
-            elif "```" in clean_content:
-                clean_content = clean_content.split("```")[1].split("```")[0].strip()
-            
-            # Fallback: Try to find the first [ and last ]
-            if not clean_content.startswith("["):
-                start_idx = clean_content.find("[")
-                end_idx = clean_content.rfind("]")
-                if start_idx != -1 and end_idx != -1:
-                    clean_content = clean_content[start_idx:end_idx+1]
-            
-            print(f"DEBUG: Cleaned content for JSON parsing: {clean_content!r}", flush=True)
-            questions_data = json.loads(clean_content)
-        except json.JSONDecodeError as e:
+            questions_data = GeneratedQuestions.model_validate_json(_extract_json_array(content)).root
+        except ValidationError as e:
             logger.error(f"Failed to parse JSON from Gemini: {e}")
-            print(f"DEBUG: JSON Parse Error: {e}", flush=True)
             q_set.status = DiscoveryQuestionSetStatus.FAILED
             q_set.error_message = f"Failed to parse generated questions: {e}"
             db.commit()
             return
 
         # 3. Save Questions
-        print(f"DEBUG: Saving {len(questions_data)} questions...", flush=True)
-        for q_data in questions_data:
-            # Map category and priority to enums (simple validation)
-            category = q_data.get("category", "other").lower()
-            if category not in ["requirements", "data", "architecture", "risks", "operations", "other"]:
-                category = "other"
-            
-            priority = q_data.get("priority", "medium").lower()
-            if priority not in ["low", "medium", "high"]:
-                priority = "medium"
-
+        logger.debug(f"Saving {len(questions_data)} questions...")
+        # Match related_document_name against the notebook's titles in Python
+        # rather than one ilike query per question
+        notebook_docs = db.execute(
+            select(Document.id, Document.title).where(Document.notebook_id == notebook_id)
+        ).all()
+        lowered_titles = [(doc_id, title.lower()) for doc_id, title in notebook_docs]
+        
+        question_rows = []
+        for question in questions_data:
             # Try to find related document by name
             related_doc_id = None
-            related_doc_name = q_data.get("related_document_name")
-            if related_doc_name:
+            if question.related_document_name:
                 # Simple case-insensitive match on title in the same notebook
-                doc = db.query(Document).filter(
-                    Document.notebook_id == q_set.notebook_id,
-                    Document.title.ilike(f"%{related_doc_name}%")
-                ).first()
-                if doc:
-                    related_doc_id = doc.id
-
-            new_q = DiscoveryQuestion(
-                question_set_id=q_set.id,
-                text=q_data.get("text", "Unknown Question"),
-                category=DiscoveryQuestionCategory(category),
-                priority=DiscoveryQuestionPriority(priority),
-                status=DiscoveryQuestionStatus.OPEN,
-                related_document_id=related_doc_id
-            )
-            db.add(new_q)
+                needle = question.related_document_name.lower()
+                related_doc_id = next((doc_id for doc_id, title in lowered_titles if needle in title), None)
+
+            question_rows.append({
+                "question_set_id": q_set.id,
+                "text": question.text,
+                "category": question.category,
+                "priority": question.priority,
+                "status": DiscoveryQuestionStatus.OPEN,
+                "related_document_id": related_doc_id
+            })
+        
+        # One multi-row INSERT instead of a flush per question
+        if question_rows:
+            db.execute(insert(DiscoveryQuestion), question_rows)
         
         q_set.status = DiscoveryQuestionSetStatus.DONE
         db.commit()
-        print("DEBUG: Discovery generation completed successfully", flush=True)
+        logger.debug("Discovery generation completed successfully")
 
     except Exception as e:
         logger.error(f"Discovery generation failed: {e}")
-        print(f"DEBUG: Discovery generation failed: {e}", flush=True)
         try:
             q_set.status = DiscoveryQuestionSetStatus.FAILED
             q_set.error_message = str(e)
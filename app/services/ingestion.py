@@ -1,23 +1,94 @@
 """Document ingestion service with background processing."""
 import asyncio
+import functools
 import logging
+import random
+import tempfile
+import time
+from urllib.parse import quote
 from uuid import UUID
-from typing import Optional
+from typing import BinaryIO, Dict, List, Optional, Set
+import orjson
+from anyio import from_thread
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 
+from app.database import SessionLocal
 from app.models import Document, DocumentStatus
 from app.config import settings
 from app.services.bedrock_client import start_ingestion_job, get_ingestion_job_status
+from app.services.job_tracker import (
+    add_pending_document, take_pending_documents, arm_ingestion_debounce,
+    wait_for_ingestion_debounce, claim_ingestion_slot, activate_ingestion_slot,
+    release_ingestion_slot, set_ingestion_job, set_ingestion_job_status, get_ingestion_job,
+    get_job_documents
+)
+from app.services.pptx_converter import convert_pptx_to_pdf
+from app.services.rag_service import warm_answer_cache
+from app.services.s3_client import delete_file_from_s3, download_file_from_s3, upload_file_to_s3
+from app.services.semantic_cache import invalidate_notebook, semantic_cache_enabled
 
 logger = logging.getLogger(__name__)
 
-# In-memory storage for ingestion job tracking
-# In production, use Redis or a proper job queue (Celery, RQ, etc.)
-ingestion_jobs: dict[UUID, str] = {}
+# Poller of the batch job currently running on each data source. Bedrock runs
+# one ingestion job per data source at a time, so the next batch waits for it.
+_active_batch_polls: Dict[str, asyncio.Task] = {}
 
-# Global flag to track if an ingestion job is pending/running
-pending_ingestion_task: Optional[asyncio.Task] = None
-ingestion_lock = asyncio.Lock()
+# The event loop only keeps weak references to tasks, so fire-and-forget
+# tasks are held here until they finish
+_background_tasks: Set[asyncio.Task] = set()
+
+# Uploads within this window of each other are batched into one job
+INGESTION_DEBOUNCE_SECONDS = 5
+
+# How often a batch re-checks for another worker's job on the data source
+ACTIVE_JOB_RECHECK_SECONDS = 10
+
+
+# Raw PPTX uploads wait here for a conversion worker, outside the users/
+# prefix that holds the knowledge base's documents
+PPTX_STAGING_PREFIX = "pptx-staging/"
+
+PPTX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+# Staged decks up to this size are downloaded into memory for conversion
+PPTX_SPOOL_MAX_SIZE = 16 * 1024 * 1024
+
+# Wall-clock budget for polling one ingestion job before giving up
+INGESTION_POLL_TIMEOUT_SECONDS = 3600
+INGESTION_POLL_MAX_DELAY_SECONDS = 60
+
+
+def _poll_delay(attempt: int) -> float:
+    """Exponential backoff with jitter between ingestion job status checks."""
+    return min(INGESTION_POLL_MAX_DELAY_SECONDS, (1.5 ** attempt) + random.uniform(0, 0.5))
+
+
+def _log_task_exception(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background task {task.get_name()} failed: {task.exception()!r}")
+
+
+def _start_background_task(coro) -> asyncio.Task:
+    """Run a coroutine as a task that is kept alive until it finishes.
+    
+    Nothing awaits the task, so an exception it raises is logged here.
+    """
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    task.add_done_callback(_log_task_exception)
+    return task
+
+
+def _ingestion_data_source_id() -> str:
+    """Data source that batch ingestion jobs run against."""
+    return settings.BEDROCK_DATA_SOURCE_ID or "default-data-source"
+
+# Bounded queue of pending uploads, drained by the workers started at app startup.
+# A full queue makes upload requests wait instead of piling up untracked tasks.
+ingestion_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.INGESTION_QUEUE_MAX_SIZE)
+ingestion_workers: List[asyncio.Task] = []
 
 
 async def trigger_ingestion(
@@ -27,7 +98,10 @@ async def trigger_ingestion(
     """Trigger ingestion for a document.
     
     Uses debouncing to prevent multiple simultaneous ingestion jobs.
-    Multiple uploads within 5 seconds will be batched into a single job.
+    Multiple uploads within 5 seconds are batched into a single job per data
+    source, and only that batch's documents are updated when it finishes.
+    With Redis configured the batch and debounce window are shared by all
+    API workers, so only one of them starts the job.
     
     Args:
         document: Document model instance
@@ -36,8 +110,6 @@ async def trigger_ingestion(
     Returns:
         True if ingestion was triggered successfully
     """
-    global pending_ingestion_task
-    
     try:
         # Check if AWS credentials are configured
         if not settings.AWS_ACCESS_KEY_ID or not settings.BEDROCK_KB_ID:
@@ -54,14 +126,15 @@ async def trigger_ingestion(
         document.error_message = None
         db.commit()
         
-        async with ingestion_lock:
-            # Cancel any pending ingestion task (we'll restart it with new delay)
-            if pending_ingestion_task and not pending_ingestion_task.done():
-                logger.info("New upload detected, resetting ingestion delay")
-                pending_ingestion_task.cancel()
-            
-            # Start new delayed ingestion task
-            pending_ingestion_task = asyncio.create_task(_delayed_ingestion())
+        data_source_id = _ingestion_data_source_id()
+        await add_pending_document(data_source_id, document.id)
+        
+        # Whichever upload (on any worker, with Redis) opens the window
+        # schedules the job; later uploads only push its deadline back
+        if await arm_ingestion_debounce(data_source_id, INGESTION_DEBOUNCE_SECONDS):
+            _start_background_task(_delayed_ingestion(data_source_id))
+        else:
+            logger.info("New upload detected, extending ingestion delay")
         
         logger.info(f"Document {document.id} queued for ingestion")
         return True
@@ -74,214 +147,635 @@ async def trigger_ingestion(
         return False
 
 
-async def _delayed_ingestion(delay_seconds: int = 5):
-    """Wait for delay, then trigger a single ingestion job for all pending documents.
+async def upload_and_ingest_task(
+    document_id: UUID,
+    file_content: Optional[BinaryIO],
+    s3_key: str,
+    content_type: Optional[str],
+    metadata_attributes: Dict[str, str]
+):
+    """Upload a document to S3 and trigger its ingestion.
+    
+    Runs in an ingestion worker after the upload response has been sent, so it
+    opens its own database session instead of reusing the request's one.
+    
+    Args:
+        document_id: Document UUID
+        file_content: Readable binary file object with the document content, or
+            None if the client already uploaded it via a presigned URL
+        s3_key: S3 object key for the document
+        content_type: MIME type of the document
+        metadata_attributes: Bedrock KB metadata attributes (user/notebook/document/filename)
+    """
+    
+    # Bedrock KB only reads filter attributes from the .metadata.json sidecar, so
+    # that file is still written, but in parallel with the document itself. The
+    # attributes also go on the object as S3 metadata (ASCII-only, hence quote).
+    metadata_upload = asyncio.to_thread(
+        upload_file_to_s3,
+        file_content=orjson.dumps({"metadataAttributes": metadata_attributes}),
+        s3_key=f"{s3_key}.metadata.json",
+        content_type='application/json'
+    )
+    
+    if file_content is None:
+        # Direct upload: the document is already in S3, only the sidecar is written
+        upload_success = True
+        await metadata_upload
+    else:
+        object_metadata = {key: quote(value) for key, value in metadata_attributes.items()}
+        try:
+            upload_success, _ = await asyncio.gather(
+                asyncio.to_thread(
+                    upload_file_to_s3,
+                    file_content=file_content,
+                    s3_key=s3_key,
+                    content_type=content_type,
+                    metadata=object_metadata
+                ),
+                metadata_upload
+            )
+        finally:
+            file_content.close()
+    
+    logger.info(f"S3 Upload Success: {upload_success}")
+    
+    db = SessionLocal()
+    try:
+        document = db.get(Document, document_id)
+        if not document:
+            logger.error(f"Document {document_id} not found after upload")
+            return
+        
+        if not upload_success:
+            logger.error(f"Upload failed for document {document_id}")
+            document.status = DocumentStatus.ERROR
+            document.error_message = "Failed to upload file to S3"
+            db.commit()
+            return
+        
+        await trigger_ingestion(document, db)
+    except Exception as e:
+        logger.error(f"Error uploading document {document_id}: {e}")
+    finally:
+        db.close()
+
+
+async def enqueue_document_upload(
+    document_id: UUID,
+    file_content: Optional[BinaryIO],
+    s3_key: str,
+    content_type: Optional[str],
+    metadata_attributes: Dict[str, str]
+):
+    """Queue a document for S3 upload and ingestion by the ingestion workers.
+    
+    Waits for a free slot when the queue is full.
+    """
+    await ingestion_queue.put({
+        "document_id": document_id,
+        "file_content": file_content,
+        "s3_key": s3_key,
+        "content_type": content_type,
+        "metadata_attributes": metadata_attributes,
+    })
+    logger.info(f"Document {document_id} added to ingestion queue ({ingestion_queue.qsize()} pending)")
+
+
+async def _ingestion_worker(worker_id: int):
+    """Consume queued uploads one at a time until cancelled."""
+    while True:
+        job = await ingestion_queue.get()
+        try:
+            await upload_and_ingest_task(**job)
+        except Exception as e:
+            logger.error(f"Ingestion worker {worker_id} failed on document {job['document_id']}: {e}")
+        finally:
+            ingestion_queue.task_done()
+
+
+def start_ingestion_workers(num_workers: int = settings.INGESTION_WORKERS):
+    """Start the ingestion worker tasks on the running event loop."""
+    for worker_id in range(num_workers):
+        ingestion_workers.append(asyncio.create_task(_ingestion_worker(worker_id)))
+    logger.info(f"Started {num_workers} ingestion workers")
+
+
+async def stop_ingestion_workers():
+    """Cancel the ingestion worker tasks and wait for them to exit."""
+    for worker in ingestion_workers:
+        worker.cancel()
+    await asyncio.gather(*ingestion_workers, return_exceptions=True)
+    ingestion_workers.clear()
+
+
+class IngestionStartError(Exception):
+    """Raised when Bedrock does not start an ingestion job (e.g. one is already running)."""
+
+
+def document_metadata_attributes(document: Document) -> Dict[str, str]:
+    """Build the Bedrock KB metadata attributes for a document."""
+    return {
+        "user_id": str(document.user_id),
+        "notebook_id": str(document.notebook_id),
+        "document_id": str(document.id),
+        "filename": document.original_filename
+    }
+
+
+def submit_document_upload(
+    document: Document,
+    db: Session,
+    file_content: Optional[BinaryIO],
+    content_type: Optional[str]
+):
+    """Hand a committed PENDING document off for S3 upload and ingestion.
+    
+    Called from sync endpoints running in the threadpool. By default the
+    upload is queued for the in-process ingestion workers. When a Celery
+    broker is configured, the file is uploaded here (it cannot cross process
+    boundaries) and ingestion is queued as a Celery task, whose ID is stored
+    on the document so it survives API restarts.
+    
+    Args:
+        document: Document model instance
+        db: Database session
+        file_content: Readable binary file object, or None if the document is
+            already in S3 (presigned direct upload)
+        content_type: MIME type of the document
+    """
+    if not settings.CELERY_BROKER_URL:
+        from_thread.run(functools.partial(
+            enqueue_document_upload,
+            document_id=document.id,
+            file_content=file_content,
+            s3_key=document.s3_key,
+            content_type=content_type,
+            metadata_attributes=document_metadata_attributes(document)
+        ))
+        return
+    
+    # Celery is an optional dependency, only imported when it is configured
+    from app.worker import ingest_document
+    
+    if file_content is not None:
+        object_metadata = {key: quote(value) for key, value in document_metadata_attributes(document).items()}
+        try:
+            upload_success = upload_file_to_s3(
+                file_content=file_content,
+                s3_key=document.s3_key,
+                content_type=content_type,
+                metadata=object_metadata
+            )
+        finally:
+            file_content.close()
+        
+        if not upload_success:
+            logger.error(f"Upload failed for document {document.id}")
+            document.status = DocumentStatus.ERROR
+            document.error_message = "Failed to upload file to S3"
+            db.commit()
+            return
+    
+    result = ingest_document.delay(str(document.id))
+    document.ingestion_task_id = result.id
+    db.commit()
+    logger.info(f"Document {document.id} queued for ingestion as task {result.id}")
+
+
+def pptx_conversion_queued() -> bool:
+    """Whether PPTX uploads are converted on Celery workers instead of in the API.
+    
+    The deck reaches the worker through S3, so both have to be configured.
+    """
+    return bool(settings.CELERY_BROKER_URL and settings.AWS_ACCESS_KEY_ID and settings.S3_BUCKET_NAME)
+
+
+def submit_pptx_conversion(document: Document, db: Session, file_content: BinaryIO):
+    """Stage a committed PENDING document's PPTX in S3 and queue its conversion.
+    
+    The conversion worker uploads the PDF to the document's S3 key and
+    queues its ingestion, so the API never runs LibreOffice or PowerPoint.
     
     Args:
-        delay_seconds: Seconds to wait before starting ingestion
+        document: Document model instance, whose s3_key is the PDF's key
+        db: Database session
+        file_content: Readable binary file object with the PPTX content
+    """
+    # Celery is an optional dependency, only imported when it is configured
+    from app.worker import convert_pptx_document
+    
+    staging_key = f"{PPTX_STAGING_PREFIX}{document.id}.pptx"
+    try:
+        upload_success = upload_file_to_s3(
+            file_content=file_content,
+            s3_key=staging_key,
+            content_type=PPTX_CONTENT_TYPE
+        )
+    finally:
+        file_content.close()
+    
+    if not upload_success:
+        logger.error(f"Upload failed for document {document.id}")
+        document.status = DocumentStatus.ERROR
+        document.error_message = "Failed to upload file to S3"
+        db.commit()
+        return
+    
+    result = convert_pptx_document.delay(str(document.id), staging_key)
+    document.ingestion_task_id = result.id
+    db.commit()
+    logger.info(f"Document {document.id} queued for PPTX conversion as task {result.id}")
+
+
+def run_pptx_conversion(document_id: UUID, source_s3_key: str):
+    """Convert a staged PPTX to PDF, then upload the PDF and queue its ingestion.
+    
+    Used by the Celery conversion workers. The staged PPTX is deleted once
+    the conversion has succeeded or failed for good.
+    """
+    
+    db = SessionLocal()
+    try:
+        document = db.get(Document, document_id)
+        if not document:
+            logger.error(f"Document {document_id} not found for PPTX conversion")
+            delete_file_from_s3(source_s3_key)
+            return
+        
+        # Small decks stay in memory, larger ones spill to disk
+        with tempfile.SpooledTemporaryFile(max_size=PPTX_SPOOL_MAX_SIZE) as pptx_file:
+            if not download_file_from_s3(source_s3_key, pptx_file):
+                document.status = DocumentStatus.ERROR
+                document.error_message = "Failed to download PPTX for conversion"
+                db.commit()
+                delete_file_from_s3(source_s3_key)
+                return
+            pptx_file.seek(0)
+            
+            try:
+                pdf_file, _ = convert_pptx_to_pdf(pptx_file, document.original_filename)
+            except Exception as e:
+                document.status = DocumentStatus.ERROR
+                document.error_message = f"Failed to convert PPTX to PDF: {e}"
+                db.commit()
+                delete_file_from_s3(source_s3_key)
+                return
+        
+        delete_file_from_s3(source_s3_key)
+        submit_document_upload(document, db, pdf_file, 'application/pdf')
+    finally:
+        db.close()
+
+
+def run_document_ingestion(document_id: UUID):
+    """Ingest one document that is already in S3, waiting for the job to finish.
+    
+    Used by the Celery worker. The document is queued on the data source's
+    shared pending set, and whichever task claims the ingestion slot starts
+    one job for everything queued, so concurrent tasks don't each start a
+    job that Bedrock would reject.
+    
+    Raises:
+        IngestionStartError: If another job holds the data source or Bedrock
+            did not start one, so the task can retry
+    """
+    
+    data_source_id = _ingestion_data_source_id()
+    
+    db = SessionLocal()
+    try:
+        document = db.get(Document, document_id)
+        if not document:
+            logger.error(f"Document {document_id} not found for ingestion")
+            return
+        
+        if document.status == DocumentStatus.PENDING:
+            # Sidecar file for Bedrock KB metadata filtering
+            upload_file_to_s3(
+                file_content=orjson.dumps({"metadataAttributes": document_metadata_attributes(document)}),
+                s3_key=f"{document.s3_key}.metadata.json",
+                content_type='application/json'
+            )
+            
+            if not settings.AWS_ACCESS_KEY_ID or not settings.BEDROCK_KB_ID:
+                logger.warning(f"AWS credentials not configured. Skipping Bedrock ingestion for document {document.id}")
+                document.status = DocumentStatus.READY
+                document.error_message = None
+                db.commit()
+                return
+            
+            document.status = DocumentStatus.INGESTING
+            document.error_message = None
+            db.commit()
+        elif document.status != DocumentStatus.INGESTING:
+            # A retry after another worker's job already ingested (or failed) it
+            logger.info(f"Document {document_id} is already {document.status.value}, skipping ingestion")
+            return
+    finally:
+        db.close()
+    
+    asyncio.run(_run_pending_ingestion(data_source_id, document_id))
+
+
+async def _run_pending_ingestion(data_source_id: str, document_id: UUID):
+    """Queue a document, then start and poll one job for the data source's pending documents.
+    
+    Raises:
+        IngestionStartError: If another job holds the data source or Bedrock did not start one
     """
-    global pending_ingestion_task
+    # Re-queued on retries too, unless a job already covers the document
+    if await get_ingestion_job(document_id) is None:
+        await add_pending_document(data_source_id, document_id)
+    
+    slot_token = await claim_ingestion_slot(data_source_id)
+    if slot_token is None:
+        raise IngestionStartError(f"An ingestion job is already running on data source {data_source_id}")
     
     try:
-        logger.info(f"Waiting {delay_seconds} seconds for more uploads...")
-        await asyncio.sleep(delay_seconds)
+        document_ids = await take_pending_documents(data_source_id)
+        if not document_ids:
+            # Another worker's job already picked the document up
+            return
         
-        logger.info("Starting batch ingestion job...")
+        logger.info(f"Starting batch ingestion job for {len(document_ids)} documents...")
+        ingestion_job_id = await asyncio.to_thread(
+            start_ingestion_job,
+            knowledge_base_id=settings.BEDROCK_KB_ID,
+            data_source_id=data_source_id
+        )
+        if not ingestion_job_id:
+            # Leave the batch queued for the retry (or whichever task claims the slot next)
+            for pending_id in document_ids:
+                await add_pending_document(data_source_id, pending_id)
+            raise IngestionStartError(f"Bedrock did not start an ingestion job for {len(document_ids)} documents")
+        
+        # The poller releases the slot once the job has finished
+        await activate_ingestion_slot(data_source_id, slot_token, ingestion_job_id)
+        slot_token = None
+    finally:
+        if slot_token:
+            await release_ingestion_slot(data_source_id, slot_token)
+    
+    # The answer cache is per process, so the API's can't be refreshed from here
+    await _poll_batch_ingestion_status(ingestion_job_id, data_source_id, document_ids, refresh_answer_cache=False)
+
+
+def mark_document_error(document_id: UUID, error_message: str):
+    """Mark a document as failed from outside a request (e.g. after task retries run out)."""
+    
+    db = SessionLocal()
+    try:
+        document = db.get(Document, document_id)
+        if document:
+            document.status = DocumentStatus.ERROR
+            document.error_message = error_message
+            db.commit()
+    finally:
+        db.close()
+
+
+async def _start_batch_ingestion(data_source_id: str, slot_token: str):
+    """Start one ingestion job for the data source's pending documents and track it.
+    
+    Args:
+        data_source_id: Data source whose pending documents are ingested
+        slot_token: Claimed ingestion slot, released here unless the job takes it over
+    """
+    try:
+        document_ids = await take_pending_documents(data_source_id)
+        if not document_ids:
+            return
         
-        # Trigger a single ingestion job for the entire data source
-        data_source_id = settings.BEDROCK_DATA_SOURCE_ID if hasattr(settings, 'BEDROCK_DATA_SOURCE_ID') else "default-data-source"
+        logger.info(f"Starting batch ingestion job for {len(document_ids)} documents...")
         
-        ingestion_job_id = start_ingestion_job(
+        # Trigger a single ingestion job for the entire data source. boto3 is
+        # blocking, so Bedrock calls run in a thread off the event loop.
+        ingestion_job_id = await asyncio.to_thread(
+            start_ingestion_job,
             knowledge_base_id=settings.BEDROCK_KB_ID,
             data_source_id=data_source_id
         )
         
         if not ingestion_job_id:
+            _mark_documents_error(document_ids, "Failed to start ingestion job")
             raise Exception("Failed to start batch ingestion job")
         
-        # Start background polling task
-        asyncio.create_task(_poll_batch_ingestion_status(ingestion_job_id, data_source_id))
+        # Whoever sees the job finish releases the slot
+        await activate_ingestion_slot(data_source_id, slot_token, ingestion_job_id)
+        slot_token = None
+        
+        if settings.INGESTION_EVENTS_QUEUE_URL:
+            # Completion arrives as an EventBridge event (see ingestion_events)
+            await set_ingestion_job(document_ids, ingestion_job_id, DocumentStatus.INGESTING.value)
+        else:
+            # Start background polling task
+            _active_batch_polls[data_source_id] = asyncio.create_task(
+                _poll_batch_ingestion_status(ingestion_job_id, data_source_id, document_ids)
+            )
         
         logger.info(f"Batch ingestion job started: {ingestion_job_id}")
         
-    except asyncio.CancelledError:
-        logger.info("Ingestion delay cancelled (new upload detected)")
-        raise
+    except Exception as e:
+        logger.error(f"Error starting batch ingestion: {e}")
+    finally:
+        if slot_token:
+            await release_ingestion_slot(data_source_id, slot_token)
+
+
+async def _delayed_ingestion(data_source_id: str):
+    """Wait out the debounce window, then trigger a single ingestion job for the data source's pending documents.
+    
+    Args:
+        data_source_id: Data source whose pending documents are ingested
+    """
+    try:
+        logger.info("Waiting for more uploads...")
+        await wait_for_ingestion_debounce(data_source_id)
+        
+        # A job still running on this data source would make Bedrock reject a
+        # new one; wait for it (shielded, so cancelling this task doesn't cancel it)
+        active_poll = _active_batch_polls.get(data_source_id)
+        if active_poll and not active_poll.done():
+            logger.info("Waiting for the running ingestion job to finish...")
+            await asyncio.shield(active_poll)
+        
+        # Same for a job started by another API worker
+        while (slot_token := await claim_ingestion_slot(data_source_id)) is None:
+            await asyncio.sleep(ACTIVE_JOB_RECHECK_SECONDS)
+        
+        # Cancellation (e.g. at shutdown) from here on must not drop a started
+        # job, so the rest runs shielded and owns the slot
+        await asyncio.shield(_start_batch_ingestion(data_source_id, slot_token))
+        
     except Exception as e:
         logger.error(f"Error in delayed ingestion: {e}")
+
+
+def _apply_batch_result(
+    db: Session,
+    document_ids: Set[UUID],
+    status: DocumentStatus,
+    error_message: Optional[str] = None
+) -> int:
+    """Move a batch's INGESTING documents to READY or ERROR and commit.
+    
+    Issued as one UPDATE statement, so no Document rows are loaded or
+    tracked by the session.
+    
+    Returns:
+        Number of documents updated
+    """
+    result = db.execute(
+        update(Document)
+        .where(
+            Document.id.in_(document_ids),
+            Document.status == DocumentStatus.INGESTING
+        )
+        .values(status=status, error_message=error_message)
+        .execution_options(synchronize_session=False)
+    )
+    
+    db.commit()
+    return result.rowcount
+
+
+def _refresh_answer_caches(document_ids: Set[UUID]):
+    """Drop cached answers for the notebooks of newly ingested documents, then re-warm them.
+    
+    Answers cached while the documents were ingesting don't cover them.
+    Blocking, so it runs in a thread.
+    """
+    if not semantic_cache_enabled():
+        return
+    
+    db = SessionLocal()
+    try:
+        notebooks = db.execute(
+            select(Document.user_id, Document.notebook_id)
+            .where(Document.id.in_(document_ids))
+            .distinct()
+        ).all()
+    finally:
+        db.close()
+    
+    for user_id, notebook_id in notebooks:
+        invalidate_notebook(notebook_id)
+        warm_answer_cache(user_id, notebook_id)
+
+
+def _mark_documents_error(document_ids: Set[UUID], error_message: str):
+    """Mark a batch's INGESTING documents as failed."""
+    db = SessionLocal()
+    try:
+        _apply_batch_result(db, document_ids, DocumentStatus.ERROR, error_message)
     finally:
-        pending_ingestion_task = None
+        db.close()
+
+
+async def finish_ingestion_job(
+    ingestion_job_id: str,
+    data_source_id: str,
+    succeeded: bool,
+    error_message: Optional[str] = None
+):
+    """Apply a finished job's outcome to the documents it covered.
+    
+    Used when completion is reported by an event rather than found by polling.
+    """
+    document_ids = await get_job_documents(ingestion_job_id)
+    if document_ids:
+        status = DocumentStatus.READY if succeeded else DocumentStatus.ERROR
+        db = SessionLocal()
+        try:
+            updated = _apply_batch_result(
+                db,
+                document_ids,
+                status,
+                None if succeeded else f"Batch ingestion failed: {error_message or 'Unknown error'}"
+            )
+        finally:
+            db.close()
+        logger.info(f"Ingestion job {ingestion_job_id} finished ({status.value}). Updated {updated} documents.")
+        await set_ingestion_job_status(document_ids, ingestion_job_id, status.value)
+        if succeeded:
+            _start_background_task(asyncio.to_thread(_refresh_answer_caches, document_ids))
+    else:
+        logger.info(f"Ingestion job {ingestion_job_id} finished; no tracked documents")
+    
+    await release_ingestion_slot(data_source_id, ingestion_job_id)
 
 
 async def _poll_batch_ingestion_status(
     ingestion_job_id: str,
     data_source_id: str,
-    max_attempts: int = 60,
-    poll_interval: int = 10
+    document_ids: Set[UUID],
+    timeout_seconds: float = INGESTION_POLL_TIMEOUT_SECONDS,
+    refresh_answer_cache: bool = True
 ):
-    """Poll batch ingestion job status and update all INGESTING documents.
+    """Poll batch ingestion job status and update the INGESTING documents it covers.
     
     Args:
         ingestion_job_id: Bedrock ingestion job ID
         data_source_id: Data source ID
-        max_attempts: Maximum number of polling attempts
-        poll_interval: Seconds between polls
+        document_ids: Documents submitted with this job
+        timeout_seconds: Seconds to keep polling before marking the batch as timed out
+        refresh_answer_cache: Refresh this process's answer cache once the batch is ready
     """
-    from app.database import SessionLocal
     
     db = SessionLocal()
+    deadline = time.monotonic() + timeout_seconds
+    final_status = DocumentStatus.ERROR
     
     try:
-        for attempt in range(max_attempts):
-            await asyncio.sleep(poll_interval)
+        await set_ingestion_job(document_ids, ingestion_job_id, DocumentStatus.INGESTING.value)
+        
+        attempt = 0
+        while time.monotonic() < deadline:
+            await asyncio.sleep(_poll_delay(attempt))
+            attempt += 1
             
-            status_info = get_ingestion_job_status(
+            status_info = await asyncio.to_thread(
+                get_ingestion_job_status,
                 knowledge_base_id=settings.BEDROCK_KB_ID,
                 data_source_id=data_source_id,
                 ingestion_job_id=ingestion_job_id
             )
             
             status = status_info['status']
-            logger.info(f"Batch ingestion job {ingestion_job_id} status (attempt {attempt + 1}/{max_attempts}): {status}")
+            logger.info(f"Batch ingestion job {ingestion_job_id} status (attempt {attempt}): {status}")
             
             if status == 'COMPLETE':
-                # Update all INGESTING documents to READY
-                ingesting_docs = db.query(Document).filter(
-                    Document.status == DocumentStatus.INGESTING
-                ).all()
-                
-                for doc in ingesting_docs:
-                    doc.status = DocumentStatus.READY
-                    doc.error_message = None
-                    logger.info(f"Document {doc.id} marked as READY (batch job complete)")
-                
-                db.commit()
-                logger.info(f"Batch ingestion complete. Updated {len(ingesting_docs)} documents.")
+                # Update this batch's INGESTING documents to READY
+                updated = _apply_batch_result(db, document_ids, DocumentStatus.READY)
+                final_status = DocumentStatus.READY
+                logger.info(f"Batch ingestion complete. Updated {updated} documents.")
+                if refresh_answer_cache:
+                    _start_background_task(asyncio.to_thread(_refresh_answer_caches, document_ids))
                 return
             
             elif status == 'FAILED':
                 error_msg = status_info.get('error_message', 'Unknown error')
                 logger.error(f"Batch ingestion job failed: {error_msg}")
                 
-                # Update all INGESTING documents to ERROR
-                ingesting_docs = db.query(Document).filter(
-                    Document.status == DocumentStatus.INGESTING
-                ).all()
-                
-                for doc in ingesting_docs:
-                    doc.status = DocumentStatus.ERROR
-                    doc.error_message = f"Batch ingestion failed: {error_msg}"
-                
-                db.commit()
+                # Update this batch's INGESTING documents to ERROR
+                _apply_batch_result(db, document_ids, DocumentStatus.ERROR, f"Batch ingestion failed: {error_msg}")
                 return
         
-        # Max attempts reached
-        logger.error(f"Batch ingestion polling timeout after {max_attempts} attempts")
-        ingesting_docs = db.query(Document).filter(
-            Document.status == DocumentStatus.INGESTING
-        ).all()
-        
-        for doc in ingesting_docs:
-            doc.status = DocumentStatus.ERROR
-            doc.error_message = "Ingestion timeout"
-
-        
-        db.commit()
+        # Polling budget exhausted
+        logger.error(f"Batch ingestion polling timeout after {attempt} attempts")
+        _apply_batch_result(db, document_ids, DocumentStatus.ERROR, "Ingestion timeout")
         
     except Exception as e:
         logger.error(f"Error polling batch ingestion status: {e}")
     finally:
         db.close()
+        await set_ingestion_job_status(document_ids, ingestion_job_id, final_status.value)
+        await release_ingestion_slot(data_source_id, ingestion_job_id)
 
 
 
-async def poll_ingestion_status(
-    document_id: UUID,
-    ingestion_job_id: str,
-    data_source_id: str,
-    max_attempts: int = 60,
-    poll_interval: int = 10
-):
-    """Poll ingestion job status until complete or failed.
-    
-    Args:
-        document_id: Document UUID
-        ingestion_job_id: Bedrock ingestion job ID
-        data_source_id: Data source ID
-        max_attempts: Maximum number of polling attempts
-        poll_interval: Seconds between polls
-    """
-    from app.database import SessionLocal
-    
-    attempts = 0
-    
-    while attempts < max_attempts:
-        attempts += 1
-        await asyncio.sleep(poll_interval)
-        
-        # Get job status
-        status_info = get_ingestion_job_status(
-            knowledge_base_id=settings.BEDROCK_KB_ID,
-            data_source_id=data_source_id,
-            ingestion_job_id=ingestion_job_id
-        )
-        
-        status = status_info['status']
-        
-        # Update document status in database
-        db = SessionLocal()
-        try:
-            document = db.query(Document).filter(Document.id == document_id).first()
-            if not document:
-                logger.error(f"Document {document_id} not found during polling")
-                break
-            
-            if status == 'COMPLETE':
-                document.status = DocumentStatus.READY
-                document.error_message = None
-                db.commit()
-                logger.info(f"Document {document_id} ingestion completed successfully")
-                break
-            
-            elif status == 'FAILED' or status == 'ERROR':
-                document.status = DocumentStatus.ERROR
-                document.error_message = status_info.get('error_message', 'Ingestion failed')
-                db.commit()
-                logger.error(f"Document {document_id} ingestion failed: {document.error_message}")
-                break
-            
-            elif status in ['STARTING', 'IN_PROGRESS']:
-                # Continue polling
-                logger.debug(f"Document {document_id} ingestion in progress (attempt {attempts}/{max_attempts})")
-                continue
-            
-            else:
-                # Unknown status
-                logger.warning(f"Unknown ingestion status for document {document_id}: {status}")
-                continue
-                
-        finally:
-            db.close()
-    
-    # If max attempts reached
-    if attempts >= max_attempts:
-        db = SessionLocal()
-        try:
-            document = db.query(Document).filter(Document.id == document_id).first()
-            if document and document.status == DocumentStatus.INGESTING:
-                document.status = DocumentStatus.ERROR
-                document.error_message = "Ingestion timeout - exceeded maximum polling attempts"
-                db.commit()
-                logger.error(f"Document {document_id} ingestion timed out")
-        finally:
-            db.close()
-    
-    # Clean up job tracking
-    if document_id in ingestion_jobs:
-        del ingestion_jobs[document_id]
-
-
-def get_ingestion_job_id(document_id: UUID) -> Optional[str]:
+async def get_ingestion_job_id(document_id: UUID) -> Optional[str]:
     """Get the ingestion job ID for a document.
     
     Args:
@@ -290,4 +784,4 @@ def get_ingestion_job_id(document_id: UUID) -> Optional[str]:
     Returns:
         Ingestion job ID or None
     """
-    return ingestion_jobs.get(document_id)
+    return await get_ingestion_job(document_id)
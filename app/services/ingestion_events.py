@@ -0,0 +1,135 @@
+"""Bedrock ingestion job completion events.
+
+An EventBridge rule forwards the Knowledge Base's ingestion job state changes
+to the SQS queue at INGESTION_EVENTS_QUEUE_URL. Consuming it replaces polling
+GetIngestionJob for jobs started by the API.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+import boto3
+import orjson
+
+from app.config import settings
+from app.services.ingestion import _ingestion_data_source_id, finish_ingestion_job
+
+logger = logging.getLogger(__name__)
+
+# SQS long polling holds a receive open for up to 20 seconds
+RECEIVE_WAIT_SECONDS = 20
+RECEIVE_MAX_MESSAGES = 10
+
+# Back off after a failed receive instead of spinning
+RECEIVE_ERROR_DELAY_SECONDS = 5
+
+FINISHED_STATUSES = {"COMPLETE", "FAILED", "STOPPED"}
+
+_sqs_client = None
+_consumer_task: Optional[asyncio.Task] = None
+
+
+def get_sqs_client():
+    """Get or create SQS client."""
+    global _sqs_client
+    if _sqs_client is None:
+        _sqs_client = boto3.client(
+            'sqs',
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            aws_session_token=settings.AWS_SESSION_TOKEN,
+            region_name=settings.AWS_REGION
+        )
+    return _sqs_client
+
+
+def _parse_event(body: str) -> Optional[Dict[str, Any]]:
+    """Extract the job ID, status, data source and failure reasons from an event."""
+    detail = orjson.loads(body).get("detail") or {}
+    # Some event versions nest the job under ingestionJob
+    job = detail.get("ingestionJob") or detail
+    ingestion_job_id = job.get("ingestionJobId")
+    status = job.get("status") or job.get("state")
+    if not ingestion_job_id or not status:
+        return None
+    return {
+        "ingestion_job_id": ingestion_job_id,
+        "status": status.upper(),
+        "data_source_id": job.get("dataSourceId") or _ingestion_data_source_id(),
+        "failure_reasons": job.get("failureReasons") or []
+    }
+
+
+async def _handle_message(message: Dict[str, Any]):
+    event = _parse_event(message["Body"])
+    if event is None or event["status"] not in FINISHED_STATUSES:
+        return
+    
+    succeeded = event["status"] == "COMPLETE"
+    logger.info(f"Ingestion job {event['ingestion_job_id']} reported {event['status']}")
+    await finish_ingestion_job(
+        event["ingestion_job_id"],
+        event["data_source_id"],
+        succeeded,
+        None if succeeded else ", ".join(event["failure_reasons"]) or event["status"]
+    )
+
+
+async def consume_ingestion_events():
+    """Receive ingestion job events until cancelled."""
+    client = get_sqs_client()
+    queue_url = settings.INGESTION_EVENTS_QUEUE_URL
+    
+    while True:
+        try:
+            response = await asyncio.to_thread(
+                client.receive_message,
+                QueueUrl=queue_url,
+                MaxNumberOfMessages=RECEIVE_MAX_MESSAGES,
+                WaitTimeSeconds=RECEIVE_WAIT_SECONDS
+            )
+        except Exception as e:
+            logger.error(f"Failed to receive ingestion events: {e}")
+            await asyncio.sleep(RECEIVE_ERROR_DELAY_SECONDS)
+            continue
+        
+        for message in response.get("Messages", []):
+            try:
+                await _handle_message(message)
+            except Exception as e:
+                # Left on the queue; SQS redelivers it after the visibility timeout
+                logger.error(f"Failed to handle ingestion event {message.get('MessageId')}: {e}")
+                continue
+            
+            try:
+                await asyncio.to_thread(
+                    client.delete_message,
+                    QueueUrl=queue_url,
+                    ReceiptHandle=message["ReceiptHandle"]
+                )
+            except Exception as e:
+                logger.warning(f"Failed to delete ingestion event {message.get('MessageId')}: {e}")
+
+
+def start_ingestion_event_consumer():
+    """Start consuming ingestion events, if a queue is configured."""
+    global _consumer_task
+    if not settings.INGESTION_EVENTS_QUEUE_URL:
+        return
+    if not settings.REDIS_URL:
+        # Without Redis the job's slot and documents live in the starting
+        # worker's memory with no expiry, so an event that is lost or lands
+        # on another worker would leave the data source blocked for good
+        raise RuntimeError("INGESTION_EVENTS_QUEUE_URL requires REDIS_URL")
+    _consumer_task = asyncio.create_task(consume_ingestion_events())
+    logger.info("Started ingestion event consumer")
+
+
+async def stop_ingestion_event_consumer():
+    """Cancel the ingestion event consumer and wait for it to exit."""
+    global _consumer_task
+    if _consumer_task is None:
+        return
+    _consumer_task.cancel()
+    await asyncio.gather(_consumer_task, return_exceptions=True)
+    _consumer_task = None
@@ -0,0 +1,306 @@
+"""Coordination and tracking of Bedrock ingestion jobs.
+
+With REDIS_URL set, state lives in Redis so every API and Celery worker
+shares it and it survives restarts:
+
+- jobs:ingestion:{data_source_id}:pending   set of document IDs awaiting a job
+- jobs:ingestion:{data_source_id}:debounce  debounce window, pushed back per upload
+- jobs:ingestion:{data_source_id}:active    the data source's running job
+- job:{document_id}                         JobInfo hash (TTL 86400)
+- job:{ingestion_job_id}:documents          documents the job covers (TTL 86400)
+
+Status transitions are published on the job_updates channel. Without Redis,
+the same state is kept in process memory.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Set
+from uuid import UUID
+
+import orjson
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Job info outlives the polling budget so clients can still read the outcome
+JOB_INFO_TTL_SECONDS = 86400
+
+# The active-job marker expires on its own if its worker dies mid-poll
+ACTIVE_JOB_TTL_SECONDS = 3600 + 600
+
+JOB_UPDATES_CHANNEL = "job_updates"
+
+# Compare-and-delete, so a worker only releases the marker it holds
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+@dataclass(slots=True)
+class JobInfo:
+    """Ingestion state of one document."""
+    status: str
+    started_at: float
+    ingestion_job_id: str
+
+
+# In-memory fallback when Redis is not configured
+_local_jobs: Dict[UUID, JobInfo] = {}
+_local_job_documents: Dict[str, Set[UUID]] = {}
+_local_pending: Dict[str, Set[UUID]] = {}
+_local_active: Dict[str, str] = {}
+_local_debounce_deadlines: Dict[str, float] = {}
+
+# Redis client, bound to the event loop it was created on
+_redis_client = None
+_redis_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def redis_enabled() -> bool:
+    """Whether ingestion state is shared through Redis."""
+    return bool(settings.REDIS_URL)
+
+
+def get_redis_client():
+    """Get or create the Redis client for the running event loop."""
+    global _redis_client, _redis_client_loop
+    if not settings.REDIS_URL:
+        return None
+
+    # Celery tasks run each job in a fresh asyncio.run loop, and redis.asyncio
+    # connections cannot be shared across loops
+    loop = asyncio.get_running_loop()
+    if _redis_client is None or _redis_client_loop is not loop:
+        # redis is an optional dependency, only imported when it is configured
+        import redis.asyncio as redis
+
+        _redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        _redis_client_loop = loop
+    return _redis_client
+
+
+def _pending_key(data_source_id: str) -> str:
+    return f"jobs:ingestion:{data_source_id}:pending"
+
+
+def _debounce_key(data_source_id: str) -> str:
+    return f"jobs:ingestion:{data_source_id}:debounce"
+
+
+def _active_key(data_source_id: str) -> str:
+    return f"jobs:ingestion:{data_source_id}:active"
+
+
+def _job_key(document_id: UUID) -> str:
+    return f"job:{document_id}"
+
+
+def _job_documents_key(ingestion_job_id: str) -> str:
+    return f"job:{ingestion_job_id}:documents"
+
+
+async def add_pending_document(data_source_id: str, document_id: UUID):
+    """Queue a document for the data source's next ingestion job."""
+    client = get_redis_client()
+    if client is None:
+        _local_pending.setdefault(data_source_id, set()).add(document_id)
+        return
+    await client.sadd(_pending_key(data_source_id), str(document_id))
+
+
+async def take_pending_documents(data_source_id: str) -> Set[UUID]:
+    """Atomically remove and return the documents queued for a data source."""
+    client = get_redis_client()
+    if client is None:
+        return _local_pending.pop(data_source_id, set())
+
+    async with client.pipeline(transaction=True) as pipe:
+        pipe.smembers(_pending_key(data_source_id))
+        pipe.delete(_pending_key(data_source_id))
+        members, _ = await pipe.execute()
+    return {UUID(member) for member in members}
+
+
+async def arm_ingestion_debounce(data_source_id: str, delay_seconds: float) -> bool:
+    """Open or extend the debounce window for a data source.
+
+    Returns:
+        True if this call opened the window, so the caller schedules the job
+    """
+    client = get_redis_client()
+    if client is None:
+        now = time.monotonic()
+        opened = _local_debounce_deadlines.get(data_source_id, 0.0) <= now
+        _local_debounce_deadlines[data_source_id] = now + delay_seconds
+        return opened
+
+    delay_ms = int(delay_seconds * 1000)
+    if await client.set(_debounce_key(data_source_id), "1", nx=True, px=delay_ms):
+        return True
+    # Another worker owns the window; push its deadline back instead
+    if not await client.pexpire(_debounce_key(data_source_id), delay_ms):
+        # The window closed in between; open a new one
+        return bool(await client.set(_debounce_key(data_source_id), "1", nx=True, px=delay_ms))
+    return False
+
+
+async def wait_for_ingestion_debounce(data_source_id: str):
+    """Sleep until no upload has re-armed the debounce window."""
+    client = get_redis_client()
+    if client is None:
+        while (remaining := _local_debounce_deadlines.get(data_source_id, 0.0) - time.monotonic()) > 0:
+            await asyncio.sleep(remaining)
+        return
+
+    while True:
+        remaining_ms = await client.pttl(_debounce_key(data_source_id))
+        if remaining_ms <= 0:
+            return
+        await asyncio.sleep(remaining_ms / 1000)
+
+
+async def claim_ingestion_slot(data_source_id: str) -> Optional[str]:
+    """Reserve the data source for a new ingestion job across all workers.
+
+    Returns:
+        A token to pass to activate/release, or None if another job on the
+        data source is still running
+    """
+    client = get_redis_client()
+    token = uuid.uuid4().hex
+    if client is None:
+        if data_source_id in _local_active:
+            return None
+        _local_active[data_source_id] = token
+        return token
+    if await client.set(_active_key(data_source_id), token, nx=True, ex=ACTIVE_JOB_TTL_SECONDS):
+        return token
+    return None
+
+
+async def activate_ingestion_slot(data_source_id: str, token: str, ingestion_job_id: str):
+    """Hand a claimed slot over to the started job, which releases it when done."""
+    client = get_redis_client()
+    if client is None:
+        if _local_active.get(data_source_id) == token:
+            _local_active[data_source_id] = ingestion_job_id
+        return
+    if await client.get(_active_key(data_source_id)) == token:
+        await client.set(_active_key(data_source_id), ingestion_job_id, ex=ACTIVE_JOB_TTL_SECONDS)
+
+
+async def release_ingestion_slot(data_source_id: str, holder: str):
+    """Free the data source, if the slot is still held by this token or job ID."""
+    client = get_redis_client()
+    if client is None:
+        if _local_active.get(data_source_id) == holder:
+            del _local_active[data_source_id]
+        return
+    try:
+        await client.eval(_RELEASE_SCRIPT, 1, _active_key(data_source_id), holder)
+    except Exception as e:
+        # The marker's TTL frees the slot eventually
+        logger.warning(f"Failed to release ingestion slot for {data_source_id}: {e}")
+
+
+async def _publish_job_update(client, document_ids: Iterable[UUID], status: str, ingestion_job_id: str):
+    for document_id in document_ids:
+        await client.publish(JOB_UPDATES_CHANNEL, orjson.dumps({
+            "document_id": str(document_id),
+            "status": status,
+            "ingestion_job_id": ingestion_job_id
+        }))
+
+
+async def set_ingestion_job(document_ids: Iterable[UUID], ingestion_job_id: str, status: str):
+    """Record the ingestion job submitted for a batch of documents."""
+    document_ids = list(document_ids)
+    started_at = time.time()
+    client = get_redis_client()
+    if client is None:
+        for document_id in document_ids:
+            _local_jobs[document_id] = JobInfo(status=status, started_at=started_at, ingestion_job_id=ingestion_job_id)
+        _local_job_documents[ingestion_job_id] = set(document_ids)
+        return
+
+    try:
+        async with client.pipeline(transaction=False) as pipe:
+            for document_id in document_ids:
+                pipe.hset(_job_key(document_id), mapping={
+                    "status": status,
+                    "started_at": started_at,
+                    "ingestion_job_id": ingestion_job_id
+                })
+                pipe.expire(_job_key(document_id), JOB_INFO_TTL_SECONDS)
+            if document_ids:
+                pipe.sadd(_job_documents_key(ingestion_job_id), *(str(document_id) for document_id in document_ids))
+                pipe.expire(_job_documents_key(ingestion_job_id), JOB_INFO_TTL_SECONDS)
+            await pipe.execute()
+        await _publish_job_update(client, document_ids, status, ingestion_job_id)
+    except Exception as e:
+        # Tracking is best-effort; polling the job doesn't depend on it
+        logger.warning(f"Failed to record ingestion job {ingestion_job_id}: {e}")
+
+
+async def set_ingestion_job_status(document_ids: Iterable[UUID], ingestion_job_id: str, status: str):
+    """Record a batch's final status, unless a document has since moved to a newer job."""
+    document_ids = list(document_ids)
+    client = get_redis_client()
+    if client is None:
+        # Only in-flight jobs are kept in memory; finished ones are dropped
+        for document_id in document_ids:
+            job_info = _local_jobs.get(document_id)
+            if job_info and job_info.ingestion_job_id == ingestion_job_id:
+                del _local_jobs[document_id]
+        _local_job_documents.pop(ingestion_job_id, None)
+        return
+
+    try:
+        current = []
+        for document_id in document_ids:
+            if await client.hget(_job_key(document_id), "ingestion_job_id") == ingestion_job_id:
+                await client.hset(_job_key(document_id), "status", status)
+                current.append(document_id)
+        await _publish_job_update(client, current, status, ingestion_job_id)
+    except Exception as e:
+        logger.warning(f"Failed to update ingestion job {ingestion_job_id}: {e}")
+
+
+async def get_job_info(document_id: UUID) -> Optional[JobInfo]:
+    """Get the ingestion state of a document, or None if it isn't tracked."""
+    client = get_redis_client()
+    if client is None:
+        return _local_jobs.get(document_id)
+
+    fields = await client.hgetall(_job_key(document_id))
+    if not fields:
+        return None
+    return JobInfo(
+        status=fields["status"],
+        started_at=float(fields["started_at"]),
+        ingestion_job_id=fields["ingestion_job_id"]
+    )
+
+
+async def get_ingestion_job(document_id: UUID) -> Optional[str]:
+    """Get the ingestion job covering a document, or None."""
+    client = get_redis_client()
+    if client is None:
+        job_info = _local_jobs.get(document_id)
+        return job_info.ingestion_job_id if job_info else None
+    return await client.hget(_job_key(document_id), "ingestion_job_id")
+
+
+async def get_job_documents(ingestion_job_id: str) -> Set[UUID]:
+    """Get the documents submitted with an ingestion job."""
+    client = get_redis_client()
+    if client is None:
+        return set(_local_job_documents.get(ingestion_job_id, ()))
+    return {UUID(member) for member in await client.smembers(_job_documents_key(ingestion_job_id))}
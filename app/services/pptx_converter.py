@@ -1,77 +1,218 @@
-"""PPTX to PDF conversion service using PowerPoint COM automation."""
+"""PPTX to PDF conversion service.
+
+Uses headless LibreOffice when soffice is installed, otherwise PowerPoint COM
+automation (Windows). Both keep their startup cost out of the request path:
+LibreOffice runs on warm per-slot profiles, PowerPoint stays open between
+conversions on a thread that owns it.
+"""
+import importlib.util
 import os
 import logging
+import queue
+import shutil
+import subprocess
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import BinaryIO, Optional
+
+from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Give up on a conversion that hangs (e.g. a corrupt deck)
+CONVERSION_TIMEOUT_SECONDS = 300
+
+SOFFICE_PATH = shutil.which("soffice") or shutil.which("libreoffice")
+
+# tmpfs, so the deck and PDF never touch the disk (Linux)
+SHM_DIR = "/dev/shm"
+
+# Headroom required on tmpfs per byte of input (the deck, the PDF and slack)
+SHM_SPACE_FACTOR = 4
+
+# LibreOffice instances sharing a user profile block each other, so each
+# concurrent conversion slot gets its own; they persist so later runs start warm
+_libreoffice_profiles: Optional[queue.Queue] = None
+
+# PowerPoint is single-threaded COM, so one thread owns a long-lived instance
+# and conversions queue up behind it
+_powerpoint_executor: Optional[ThreadPoolExecutor] = None
+_powerpoint = None
+
+
+def _get_libreoffice_profiles() -> queue.Queue:
+    global _libreoffice_profiles
+    if _libreoffice_profiles is None:
+        profiles = queue.Queue()
+        for slot in range(settings.PPTX_CONVERSION_WORKERS):
+            profiles.put(Path(tempfile.gettempdir(), f"pptx_converter_profile_{slot}").as_uri())
+        _libreoffice_profiles = profiles
+    return _libreoffice_profiles
+
+
+def _convert_with_libreoffice(pptx_path: str, output_dir: str) -> str:
+    """Convert with headless LibreOffice, waiting for a free profile slot."""
+    profiles = _get_libreoffice_profiles()
+    profile = profiles.get()
+    try:
+        result = subprocess.run(
+            [
+                SOFFICE_PATH,
+                f"-env:UserInstallation={profile}",
+                "--headless",
+                "--convert-to", "pdf",
+                "--outdir", output_dir,
+                pptx_path
+            ],
+            capture_output=True,
+            timeout=CONVERSION_TIMEOUT_SECONDS
+        )
+    finally:
+        profiles.put(profile)
+    
+    pdf_path = os.path.join(output_dir, Path(pptx_path).stem + ".pdf")
+    if result.returncode != 0 or not os.path.exists(pdf_path):
+        raise Exception(f"LibreOffice conversion failed: {result.stderr.decode(errors='replace').strip()}")
+    return pdf_path
+
+
+def _init_powerpoint_thread():
+    import comtypes
+    comtypes.CoInitialize()
+
+
+def _powerpoint_convert(pptx_path: str, pdf_path: str):
+    """Runs on the PowerPoint thread."""
+    global _powerpoint
+    import comtypes.client
+    
+    if _powerpoint is None:
+        _powerpoint = comtypes.client.CreateObject("PowerPoint.Application")
+        _powerpoint.Visible = 1
+    
+    try:
+        presentation = _powerpoint.Presentations.Open(pptx_path, WithWindow=False)
+        try:
+            # Save as PDF (32 = ppSaveAsPDF)
+            presentation.SaveAs(pdf_path, 32)
+        finally:
+            presentation.Close()
+    except Exception:
+        # PowerPoint may have been closed or crashed; relaunch it next time
+        _powerpoint = None
+        raise
+
+
+def _convert_with_powerpoint(pptx_path: str, output_dir: str) -> str:
+    """Convert with PowerPoint COM automation on its dedicated thread."""
+    global _powerpoint_executor
+    if importlib.util.find_spec("comtypes") is None:
+        logger.error("comtypes not installed. Cannot convert PPTX to PDF.")
+        raise Exception("PPTX to PDF conversion not available (neither LibreOffice nor comtypes is installed)")
+    
+    if _powerpoint_executor is None:
+        _powerpoint_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="powerpoint",
+            initializer=_init_powerpoint_thread
+        )
+    
+    pdf_path = os.path.join(output_dir, Path(pptx_path).stem + ".pdf")
+    _powerpoint_executor.submit(_powerpoint_convert, pptx_path, pdf_path).result(timeout=CONVERSION_TIMEOUT_SECONDS)
+    return pdf_path
+
+
+def _quit_powerpoint():
+    global _powerpoint
+    if _powerpoint is not None:
+        _powerpoint.Quit()
+        _powerpoint = None
 
-def convert_pptx_to_pdf(pptx_content: bytes, original_filename: str) -> tuple[bytes, str]:
-    """Convert PPTX content to PDF using PowerPoint automation.
+
+def shutdown_pptx_converter():
+    """Close the long-lived PowerPoint instance, if one was started."""
+    global _powerpoint_executor
+    if _powerpoint_executor is None:
+        return
+    try:
+        _powerpoint_executor.submit(_quit_powerpoint).result(timeout=30)
+    except Exception as e:
+        logger.warning(f"Failed to quit PowerPoint: {e}")
+    _powerpoint_executor.shutdown(wait=False)
+    _powerpoint_executor = None
+
+
+def _work_dir_base(pptx_size: int) -> Optional[str]:
+    """Pick tmpfs for the conversion's files when it has room, else the default temp dir."""
+    if os.path.isdir(SHM_DIR):
+        try:
+            if shutil.disk_usage(SHM_DIR).free >= pptx_size * SHM_SPACE_FACTOR:
+                return SHM_DIR
+        except OSError:
+            pass
+    return None
+
+
+def convert_pptx_to_pdf(pptx_file: BinaryIO, original_filename: str) -> tuple[BinaryIO, str]:
+    """Convert a PPTX file to PDF.
+    
+    Conversion runs file-to-file, on tmpfs when it has room, so neither
+    document is ever held in process memory. Up to PPTX_CONVERSION_WORKERS
+    LibreOffice conversions run at once; PowerPoint conversions run one at
+    a time.
     
     Args:
-        pptx_content: PPTX file content as bytes
+        pptx_file: Readable binary file object with the PPTX content
         original_filename: Original filename (e.g., "presentation.pptx")
-        
+    
     Returns:
-        Tuple of (PDF content as bytes, PDF filename)
-        
+        Tuple of (PDF as a temporary file positioned at the start, PDF filename).
+        The temporary file is deleted when the caller closes it.
+    
     Raises:
         Exception: If conversion fails
     """
-    try:
-        import comtypes.client
-    except ImportError:
-        logger.error("comtypes not installed. Cannot convert PPTX to PDF.")
-        raise Exception("PPTX to PDF conversion not available (comtypes not installed)")
-    
-    # Create temp files
-    temp_dir = tempfile.gettempdir()
-    temp_pptx = os.path.join(temp_dir, f"temp_{os.urandom(8).hex()}.pptx")
-    temp_pdf = os.path.join(temp_dir, f"temp_{os.urandom(8).hex()}.pdf")
+    pptx_size = pptx_file.seek(0, os.SEEK_END)
+    pptx_file.seek(0)
+    work_dir = tempfile.mkdtemp(prefix="pptx_", dir=_work_dir_base(pptx_size))
+    temp_pptx = os.path.join(work_dir, "presentation.pptx")
     
     try:
-        # Write PPTX to temp file
+        # Stream PPTX to temp file
         with open(temp_pptx, "wb") as f:
-            f.write(pptx_content)
+            shutil.copyfileobj(pptx_file, f)
         
         logger.info(f"Converting PPTX to PDF: {original_filename}")
         
-        # Initialize PowerPoint
-        powerpoint = comtypes.client.CreateObject("PowerPoint.Application")
-        powerpoint.Visible = 1
+        if SOFFICE_PATH:
+            temp_pdf = _convert_with_libreoffice(temp_pptx, work_dir)
+        else:
+            temp_pdf = _convert_with_powerpoint(temp_pptx, work_dir)
         
-        # Open presentation
-        presentation = powerpoint.Presentations.Open(temp_pptx, WithWindow=False)
-        
-        # Save as PDF (32 = ppSaveAsPDF)
-        presentation.SaveAs(temp_pdf, 32)
-        
-        # Close presentation
-        presentation.Close()
-        powerpoint.Quit()
-        
-        # Read PDF content
-        with open(temp_pdf, "rb") as f:
-            pdf_content = f.read()
+        if os.name == "posix":
+            # An open file outlives its unlinked path, so the PDF is handed
+            # over as is and freed on close
+            pdf_file = open(temp_pdf, "rb")
+            pdf_size = os.fstat(pdf_file.fileno()).st_size
+        else:
+            # Move the PDF into a self-deleting temp file so the work dir can be removed
+            pdf_file = tempfile.TemporaryFile()
+            with open(temp_pdf, "rb") as f:
+                shutil.copyfileobj(f, pdf_file)
+            pdf_size = pdf_file.tell()
+            pdf_file.seek(0)
         
         # Generate PDF filename
         pdf_filename = Path(original_filename).stem + ".pdf"
         
-        logger.info(f"Successfully converted {original_filename} to PDF ({len(pdf_content)} bytes)")
-        
-        return pdf_content, pdf_filename
+        logger.info(f"Successfully converted {original_filename} to PDF ({pdf_size} bytes)")
         
+        return pdf_file, pdf_filename
+    
     except Exception as e:
         logger.error(f"Failed to convert PPTX to PDF: {e}")
         raise
     finally:
         # Cleanup temp files
-        try:
-            if os.path.exists(temp_pptx):
-                os.remove(temp_pptx)
-            if os.path.exists(temp_pdf):
-                os.remove(temp_pdf)
-        except Exception as e:
-            logger.warning(f"Failed to cleanup temp files: {e}")
+        shutil.rmtree(work_dir, ignore_errors=True)
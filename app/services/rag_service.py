@@ -1,22 +1,45 @@
 """RAG (Retrieval-Augmented Generation) service with Bedrock KB and Gemini using LangChain."""
 import logging
-from typing import List, Tuple, Optional, Dict, Any
+import re
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, AsyncIterator, List, Tuple, Optional, Dict, Any, Union
 from uuid import UUID
-import boto3
 from botocore.exceptions import ClientError
 
-from langchain_aws import AmazonKnowledgeBasesRetriever
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import PromptTemplate
-from langchain_core.documents import Document as LangChainDocument
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.messages.ai import add_usage
+
+if TYPE_CHECKING:
+    from langchain_google_genai import ChatGoogleGenerativeAI
 
 from app.config import settings
 from app.models import Message, MessageRole
 from app.services.bedrock_client import create_metadata_filter
+from app.services.retrieval_coalescer import submit_retrieval
+from app.services.semantic_cache import (
+    answer_scope, embed_question, lookup_answer, semantic_cache_enabled, store_answer
+)
 
 logger = logging.getLogger(__name__)
 
+
+@dataclass(slots=True)
+class EphemeralMessage:
+    """Chat history entry that is never persisted (e.g. history sent by the client).
+    
+    Exposes the same role/content attributes that format_chat_history reads
+    from Message rows, without building a mapped ORM entity.
+    """
+    role: MessageRole
+    content: str
+
+
+HistoryMessage = Union[Message, EphemeralMessage]
+
+# Gemini clients by temperature (None = model default), created on first use
+# and shared by later questions so each one doesn't set up a new channel
+_llms: Dict[Optional[float], "ChatGoogleGenerativeAI"] = {}
+
 # System prompt for Gemini
 SYSTEM_PROMPT_CONCISE = """You are a notebook assistant working exclusively with the documents provided in this notebook.
 
@@ -50,365 +73,513 @@ CRITICAL RULES:
 Your goal is to provide the most helpful and complete technical answer possible based on the available data."""
 
 
-def build_notebook_retriever(
-    user_id: UUID,
-    notebook_id: UUID,
-    selected_document_ids: Optional[List[UUID]] = None,
-    k: int = 6
-) -> AmazonKnowledgeBasesRetriever:
-    """Build LangChain retriever for a notebook.
+def get_llm(temperature: Optional[float] = None) -> "ChatGoogleGenerativeAI":
+    """Get or create the Gemini client for answering questions at a temperature."""
+    llm = _llms.get(temperature)
+    if llm is None:
+        # The Gemini SDK takes about a second to import, so processes that
+        # never answer a question (e.g. the ingestion worker) skip it
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        options = {} if temperature is None else {"temperature": temperature}
+        llm = _llms[temperature] = ChatGoogleGenerativeAI(
+            model=settings.GEMINI_MODEL,
+            google_api_key=settings.GEMINI_API_KEY,
+            convert_system_message_to_human=True, # Gemini sometimes prefers this
+            **options
+        )
+    return llm
+
+
+@dataclass(frozen=True, slots=True)
+class AnswerMode:
+    """Prompt and retrieval settings for one answer mode."""
+    name: str
+    system_prompt: str
+    retrieval_count: int
+    temperature: float
+
+
+ANSWER_MODES = {
+    "ask": AnswerMode("ASK", SYSTEM_PROMPT_CONCISE, retrieval_count=6, temperature=0.7),
+    "plan": AnswerMode("PLAN", SYSTEM_PROMPT_DETAILED, retrieval_count=25, temperature=0.3)
+}
+
+# Notebook-wide questions commonly asked first, answered ahead of time when
+# cache warming is enabled (see warm_answer_cache)
+WARM_QUESTIONS = (
+    "Summarize these documents.",
+    "What are the key takeaways?",
+    "What are the main topics covered?"
+)
+
+# Most chunks a single KB retrieve call returns
+MAX_RETRIEVAL_RESULTS = 100
+
+# Chat history sent with a question is capped by estimated tokens as well as count
+MAX_HISTORY_TOKENS = 4000
+CHARS_PER_TOKEN = 4
+
+# Chunks whose word sets overlap at least this much (Jaccard) repeat each
+# other, e.g. the same page in two uploads; only the best-scored is kept
+DUPLICATE_CHUNK_SIMILARITY = 0.9
+_WORD_PATTERN = re.compile(r"\w+")
+
+# Header and content of one retrieved chunk in the prompt context. No
+# position index, so a chunk's text doesn't depend on what precedes it.
+_CONTEXT_TEMPLATE = "[Document: %s, Chunk: %s, Doc ID: %s]\n%s"
+
+# Question prompt, filled with the formatted context and the question
+_QUESTION_TEMPLATE = """CONTEXT FROM YOUR DOCUMENTS:
+%s
+
+QUESTION:
+%s
+
+Please answer the question using only the information from the context above. Answer naturally and professionally."""
+
+
+@dataclass(slots=True)
+class ChunkInfo:
+    """Identifiers of a retrieved chunk, read from its Bedrock metadata."""
+    chunk_id: Optional[str]
+    document_id: str
+    filename: str
+
+
+def _chunk_info(metadata: Dict[str, Any]) -> ChunkInfo:
+    """Extract a chunk's identifiers, with fallbacks for how Bedrock maps its metadata."""
+    chunk_id = metadata.get('chunk_id')
+    if chunk_id is None:
+        source_metadata = metadata.get('sourceMetadata')
+        if source_metadata:
+            chunk_id = source_metadata.get('chunkId')
+    
+    filename = metadata.get('filename')
+    if filename is None:
+        source_uri = metadata.get('x-amz-bedrock-kb-source-uri')
+        filename = source_uri.rsplit('/', 1)[-1] if source_uri else 'unknown_document'
+    
+    return ChunkInfo(
+        chunk_id=chunk_id,
+        document_id=metadata.get('document_id', 'unknown'),
+        filename=filename
+    )
+
+
+def drop_duplicate_chunks(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Drop chunks that near-duplicate a better-scored one.
+    
+    Chunks are compared by their sets of lowercased words, which catches
+    repeated content without an embedding call on the request path.
     
     Args:
-        user_id: User UUID
-        notebook_id: Notebook UUID
-        selected_document_ids: Optional list of specific document IDs
-        k: Number of chunks to retrieve
+        chunks: Retrieved chunk dicts, best first (the KB's order)
         
     Returns:
-        AmazonKnowledgeBasesRetriever instance
+        The chunks to keep, still best first
     """
-    # Create metadata filter
-    metadata_filter = create_metadata_filter(
-        user_id=user_id,
-        notebook_id=notebook_id,
-        document_ids=selected_document_ids
-    )
-    
-    # Create bedrock-agent-runtime client with explicit credentials
-    client = boto3.client(
-        'bedrock-agent-runtime',
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        aws_session_token=settings.AWS_SESSION_TOKEN,
-        region_name=settings.AWS_REGION
-    )
-
-    retriever = AmazonKnowledgeBasesRetriever(
-        knowledge_base_id=settings.BEDROCK_KB_ID,
-        retrieval_config={
-            "vectorSearchConfiguration": {
-                "numberOfResults": k,
-                "filter": metadata_filter
-            }
-        },
-        client=client
-    )
+    kept = []
+    kept_words = []
+    for chunk in chunks:
+        words = frozenset(_WORD_PATTERN.findall(chunk['content'].lower()))
+        is_duplicate = any(
+            len(words & other) >= DUPLICATE_CHUNK_SIMILARITY * len(words | other)
+            for other in kept_words
+        )
+        if not is_duplicate:
+            kept.append(chunk)
+            kept_words.append(words)
     
-    return retriever
+    if len(kept) < len(chunks):
+        logger.info(f"Dropped {len(chunks) - len(kept)} duplicate chunks")
+    return kept
 
 
-def format_langchain_docs(docs: List[LangChainDocument]) -> str:
-    """Format LangChain documents into context string.
+def format_context(
+    chunks: List[Dict[str, Any]],
+    chunk_infos: Optional[List[ChunkInfo]] = None
+) -> str:
+    """Format retrieved chunks into context string.
+    
+    Chunks are ordered by document and chunk ID rather than by score, so
+    the same set of chunks always produces the same context and Gemini's
+    prompt cache can reuse it.
     
     Args:
-        docs: List of LangChain Documents
+        chunks: Retrieved chunk dicts
+        chunk_infos: The chunks' ChunkInfo, if the caller already extracted it
         
     Returns:
         Formatted context string
     """
-    if not docs:
+    if not chunks:
         return "No relevant documents found."
     
-    context_parts = []
-    for i, doc in enumerate(docs, 1):
-        metadata = doc.metadata
-        # Bedrock KB returns metadata in a specific structure, LangChain might flatten it or keep it
-        # We need to inspect how AmazonKnowledgeBasesRetriever returns it.
-        # Usually it's in doc.metadata
-        
-        chunk_id = metadata.get('chunk_id', f'chunk_{i}')
-        # Fallback for chunk_id if not directly in metadata (depends on Bedrock response mapping)
-        if 'chunk_id' not in metadata and 'sourceMetadata' in metadata:
-             chunk_id = metadata['sourceMetadata'].get('chunkId', f'chunk_{i}')
-             
-        content = doc.page_content
-        
-        # Extract document info
-        doc_id = metadata.get('document_id', 'unknown')
-        filename = metadata.get('filename', 'unknown_document')
-        # Fallback for filename
-        if 'filename' not in metadata and 'x-amz-bedrock-kb-source-uri' in metadata:
-            filename = metadata['x-amz-bedrock-kb-source-uri'].split('/')[-1]
-        
-        context_parts.append(
-            f"[Document {i}: {filename}, Chunk: {chunk_id}, Doc ID: {doc_id}]\n{content}"
-        )
+    if chunk_infos is None:
+        chunk_infos = [_chunk_info(chunk['metadata']) for chunk in chunks]
     
-    return "\n\n---\n\n".join(context_parts)
+    ordered = sorted(
+        zip(chunks, chunk_infos),
+        key=lambda item: (item[1].document_id, item[1].chunk_id or '', item[0]['content'])
+    )
+    return "\n\n---\n\n".join([
+        _CONTEXT_TEMPLATE % (info.filename, info.chunk_id or 'unknown', info.document_id, chunk['content'])
+        for chunk, info in ordered
+    ])
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting (Gemini averages ~4 characters per token)."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
 
+# LangChain message class for each stored message role
+_HISTORY_MESSAGE_TYPES = {
+    MessageRole.USER: HumanMessage,
+    MessageRole.ASSISTANT: AIMessage,
+    MessageRole.SYSTEM: SystemMessage
+}
 
-def format_chat_history(messages: List[Message], max_messages: int = 10) -> List[Any]:
+
+def format_chat_history(
+    messages: List[HistoryMessage],
+    max_messages: int = 10,
+    max_tokens: int = MAX_HISTORY_TOKENS
+) -> List[Any]:
     """Format chat history for LangChain.
     
+    Keeps the most recent messages that fit in the token budget, so one long
+    answer can't crowd the retrieved context out of Gemini's input.
+    
     Args:
-        messages: List of Message objects
+        messages: List of Message or EphemeralMessage objects
         max_messages: Maximum number of messages to include
+        max_tokens: Estimated token budget for the included messages
         
     Returns:
         List of BaseMessage objects
     """
-    # Get most recent messages
-    recent_messages = messages[-max_messages:] if len(messages) > max_messages else messages
-    
     formatted = []
-    for msg in recent_messages:
-        if msg.role == MessageRole.USER:
-            formatted.append(HumanMessage(content=msg.content))
-        elif msg.role == MessageRole.ASSISTANT:
-            formatted.append(AIMessage(content=msg.content))
-        elif msg.role == MessageRole.SYSTEM:
-            formatted.append(SystemMessage(content=msg.content))
-            
+    remaining = max_tokens
+    # Walk back from the newest message until either limit is reached
+    for msg in reversed(messages):
+        if len(formatted) == max_messages:
+            break
+        remaining -= estimate_tokens(msg.content)
+        if remaining < 0:
+            break
+        
+        message_type = _HISTORY_MESSAGE_TYPES.get(msg.role)
+        if message_type is not None:
+            formatted.append(message_type(content=msg.content))
+    
+    formatted.reverse()
     return formatted
 
 
-def answer_question(
+@dataclass(slots=True)
+class PreparedAnswer:
+    """Everything needed to generate an answer, gathered before calling Gemini.
+    
+    answer is set instead of messages when no Gemini call is needed (e.g.
+    nothing relevant was retrieved).
+    """
+    messages: Optional[List[Any]] = None
+    temperature: Optional[float] = None
+    chunks: List[Dict[str, Any]] = field(default_factory=list)
+    answer: Optional[str] = None
+
+
+def _log_usage(usage_metadata: Optional[Dict[str, Any]]):
+    """Log a Gemini call's token usage, including input tokens served from its prompt cache.
+    
+    Gemini caches repeated prompt prefixes implicitly, which is why the
+    prompt keeps its static parts (system prompt, then chat history) ahead
+    of the per-question context.
+    """
+    if not usage_metadata:
+        return
+    cached_tokens = (usage_metadata.get('input_token_details') or {}).get('cache_read', 0)
+    logger.info(
+        f"Gemini usage: {usage_metadata.get('input_tokens', 0)} input tokens "
+        f"({cached_tokens} cached), {usage_metadata.get('output_tokens', 0)} output tokens"
+    )
+
+
+def _content_text(content: Any) -> str:
+    """Text of a Gemini message or chunk's content, which may be content blocks."""
+    # Handle case where Gemini returns a list of content blocks
+    if isinstance(content, list):
+        text_parts = []
+        for part in content:
+            if isinstance(part, dict) and part.get('type') == 'text':
+                text_parts.append(part.get('text', ''))
+            elif isinstance(part, str):
+                text_parts.append(part)
+        return "".join(text_parts)
+    # Handle case where Gemini returns a single content block dict
+    if isinstance(content, dict):
+        return content.get('text', '') if content.get('type') == 'text' else ''
+    return content
+
+
+def _retrieval_chunks(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Map a KB retrieve response to the chunk dicts returned with answers.
+    
+    chunk_id is filled in by prepare_answer, which reads each chunk's
+    identifiers once for the prompt and the response.
+    """
+    # Results may be shared, so metadata is copied
+    chunks = []
+    for result in response.get('retrievalResults', []):
+        metadata = {
+            **result.get('metadata', {}),
+            'score': result.get('score'),
+            'location': result.get('location')
+        }
+        chunks.append({
+            'content': result.get('content', {}).get('text', ''),
+            'score': metadata['score'],
+            'metadata': metadata,
+            'location': metadata['location'] or {}
+        })
+    return chunks
+
+
+def _retrieve_chunks(
     user_id: UUID,
     notebook_id: UUID,
     question: str,
-    history: List[Message],
-    selected_document_ids: Optional[List[UUID]] = None,
-    mode: str = "ask"
-) -> Tuple[str, List[Dict[str, Any]]]:
-    """Answer a question using RAG with LangChain.
+    history: List[HistoryMessage],
+    selected_document_ids: Optional[List[UUID]],
+    retrieval_count: int
+) -> Tuple[List[Dict[str, Any]], List[Any]]:
+    """Retrieve a question's chunks, formatting the chat history while the KB call runs.
     
-    Args:
-        user_id: User UUID
-        notebook_id: Notebook UUID
-        question: User's question
-        history: Chat history
-        selected_document_ids: Optional list of document IDs to search
-        mode: "ask" (concise) or "plan" (detailed)
-        
     Returns:
-        Tuple of (answer, retrieved_chunks)
+        Tuple of (retrieved chunks, formatted chat history)
     """
-    # Configure mode-specific settings
-    if mode == "plan":
-        system_prompt = SYSTEM_PROMPT_DETAILED
-        retrieval_count = 25
-        temperature = 0.3
-        logger.info("Using PLAN mode: Detailed prompt, 25 chunks, temp 0.3")
-    else:
-        system_prompt = SYSTEM_PROMPT_CONCISE
-        retrieval_count = 6
-        temperature = 0.7
-        logger.info("Using ASK mode: Concise prompt, 6 chunks, temp 0.7")
-
+    # Create metadata filter
+    metadata_filter = create_metadata_filter(
+        user_id=user_id,
+        notebook_id=notebook_id,
+        document_ids=selected_document_ids
+    )
+    
+    logger.info(f"Querying Bedrock KB with filter: {metadata_filter}")
+    
+    # Identical questions asked concurrently share one KB call
+    retrieval = submit_retrieval(question, metadata_filter, retrieval_count)
+    
+    # Format chat history while the retrieval is in flight
+    chat_history = format_chat_history(history)
+    
     try:
-        # Check if AWS credentials are configured for RAG
-        if not settings.AWS_ACCESS_KEY_ID or not settings.BEDROCK_KB_ID:
-            logger.warning("AWS credentials not configured. Running in chat-only mode (no document retrieval)")
-            
-            # Format chat history
-            chat_history = format_chat_history(history)
-            
-            # Add system message and user question
-            messages = [SystemMessage(content="You are a helpful AI assistant.")] + chat_history + [HumanMessage(content=question)]
-            
-            # Call Gemini directly via LangChain
-            llm = ChatGoogleGenerativeAI(
-                model=settings.GEMINI_MODEL,
-                google_api_key=settings.GEMINI_API_KEY,
-                convert_system_message_to_human=True # Gemini sometimes prefers this
-            )
-            
-            response = llm.invoke(messages)
-            answer = response.content
-            
-            logger.info(f"Generated answer in chat-only mode for question: {question[:50]}...")
-            return (answer, [])
-        
-        # 1. Build retriever (REMOVED: Using direct boto3 call instead)
-        # retriever = build_notebook_retriever(...)
-        
-        # 2. Retrieve relevant chunks using direct boto3 call
-        # This bypasses potential issues with AmazonKnowledgeBasesRetriever filter handling
+        chunks = _retrieval_chunks(retrieval.result())
+    except Exception as e:
+        logger.error(f"Bedrock retrieval failed: {e}")
+        chunks = []
+
+    logger.info(f"Retrieved {len(chunks)} chunks for question: {question}")
+    for i, chunk in enumerate(chunks):
+        logger.info(f"Chunk {i} content preview: {chunk['content'][:200]}...")
+    
+    if not chunks and selected_document_ids:
+        logger.warning("Strict filter returned 0 results. Attempting fallback with notebook-only filter.")
         
-        # Create metadata filter
-        metadata_filter = create_metadata_filter(
+        # Fallback: Try retrieving from the notebook without document_id filter
+        # This helps if the document_id metadata is missing or not indexed yet
+        fallback_filter = create_metadata_filter(
             user_id=user_id,
             notebook_id=notebook_id,
-            document_ids=selected_document_ids
+            document_ids=None # Remove document constraint
         )
         
-        # Create client
-        client = boto3.client(
-            'bedrock-agent-runtime',
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            aws_session_token=settings.AWS_SESSION_TOKEN,
-            region_name=settings.AWS_REGION
-        )
-        
-        logger.info(f"Querying Bedrock KB with filter: {metadata_filter}")
-        
         try:
-            response = client.retrieve(
-                knowledgeBaseId=settings.BEDROCK_KB_ID,
-                retrievalQuery={
-                    'text': question
-                },
-                retrievalConfiguration={
-                    'vectorSearchConfiguration': {
-                        'numberOfResults': retrieval_count,
-                        'filter': metadata_filter
-                    }
-                }
-            )
+            # Fetch more to increase chance of finding relevant docs
+            response = submit_retrieval(question, fallback_filter, retrieval_count * 2).result()
             
-            retrieval_results = response.get('retrievalResults', [])
+            # Client-side filtering
+            fallback_chunks = []
+            target_doc_ids = [str(uid) for uid in selected_document_ids]
             
-            # Map to LangChain Documents
-            docs = []
-            for result in retrieval_results:
-                content = result.get('content', {}).get('text', '')
-                metadata = result.get('metadata', {})
-                metadata['score'] = result.get('score')
-                metadata['location'] = result.get('location')
+            for chunk in _retrieval_chunks(response):
+                doc_id = chunk['metadata'].get('document_id')
                 
-                docs.append(LangChainDocument(
-                    page_content=content,
-                    metadata=metadata
-                ))
+                # If document_id matches, or if it's missing (we can't be sure, but we'll include it if it looks relevant)
+                # Actually, if document_id is missing, we should probably check filename or source URI
+                # For now, we only include if we can verify it matches OR if we are desperate
                 
-        except Exception as e:
-            logger.error(f"Bedrock retrieval failed: {e}")
-            docs = []
-
-        logger.info(f"Retrieved {len(docs)} documents for question: {question}")
-        for i, doc in enumerate(docs):
-            logger.info(f"Doc {i} content preview: {doc.page_content[:200]}...")
-        
-        if not docs and selected_document_ids:
-            logger.warning("Strict filter returned 0 results. Attempting fallback with notebook-only filter.")
+                if doc_id and str(doc_id) in target_doc_ids:
+                    fallback_chunks.append(chunk)
             
-            # Fallback: Try retrieving from the notebook without document_id filter
-            # This helps if the document_id metadata is missing or not indexed yet
-            fallback_filter = create_metadata_filter(
-                user_id=user_id,
-                notebook_id=notebook_id,
-                document_ids=None # Remove document constraint
-            )
-            
-            try:
-                response = client.retrieve(
-                    knowledgeBaseId=settings.BEDROCK_KB_ID,
-                    retrievalQuery={
-                        'text': question
-                    },
-                    retrievalConfiguration={
-                        'vectorSearchConfiguration': {
-                            'numberOfResults': retrieval_count * 2, # Fetch more to increase chance of finding relevant docs
-                            'filter': fallback_filter
-                        }
-                    }
-                )
-                
-                retrieval_results = response.get('retrievalResults', [])
+            if fallback_chunks:
+                logger.info(f"Fallback retrieval found {len(fallback_chunks)} relevant documents.")
+                chunks = fallback_chunks
+            else:
+                logger.warning("Fallback retrieval also failed to find matching documents.")
                 
-                # Client-side filtering
-                fallback_docs = []
-                target_doc_ids = [str(uid) for uid in selected_document_ids]
-                
-                for result in retrieval_results:
-                    metadata = result.get('metadata', {})
-                    doc_id = metadata.get('document_id')
-                    
-                    # If document_id matches, or if it's missing (we can't be sure, but we'll include it if it looks relevant)
-                    # Actually, if document_id is missing, we should probably check filename or source URI
-                    # For now, we only include if we can verify it matches OR if we are desperate
-                    
-                    if doc_id and str(doc_id) in target_doc_ids:
-                        content = result.get('content', {}).get('text', '')
-                        metadata['score'] = result.get('score')
-                        metadata['location'] = result.get('location')
-                        fallback_docs.append(LangChainDocument(page_content=content, metadata=metadata))
-                
-                if fallback_docs:
-                    logger.info(f"Fallback retrieval found {len(fallback_docs)} relevant documents.")
-                    docs = fallback_docs
-                else:
-                    logger.warning("Fallback retrieval also failed to find matching documents.")
-                    
-            except Exception as e:
-                logger.error(f"Fallback retrieval failed: {e}")
-
-        if not docs:
-            return (
-                "I couldn't find any relevant information in your documents to answer this question.",
-                []
-            )
+        except Exception as e:
+            logger.error(f"Fallback retrieval failed: {e}")
+
+    return chunks, chat_history
+
+
+def retrieve_notebook_chunks(
+    user_id: UUID,
+    notebook_id: UUID,
+    question: str,
+    number_of_results: int
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Retrieve chunks for a question across a whole notebook, grouped by document ID.
+    
+    Lets a caller asking the same question about several documents make one
+    KB call and pass each document's share to answer_question.
+    
+    Returns:
+        Dict of document ID string to its chunks, in score order (empty if
+        retrieval is not configured or failed)
+    """
+    if not settings.AWS_ACCESS_KEY_ID or not settings.BEDROCK_KB_ID:
+        return {}
+    
+    metadata_filter = create_metadata_filter(user_id=user_id, notebook_id=notebook_id)
+    try:
+        response = submit_retrieval(question, metadata_filter, min(number_of_results, MAX_RETRIEVAL_RESULTS)).result()
+    except Exception as e:
+        logger.error(f"Bedrock notebook retrieval failed: {e}")
+        return {}
+    
+    chunks_by_id: Dict[str, List[Dict[str, Any]]] = {}
+    for chunk in _retrieval_chunks(response):
+        document_id = chunk['metadata'].get('document_id')
+        if document_id:
+            chunks_by_id.setdefault(str(document_id), []).append(chunk)
+    return chunks_by_id
+
+
+def prepare_answer(
+    user_id: UUID,
+    notebook_id: UUID,
+    question: str,
+    history: List[HistoryMessage],
+    selected_document_ids: Optional[List[UUID]] = None,
+    mode: str = "ask",
+    prefetched_chunks: Optional[List[Dict[str, Any]]] = None
+) -> PreparedAnswer:
+    """Retrieve context for a question and build the Gemini prompt.
+    
+    Args:
+        user_id: User UUID
+        notebook_id: Notebook UUID
+        question: User's question
+        history: Chat history
+        selected_document_ids: Optional list of document IDs to search
+        mode: "ask" (concise) or "plan" (detailed)
+        prefetched_chunks: Chunks already retrieved for the question (e.g. by
+            retrieve_notebook_chunks); skips the KB call
         
-        # 3. Format context
-        context = format_langchain_docs(docs)
+    Returns:
+        PreparedAnswer with the prompt messages and retrieved chunks
+    """
+    # Configure mode-specific settings (unknown modes answer like "ask")
+    answer_mode = ANSWER_MODES.get(mode, ANSWER_MODES["ask"])
+    system_prompt = answer_mode.system_prompt
+    retrieval_count = answer_mode.retrieval_count
+    temperature = answer_mode.temperature
+    logger.info(f"Using {answer_mode.name} mode: {retrieval_count} chunks, temp {temperature}")
+
+    # Check if AWS credentials are configured for RAG
+    if not settings.AWS_ACCESS_KEY_ID or not settings.BEDROCK_KB_ID:
+        logger.warning("AWS credentials not configured. Running in chat-only mode (no document retrieval)")
         
-        # 4. Format chat history
+        # Format chat history
         chat_history = format_chat_history(history)
         
-        # 5. Build the prompt
-        # We construct the messages list manually to have full control
-        system_message = SystemMessage(content=system_prompt)
-        
-        human_message_content = f"""CONTEXT FROM YOUR DOCUMENTS:
-{context}
+        # Add system message and user question
+        messages = [SystemMessage(content="You are a helpful AI assistant.")] + chat_history + [HumanMessage(content=question)]
+        return PreparedAnswer(messages=messages, temperature=None)
+    
+    if prefetched_chunks is not None:
+        chunks = prefetched_chunks
+        chat_history = format_chat_history(history)
+    else:
+        chunks, chat_history = _retrieve_chunks(user_id, notebook_id, question, history, selected_document_ids, retrieval_count)
+    chunks = drop_duplicate_chunks(chunks)
 
-QUESTION:
-{question}
+    if not chunks:
+        return PreparedAnswer(
+            answer="I couldn't find any relevant information in your documents to answer this question."
+        )
+    
+    # 3. Format context (each chunk's metadata is read once, for the prompt and the response)
+    chunk_infos = [_chunk_info(chunk['metadata']) for chunk in chunks]
+    context = format_context(chunks, chunk_infos)
+    
+    # 4. Build the prompt (chat history was formatted during retrieval)
+    # We construct the messages list manually to have full control
+    system_message = SystemMessage(content=system_prompt)
+    
+    human_message_content = _QUESTION_TEMPLATE % (context, question)
+    
+    messages = [system_message] + chat_history + [HumanMessage(content=human_message_content)]
+    
+    # 5. Tag the chunks for the API response
+    for chunk, info in zip(chunks, chunk_infos):
+        chunk['chunk_id'] = info.chunk_id or 'unknown'
+    
+    return PreparedAnswer(messages=messages, temperature=temperature, chunks=chunks)
 
-Please answer the question using only the information from the context above. Answer naturally and professionally."""
-        
-        messages = [system_message] + chat_history + [HumanMessage(content=human_message_content)]
+
+def answer_question(
+    user_id: UUID,
+    notebook_id: UUID,
+    question: str,
+    history: List[HistoryMessage],
+    selected_document_ids: Optional[List[UUID]] = None,
+    mode: str = "ask",
+    prefetched_chunks: Optional[List[Dict[str, Any]]] = None
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """Answer a question using RAG with LangChain.
+    
+    Args:
+        user_id: User UUID
+        notebook_id: Notebook UUID
+        question: User's question
+        history: Chat history
+        selected_document_ids: Optional list of document IDs to search
+        mode: "ask" (concise) or "plan" (detailed)
+        prefetched_chunks: Chunks already retrieved for the question; skips the KB call
         
-        # 6. Call Gemini via LangChain
-        llm = ChatGoogleGenerativeAI(
-            model=settings.GEMINI_MODEL,
-            google_api_key=settings.GEMINI_API_KEY,
-            temperature=temperature,
-            convert_system_message_to_human=True
-        )
+    Returns:
+        Tuple of (answer, retrieved_chunks)
+    """
+    try:
+        # A similar question asked before in the same scope skips retrieval
+        # and generation (only without history, which changes the answer)
+        cache_embedding = None
+        if not history and semantic_cache_enabled():
+            scope = answer_scope(user_id, notebook_id, selected_document_ids, mode)
+            cache_embedding = embed_question(question)
+            if cache_embedding is not None:
+                cached = lookup_answer(scope, cache_embedding)
+                if cached is not None:
+                    return cached
         
-        response = llm.invoke(messages)
-        answer = response.content
+        prepared = prepare_answer(user_id, notebook_id, question, history, selected_document_ids, mode, prefetched_chunks)
+        if prepared.answer is not None:
+            return (prepared.answer, prepared.chunks)
         
-        # Handle case where Gemini returns a list of content blocks
-        if isinstance(answer, list):
-            text_parts = []
-            for part in answer:
-                if isinstance(part, dict) and part.get('type') == 'text':
-                    text_parts.append(part.get('text', ''))
-                elif isinstance(part, str):
-                    text_parts.append(part)
-            answer = "".join(text_parts)
-        # Handle case where Gemini returns a single content block dict
-        elif isinstance(answer, dict) and answer.get('type') == 'text':
-            answer = answer.get('text', '')
+        # Call Gemini via LangChain
+        response = get_llm(prepared.temperature).invoke(prepared.messages)
+        answer = _content_text(response.content)
+        _log_usage(response.usage_metadata)
         
         logger.info(f"Generated answer for question: {question[:50]}...")
-        
-        # 7. Convert LangChain docs back to dictionary format for the API response
-        chunks = []
-        for doc in docs:
-            # Map LangChain Document back to our chunk dict format
-            metadata = doc.metadata
-            
-            # Try to extract chunk_id
-            chunk_id = metadata.get('chunk_id')
-            if not chunk_id and 'sourceMetadata' in metadata:
-                chunk_id = metadata['sourceMetadata'].get('chunkId', 'unknown')
-            if not chunk_id:
-                chunk_id = 'unknown'
-
-            chunk = {
-                'content': doc.page_content,
-                'score': metadata.get('score', 0.0), # AmazonKnowledgeBasesRetriever might put score in metadata
-                'metadata': metadata,
-                'location': metadata.get('location', {}),
-                'chunk_id': chunk_id
-            }
-            chunks.append(chunk)
-        
-        return (answer, chunks)
+        if cache_embedding is not None:
+            store_answer(scope, cache_embedding, answer, prepared.chunks)
+        return (answer, prepared.chunks)
         
     except Exception as e:
         logger.error(f"Error in answer_question: {e}")
@@ -416,3 +587,47 @@ Please answer the question using only the information from the context above. An
             f"I encountered an error while processing your question: {str(e)}",
             []
         )
+
+
+def warm_answer_cache(user_id: UUID, notebook_id: UUID):
+    """Answer WARM_QUESTIONS for a notebook so they are cached before anyone asks.
+    
+    Blocking (one KB retrieval and Gemini call per question); a no-op unless
+    SEMANTIC_CACHE_WARM is set and the answer cache is enabled.
+    """
+    if not (settings.SEMANTIC_CACHE_WARM and semantic_cache_enabled()):
+        return
+    
+    logger.info(f"Warming answer cache for notebook {notebook_id}")
+    for question in WARM_QUESTIONS:
+        # answer_question caches the answer (answers to failed calls aren't cached)
+        answer_question(user_id, notebook_id, question, history=[])
+
+
+async def astream_answer(prepared: PreparedAnswer) -> AsyncIterator[str]:
+    """Yield a prepared answer's text as Gemini generates it.
+    
+    Runs on the event loop, so no thread is held while waiting for tokens.
+    
+    Args:
+        prepared: Result of prepare_answer
+        
+    Yields:
+        Successive pieces of the answer
+    """
+    if prepared.answer is not None:
+        yield prepared.answer
+        return
+    
+    # Each streamed chunk carries the usage delta since the previous one, so
+    # the call's totals are their sum
+    usage = None
+    try:
+        async for chunk in get_llm(prepared.temperature).astream(prepared.messages):
+            if chunk.usage_metadata:
+                usage = add_usage(usage, chunk.usage_metadata)
+            text = _content_text(chunk.content)
+            if text:
+                yield text
+    finally:
+        _log_usage(usage)
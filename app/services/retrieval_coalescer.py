@@ -0,0 +1,70 @@
+"""Coalescing of concurrent Bedrock Knowledge Base retrievals.
+
+Identical retrievals (same query, filter and result count) that overlap in
+time share one KB call: later callers get the in-flight call's future
+instead of issuing their own. Results are shared, so callers must treat the
+retrieval results as read-only.
+"""
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Tuple
+
+import orjson
+
+from app.config import settings
+from app.services.bedrock_client import bedrock_agent_runtime_client
+
+logger = logging.getLogger(__name__)
+
+# Runs KB retrievals so callers can prepare the rest of the prompt meanwhile
+_retrieval_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="kb-retrieve")
+
+_in_flight: Dict[Tuple[str, bytes, int], Future] = {}
+_in_flight_lock = threading.Lock()
+
+
+def _retrieve(query: str, metadata_filter: Dict[str, Any], number_of_results: int) -> Dict[str, Any]:
+    return bedrock_agent_runtime_client.retrieve(
+        knowledgeBaseId=settings.BEDROCK_KB_ID,
+        retrievalQuery={
+            'text': query
+        },
+        retrievalConfiguration={
+            'vectorSearchConfiguration': {
+                'numberOfResults': number_of_results,
+                'filter': metadata_filter
+            }
+        }
+    )
+
+
+def submit_retrieval(query: str, metadata_filter: Dict[str, Any], number_of_results: int) -> Future:
+    """Start a KB retrieval, or join an identical one already in flight.
+
+    Args:
+        query: Retrieval query text
+        metadata_filter: Bedrock metadata filter
+        number_of_results: Number of chunks to retrieve
+
+    Returns:
+        Future resolving to the Bedrock retrieve response
+    """
+    key = (query, orjson.dumps(metadata_filter, option=orjson.OPT_SORT_KEYS), number_of_results)
+
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        if future is not None:
+            logger.debug("Joining in-flight KB retrieval")
+            return future
+
+        future = _retrieval_executor.submit(_retrieve, query, metadata_filter, number_of_results)
+        _in_flight[key] = future
+
+    def _forget(_):
+        with _in_flight_lock:
+            if _in_flight.get(key) is future:
+                del _in_flight[key]
+
+    future.add_done_callback(_forget)
+    return future
@@ -1,11 +1,36 @@
 """AWS S3 client configuration and utilities."""
+import io
+from typing import BinaryIO, Dict, Iterator, List, Optional, Union
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from app.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Uploads above 8MB are sent as multipart uploads with parts in flight in parallel
+UPLOAD_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=10
+)
+
+# Each multipart transfer keeps up to max_concurrency connections busy and
+# several uploads run at once, so the pool is larger than botocore's 10
+S3_CLIENT_CONFIG = Config(
+    max_pool_connections=50,
+    retries={'mode': 'adaptive', 'max_attempts': 5},
+    tcp_keepalive=True
+)
+
+# Read size when streaming an object's body
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# S3 DeleteObjects accepts at most this many keys per request
+DELETE_OBJECTS_BATCH_SIZE = 1000
+
 # Initialize S3 client lazily to avoid errors with empty credentials
 _s3_client = None
 
@@ -18,18 +43,29 @@ def get_s3_client():
             aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
             aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
             aws_session_token=settings.AWS_SESSION_TOKEN,
-            region_name=settings.AWS_REGION
+            region_name=settings.AWS_REGION,
+            config=S3_CLIENT_CONFIG
         )
     return _s3_client
 
 
-def upload_file_to_s3(file_content: bytes, s3_key: str, content_type: str = None) -> bool:
+def upload_file_to_s3(
+    file_content: Union[bytes, BinaryIO],
+    s3_key: str,
+    content_type: str = None,
+    metadata: Optional[Dict[str, str]] = None
+) -> bool:
     """Upload a file to S3.
     
+    File-like objects are streamed with upload_fileobj, so large uploads are
+    never fully loaded into memory; files over the multipart threshold are
+    split into parts that upload concurrently.
+    
     Args:
-        file_content: File content as bytes
+        file_content: File content as bytes or a readable binary file object
         s3_key: S3 object key (path)
         content_type: MIME type of the file
+        metadata: Optional user-defined S3 object metadata (ASCII values)
         
     Returns:
         True if successful, False otherwise
@@ -45,13 +81,19 @@ def upload_file_to_s3(file_content: bytes, s3_key: str, content_type: str = None
         extra_args = {}
         if content_type:
             extra_args['ContentType'] = content_type
+        if metadata:
+            extra_args['Metadata'] = metadata
+        
+        if isinstance(file_content, bytes):
+            file_content = io.BytesIO(file_content)
         
         logger.info(f"Uploading file to S3 - Bucket: {settings.S3_BUCKET_NAME}, Key: {s3_key}")
-        s3_client.put_object(
-            Bucket=settings.S3_BUCKET_NAME,
-            Key=s3_key,
-            Body=file_content,
-            **extra_args
+        s3_client.upload_fileobj(
+            file_content,
+            settings.S3_BUCKET_NAME,
+            s3_key,
+            ExtraArgs=extra_args,
+            Config=UPLOAD_TRANSFER_CONFIG
         )
         logger.info(f"Successfully uploaded file to S3: {s3_key}")
         return True
@@ -62,6 +104,61 @@ def upload_file_to_s3(file_content: bytes, s3_key: str, content_type: str = None
         return False
 
 
+def generate_presigned_upload_url(
+    s3_key: str,
+    content_type: Optional[str] = None,
+    expires_in: int = 900
+) -> Optional[str]:
+    """Generate a presigned URL the client can PUT a file to directly.
+    
+    Args:
+        s3_key: S3 object key (path)
+        content_type: MIME type the client must send with the PUT
+        expires_in: URL lifetime in seconds
+        
+    Returns:
+        Presigned URL, or None if S3 is not configured or signing failed
+    """
+    if not settings.AWS_ACCESS_KEY_ID or not settings.S3_BUCKET_NAME:
+        logger.warning(f"AWS credentials not configured. Cannot presign upload for: {s3_key}")
+        return None
+    
+    params = {'Bucket': settings.S3_BUCKET_NAME, 'Key': s3_key}
+    if content_type:
+        params['ContentType'] = content_type
+    
+    try:
+        return get_s3_client().generate_presigned_url(
+            'put_object',
+            Params=params,
+            ExpiresIn=expires_in
+        )
+    except ClientError as e:
+        logger.error(f"Error generating presigned upload URL: {e}")
+        return None
+
+
+def s3_object_exists(s3_key: str) -> bool:
+    """Check whether an object exists in S3.
+    
+    Args:
+        s3_key: S3 object key (path)
+        
+    Returns:
+        True if the object exists (or S3 is not configured), False otherwise
+    """
+    if not settings.AWS_ACCESS_KEY_ID or not settings.S3_BUCKET_NAME:
+        logger.warning(f"AWS credentials not configured. Skipping S3 existence check for: {s3_key}")
+        return True
+    
+    try:
+        get_s3_client().head_object(Bucket=settings.S3_BUCKET_NAME, Key=s3_key)
+        return True
+    except ClientError as e:
+        logger.info(f"S3 object not found: {s3_key} ({e})")
+        return False
+
+
 def delete_file_from_s3(s3_key: str) -> bool:
     """Delete a file from S3.
     
@@ -90,14 +187,81 @@ def delete_file_from_s3(s3_key: str) -> bool:
         return False
 
 
-def get_file_from_s3(s3_key: str) -> bytes | None:
-    """Get a file from S3.
+def delete_files_from_s3(s3_keys: List[str]) -> bool:
+    """Delete several files from S3 with batched DeleteObjects requests.
+    
+    Args:
+        s3_keys: S3 object keys (paths); sent 1000 per request
+        
+    Returns:
+        True if every key was deleted, False otherwise
+    """
+    # Check if AWS credentials are configured
+    if not settings.AWS_ACCESS_KEY_ID or not settings.S3_BUCKET_NAME:
+        logger.warning(f"AWS credentials not configured. Skipping S3 delete for {len(s3_keys)} keys")
+        logger.info("File deletion mocked successfully (no S3 storage)")
+        return True
+    
+    s3_client = get_s3_client()
+    success = True
+    for start in range(0, len(s3_keys), DELETE_OBJECTS_BATCH_SIZE):
+        batch = s3_keys[start:start + DELETE_OBJECTS_BATCH_SIZE]
+        try:
+            # Quiet mode only reports the keys that failed
+            response = s3_client.delete_objects(
+                Bucket=settings.S3_BUCKET_NAME,
+                Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+            )
+        except ClientError as e:
+            logger.error(f"Error deleting files from S3: {e}")
+            success = False
+            continue
+        
+        for error in response.get('Errors', []):
+            logger.error(f"Error deleting file from S3: {error.get('Key')} ({error.get('Code')}: {error.get('Message')})")
+            success = False
+    
+    if success:
+        logger.info(f"Successfully deleted {len(s3_keys)} files from S3")
+    return success
+
+
+def download_file_from_s3(s3_key: str, fileobj: BinaryIO) -> bool:
+    """Stream a file from S3 into a writable binary file object.
     
     Args:
         s3_key: S3 object key (path)
+        fileobj: Writable binary file object, left positioned after the content
         
     Returns:
-        File content as bytes, or None if error
+        True if successful, False otherwise
+    """
+    s3_client = get_s3_client()
+    if not s3_client or not settings.S3_BUCKET_NAME:
+        logger.warning(f"AWS credentials not configured. Cannot download: {s3_key}")
+        return False
+    
+    try:
+        s3_client.download_fileobj(
+            settings.S3_BUCKET_NAME,
+            s3_key,
+            fileobj
+        )
+        return True
+    except ClientError as e:
+        logger.error(f"Error downloading file from S3: {e}")
+        return False
+
+
+def stream_file_from_s3(s3_key: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> Optional[Iterator[bytes]]:
+    """Stream a file from S3 in chunks.
+    
+    Args:
+        s3_key: S3 object key (path)
+        chunk_size: Most bytes per yielded chunk
+        
+    Returns:
+        Iterator over the file content, or None if error
     """
     try:
         s3_client = get_s3_client()
@@ -107,7 +271,24 @@ def get_file_from_s3(s3_key: str) -> bytes | None:
             Bucket=settings.S3_BUCKET_NAME,
             Key=s3_key
         )
-        return response['Body'].read()
+        return response['Body'].iter_chunks(chunk_size)
     except ClientError as e:
         logger.error(f"Error getting file from S3: {e}")
         return None
+
+
+def get_file_from_s3(s3_key: str) -> bytes | None:
+    """Get a file from S3.
+    
+    Prefer stream_file_from_s3 or download_file_from_s3 for large files.
+    
+    Args:
+        s3_key: S3 object key (path)
+        
+    Returns:
+        File content as bytes, or None if error
+    """
+    chunks = stream_file_from_s3(s3_key)
+    if chunks is None:
+        return None
+    return b"".join(chunks)
@@ -0,0 +1,242 @@
+"""Approximate cache of RAG answers, looked up by question similarity.
+
+A question whose embedding is close enough (cosine similarity at least
+SEMANTIC_CACHE_THRESHOLD) to one answered before in the same scope reuses
+that answer, skipping the KB retrieval and the Gemini generation. Only
+questions asked without chat history are cached, since the history changes
+the answer.
+
+Entries expire after SEMANTIC_CACHE_TTL_SECONDS and a notebook's entries are
+dropped when its documents change. The cache is per process, so another
+worker's upload is only reflected once the TTL runs out.
+"""
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+from uuid import UUID
+
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+AnswerScope = Tuple[UUID, UUID, Optional[frozenset], str]
+
+
+# Random-projection LSH: each table hashes an embedding to the signs of its
+# projections on LSH_BITS random hyperplanes. Similar questions share a
+# bucket in at least one table, or land one bit away.
+LSH_BITS = 16
+LSH_TABLES = 4
+
+
+@dataclass(slots=True)
+class CachedAnswer:
+    """Answer stored for a cluster of similar questions.
+
+    The embedding is the normalized running mean of the questions merged
+    into the entry, and the answer is the newest one.
+    """
+    embedding: np.ndarray
+    answer: str
+    chunks: List[Dict[str, Any]]
+    expires_at: float
+    buckets: Tuple[int, ...]
+    count: int = 1
+
+
+class ProximityCache:
+    """LRU cache of answers keyed by normalized question embeddings.
+
+    Lookups only score the entries sharing an LSH bucket (or a bucket one
+    bit away) with the question in some table, so their cost depends on
+    the bucket sizes rather than on the size of the cache. An insert close
+    enough to an existing entry is merged into it instead of adding one.
+    """
+
+    def __init__(self, capacity: int, threshold: float, ttl_seconds: float, seed: int = 0):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[int, Tuple[Hashable, CachedAnswer]] = {}
+        self._buckets: Dict[Tuple[Hashable, int, int], Set[int]] = {}
+        # Least recently used first, across all scopes
+        self._lru: OrderedDict[int, None] = OrderedDict()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._rng = np.random.default_rng(seed)
+        # Hyperplanes for all tables, drawn once the embedding size is known
+        self._planes: Optional[np.ndarray] = None
+        self._bit_values = 1 << np.arange(LSH_BITS, dtype=np.int64)
+
+    def _hashes(self, embedding: np.ndarray) -> Tuple[int, ...]:
+        if self._planes is None:
+            self._planes = self._rng.standard_normal((LSH_TABLES * LSH_BITS, embedding.shape[0])).astype(np.float32)
+        bits = (self._planes @ embedding > 0).reshape(LSH_TABLES, LSH_BITS)
+        return tuple(int(value) for value in bits @ self._bit_values)
+
+    def _index(self, scope: Hashable, entry_id: int, entry: CachedAnswer):
+        for table, bucket in enumerate(entry.buckets):
+            self._buckets.setdefault((scope, table, bucket), set()).add(entry_id)
+
+    def _unindex(self, scope: Hashable, entry_id: int, entry: CachedAnswer):
+        for table, bucket in enumerate(entry.buckets):
+            members = self._buckets[(scope, table, bucket)]
+            members.discard(entry_id)
+            if not members:
+                del self._buckets[(scope, table, bucket)]
+
+    def _remove(self, entry_id: int):
+        scope, entry = self._entries.pop(entry_id)
+        self._unindex(scope, entry_id, entry)
+        self._lru.pop(entry_id, None)
+
+    def _closest(self, scope: Hashable, embedding: np.ndarray) -> Optional[int]:
+        """ID of the closest live entry of a scope at or above the threshold."""
+        candidates = set()
+        for table, bucket in enumerate(self._hashes(embedding)):
+            for probe in (bucket, *(bucket ^ (1 << bit) for bit in range(LSH_BITS))):
+                candidates.update(self._buckets.get((scope, table, probe), ()))
+
+        now = time.monotonic()
+        for entry_id in [entry_id for entry_id in candidates if self._entries[entry_id][1].expires_at <= now]:
+            self._remove(entry_id)
+            candidates.discard(entry_id)
+        if not candidates:
+            return None
+
+        entry_ids = list(candidates)
+        scores = np.stack([self._entries[entry_id][1].embedding for entry_id in entry_ids]) @ embedding
+        best = int(np.argmax(scores))
+        return entry_ids[best] if scores[best] >= self.threshold else None
+
+    def lookup(self, scope: Hashable, embedding: np.ndarray) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """Get (answer, chunks) of the closest live entry of a scope, if it is similar enough."""
+        with self._lock:
+            if not self._entries:
+                return None
+
+            entry_id = self._closest(scope, embedding)
+            if entry_id is None:
+                return None
+            self._lru.move_to_end(entry_id)
+            entry = self._entries[entry_id][1]
+            return (entry.answer, list(entry.chunks))
+
+    def insert(self, scope: Hashable, embedding: np.ndarray, answer: str, chunks: List[Dict[str, Any]]):
+        """Store an answer, evicting the least recently used entries past capacity.
+
+        A question within the threshold of an entry (e.g. the same question
+        answered concurrently) moves that entry's centroid towards it and
+        replaces its answer.
+        """
+        with self._lock:
+            entry_id = self._closest(scope, embedding)
+            if entry_id is not None:
+                entry = self._entries[entry_id][1]
+                self._unindex(scope, entry_id, entry)
+                centroid = entry.embedding * entry.count + embedding
+                entry.embedding = centroid / np.linalg.norm(centroid)
+                entry.count += 1
+                entry.answer = answer
+                entry.chunks = chunks
+                entry.expires_at = time.monotonic() + self.ttl_seconds
+                entry.buckets = self._hashes(entry.embedding)
+                self._index(scope, entry_id, entry)
+                self._lru.move_to_end(entry_id)
+                return
+
+            entry_id = next(self._ids)
+            entry = CachedAnswer(
+                embedding=embedding,
+                answer=answer,
+                chunks=chunks,
+                expires_at=time.monotonic() + self.ttl_seconds,
+                buckets=self._hashes(embedding)
+            )
+            self._entries[entry_id] = (scope, entry)
+            self._index(scope, entry_id, entry)
+            self._lru[entry_id] = None
+
+            while len(self._lru) > self.capacity:
+                self._remove(next(iter(self._lru)))
+
+    def invalidate(self, notebook_id: UUID):
+        """Drop every entry whose scope covers a notebook."""
+        with self._lock:
+            for entry_id in [entry_id for entry_id, (scope, _) in self._entries.items() if scope[1] == notebook_id]:
+                self._remove(entry_id)
+
+
+_answer_cache = ProximityCache(
+    capacity=settings.SEMANTIC_CACHE_SIZE,
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+    ttl_seconds=settings.SEMANTIC_CACHE_TTL_SECONDS
+)
+
+# Embedding client, created on first use
+_embeddings = None
+
+
+def semantic_cache_enabled() -> bool:
+    """Whether answers are cached (SEMANTIC_CACHE_SIZE > 0)."""
+    return settings.SEMANTIC_CACHE_SIZE > 0
+
+
+def answer_scope(
+    user_id: UUID,
+    notebook_id: UUID,
+    selected_document_ids: Optional[List[UUID]],
+    mode: str
+) -> AnswerScope:
+    """Build the scope a cached answer may be reused in."""
+    return (
+        user_id,
+        notebook_id,
+        frozenset(selected_document_ids) if selected_document_ids else None,
+        mode
+    )
+
+
+def embed_question(question: str) -> Optional[np.ndarray]:
+    """Embed a question as an L2-normalized float32 vector, or None if embedding failed."""
+    global _embeddings
+    try:
+        if _embeddings is None:
+            from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+            _embeddings = GoogleGenerativeAIEmbeddings(
+                model=settings.SEMANTIC_CACHE_EMBEDDING_MODEL,
+                google_api_key=settings.GEMINI_API_KEY
+            )
+        embedding = np.asarray(_embeddings.embed_query(question), dtype=np.float32)
+    except Exception as e:
+        logger.warning(f"Question embedding failed, skipping answer cache: {e}")
+        return None
+
+    norm = np.linalg.norm(embedding)
+    return embedding / norm if norm else None
+
+
+def lookup_answer(scope: AnswerScope, embedding: np.ndarray) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+    """Get a cached (answer, chunks) for a similar question in the scope."""
+    cached = _answer_cache.lookup(scope, embedding)
+    if cached is not None:
+        logger.info("Answer cache hit")
+    return cached
+
+
+def store_answer(scope: AnswerScope, embedding: np.ndarray, answer: str, chunks: List[Dict[str, Any]]):
+    """Cache an answer for later similar questions in the scope."""
+    _answer_cache.insert(scope, embedding, answer, list(chunks))
+
+
+def invalidate_notebook(notebook_id: UUID):
+    """Forget cached answers for a notebook whose documents changed."""
+    if semantic_cache_enabled():
+        _answer_cache.invalidate(notebook_id)
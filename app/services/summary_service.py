@@ -1,44 +1,86 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from uuid import UUID
-from typing import List
+from typing import Any, Dict, List
+from sqlalchemy import Row, select
 from sqlalchemy.orm import Session
 from app.database import SessionLocal
-from app.models import SummaryPack, SummaryPackStatus, Document, SummaryPackScope
-from app.services.rag_service import answer_question
-from app.config import settings
+from app.models import SummaryPack, SummaryPackSection, SummaryPackStatus, Document, SummaryPackScope
+from app.schemas.summary_pack import DocumentSection, SummaryPackSections
+from app.services.rag_service import ANSWER_MODES, _content_text, answer_question, get_llm, retrieve_notebook_chunks
 
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage
 
 logger = logging.getLogger(__name__)
 
+EXECUTIVE_SUMMARY_KEY = "executive_summary"
+EXECUTIVE_SUMMARY_TEMPERATURE = 0.3
+
+# Documents summarized at once; each summary is a network-bound KB + Gemini call
+SUMMARY_WORKERS = 6
+
+DOCUMENT_SUMMARY_QUESTION = "Provide a detailed summary of this document. Include key takeaways, main points, and any important dates or figures."
+
+# Chunks per document summary (plan mode's retrieval count). A document's
+# share of a notebook-wide retrieval is only used when it is this large, so
+# no summary gets less context than its own retrieval would have given it.
+SUMMARY_CHUNKS_PER_DOCUMENT = ANSWER_MODES["plan"].retrieval_count
+
+
+def build_pack_sections(sections: Dict[str, Any]) -> List[SummaryPackSection]:
+    """Turn the generated sections dict into ordered SummaryPackSection rows."""
+    rows = []
+    for idx, (key, value) in enumerate(sections.items()):
+        if key == EXECUTIVE_SUMMARY_KEY:
+            rows.append(SummaryPackSection(idx=idx, key=key, body=value))
+        else:
+            rows.append(SummaryPackSection(idx=idx, key=key, title=value["document_name"], body=value["summary"]))
+    return rows
+
+
+def load_pack_sections(rows: List[SummaryPackSection]) -> SummaryPackSections:
+    """Rebuild the typed sections payload from a pack's section rows."""
+    executive_summary = ""
+    documents = {}
+    for row in rows:
+        if row.key == EXECUTIVE_SUMMARY_KEY:
+            executive_summary = row.body
+        else:
+            # Sections migrated from the JSON column may be missing their title
+            documents[UUID(row.key)] = DocumentSection(document_name=row.title or "", summary=row.body)
+    return SummaryPackSections(executive_summary=executive_summary, documents=documents)
+
+
 def generate_summary_pack_task(summary_pack_id: UUID):
     """Background task to generate summary pack."""
-    print(f"DEBUG: Starting generate_summary_pack_task for {summary_pack_id}", flush=True)
+    logger.debug(f"Starting generate_summary_pack_task for {summary_pack_id}")
     db = SessionLocal()
     try:
-        print("DEBUG: Database session created", flush=True)
-        pack = db.query(SummaryPack).filter(SummaryPack.id == summary_pack_id).first()
+        logger.debug("Database session created")
+        pack = db.get(SummaryPack, summary_pack_id)
         if not pack:
-            print(f"DEBUG: SummaryPack {summary_pack_id} not found", flush=True)
             logger.error(f"SummaryPack {summary_pack_id} not found")
             return
 
-        print(f"DEBUG: Found pack {pack.id}, updating status to IN_PROGRESS", flush=True)
+        logger.debug(f"Found pack {pack.id}, updating status to IN_PROGRESS")
         pack.status = SummaryPackStatus.IN_PROGRESS
         db.commit()
-        print("DEBUG: Status updated to IN_PROGRESS", flush=True)
+        logger.debug("Status updated to IN_PROGRESS")
 
         # 1. Identify documents
         docs_to_process = []
         if pack.scope_type == SummaryPackScope.NOTEBOOK:
-            docs_to_process = db.query(Document).filter(Document.notebook_id == pack.notebook_id).all()
+            docs_to_process = db.execute(
+                select(Document.id, Document.title).where(Document.notebook_id == pack.notebook_id)
+            ).all()
         elif pack.scope_type == SummaryPackScope.DOCUMENT_LIST:
             if pack.scope_document_ids:
                 doc_ids = [UUID(str(id)) for id in pack.scope_document_ids]
-                docs_to_process = db.query(Document).filter(Document.id.in_(doc_ids)).all()
+                docs_to_process = db.execute(
+                    select(Document.id, Document.title).where(Document.id.in_(doc_ids))
+                ).all()
         
-        print(f"DEBUG: Found {len(docs_to_process)} documents to process", flush=True)
+        logger.debug(f"Found {len(docs_to_process)} documents to process")
 
         if not docs_to_process:
             pack.status = SummaryPackStatus.FAILED
@@ -49,116 +91,106 @@ def generate_summary_pack_task(summary_pack_id: UUID):
         # 2. Generate summaries for each document
         sections = {}
         combined_summaries = []
+        # Read up front; the workers mustn't touch the (not thread-safe) session
+        user_id, notebook_id = pack.created_by_user_id, pack.notebook_id
+        # End the read transaction so no connection is held while summarizing
+        db.commit()
+
+        # A notebook-wide pack asks every document the same question, so one
+        # retrieval over the notebook can stand in for most per-document ones
+        prefetched = {}
+        if pack.scope_type == SummaryPackScope.NOTEBOOK and len(docs_to_process) > 1:
+            prefetched = retrieve_notebook_chunks(
+                user_id,
+                notebook_id,
+                DOCUMENT_SUMMARY_QUESTION,
+                SUMMARY_CHUNKS_PER_DOCUMENT * len(docs_to_process)
+            )
 
-        for i, doc in enumerate(docs_to_process):
+        def summarize(doc: Row):
+            """Summarize one document; returns (summary, error)."""
             try:
-                print(f"DEBUG: Processing document {i+1}/{len(docs_to_process)}: {doc.title}", flush=True)
                 logger.info(f"Summarizing document {doc.id}: {doc.title}")
+                doc_chunks = prefetched.get(str(doc.id), [])
                 # Use RAG service to summarize specific document
                 summary, _ = answer_question(
-                    user_id=pack.created_by_user_id,
-                    notebook_id=pack.notebook_id,
-                    question="Provide a detailed summary of this document. Include key takeaways, main points, and any important dates or figures.",
+                    user_id=user_id,
+                    notebook_id=notebook_id,
+                    question=DOCUMENT_SUMMARY_QUESTION,
                     history=[],
                     selected_document_ids=[doc.id],
-                    mode="plan" # Use plan mode for detailed output
+                    mode="plan", # Use plan mode for detailed output
+                    prefetched_chunks=doc_chunks[:SUMMARY_CHUNKS_PER_DOCUMENT] if len(doc_chunks) >= SUMMARY_CHUNKS_PER_DOCUMENT else None
                 )
-                print(f"DEBUG: Summary generated for {doc.title}", flush=True)
-                
-                sections[str(doc.id)] = {
-                    "document_name": doc.title,
-                    "summary": summary
-                }
-                combined_summaries.append(f"Document: {doc.title}\nSummary:\n{summary}")
-                
+                logger.debug(f"Summary generated for {doc.title}")
+                return summary, None
             except Exception as e:
                 logger.error(f"Failed to summarize doc {doc.id}: {e}")
-                sections[str(doc.id)] = {
-                    "document_name": doc.title,
-                    "summary": f"Error generating summary: {str(e)}"
-                }
+                return None, e
+
+        # The summaries are independent, so run them side by side; map keeps
+        # the sections in document order
+        with ThreadPoolExecutor(max_workers=min(SUMMARY_WORKERS, len(docs_to_process))) as executor:
+            for doc, (summary, error) in zip(docs_to_process, executor.map(summarize, docs_to_process)):
+                if error is None:
+                    sections[str(doc.id)] = {
+                        "document_name": doc.title,
+                        "summary": summary
+                    }
+                    combined_summaries.append(f"Document: {doc.title}\nSummary:\n{summary}")
+                else:
+                    sections[str(doc.id)] = {
+                        "document_name": doc.title,
+                        "summary": f"Error generating summary: {str(error)}"
+                    }
 
         # 3. Generate Executive Summary (Master Summary)
         if combined_summaries:
             try:
-                print("DEBUG: Starting Executive Summary generation...", flush=True)
                 logger.info("Generating executive summary...")
-                llm = ChatGoogleGenerativeAI(
-                    model=settings.GEMINI_MODEL,
-                    google_api_key=settings.GEMINI_API_KEY,
-                    temperature=0.3
-                )
+                llm = get_llm(EXECUTIVE_SUMMARY_TEMPERATURE)
                 
                 master_prompt = "You are a research assistant. Below are summaries of several documents. Please provide an Executive Summary that synthesizes the key information across all these documents.\n\n" + "\n\n---\n\n".join(combined_summaries)
                 
-                print(f"DEBUG: Sending master prompt (length: {len(master_prompt)}) to Gemini...", flush=True)
+                logger.debug(f"Sending master prompt (length: {len(master_prompt)}) to Gemini...")
                 response = llm.invoke([HumanMessage(content=master_prompt)])
-                print("DEBUG: Executive Summary received from Gemini", flush=True)
+                logger.debug("Executive Summary received from Gemini")
                 
                 # Handle structured response
-                content = response.content
-                if isinstance(content, list):
-                    text_parts = []
-                    for part in content:
-                        if isinstance(part, dict) and part.get('type') == 'text':
-                            text_parts.append(part.get('text', ''))
-                        elif isinstance(part, str):
-                            text_parts.append(part)
-                    sections["executive_summary"] = "".join(text_parts)
-                elif isinstance(content, dict) and content.get('type') == 'text':
-                    sections["executive_summary"] = content.get('text', '')
-                else:
-                    sections["executive_summary"] = str(content)
+                sections[EXECUTIVE_SUMMARY_KEY] = _content_text(response.content)
                 
-                print("DEBUG: Executive Summary processed and saved", flush=True)
+                logger.debug("Executive Summary processed and saved")
 
             except Exception as e:
-                print(f"DEBUG: Failed to generate executive summary: {e}", flush=True)
                 logger.error(f"Failed to generate executive summary: {e}")
-                sections["executive_summary"] = "Failed to generate executive summary."
+                sections[EXECUTIVE_SUMMARY_KEY] = "Failed to generate executive summary."
 
-        # Close the long-running session to avoid timeout issues
-        try:
-            db.close()
-            print("DEBUG: Closed long-running session", flush=True)
-        except Exception as close_error:
-            print(f"DEBUG: Error closing long-running session (ignoring): {close_error}", flush=True)
-
-        # Open a fresh session for the final update
-        print("DEBUG: Opening fresh DB session for final commit...", flush=True)
-        final_db = SessionLocal()
-        try:
-            pack = final_db.query(SummaryPack).filter(SummaryPack.id == summary_pack_id).first()
-            if pack:
-                pack.sections = sections
-                pack.status = SummaryPackStatus.DONE
-                final_db.commit()
-                print("DEBUG: Final commit successful", flush=True)
-                logger.info(f"SummaryPack {summary_pack_id} completed successfully")
-            else:
-                print(f"DEBUG: SummaryPack {summary_pack_id} not found during final commit", flush=True)
-                logger.error(f"SummaryPack {summary_pack_id} not found during final commit")
-        except Exception as e:
-            print(f"DEBUG: Error during final commit: {e}", flush=True)
-            raise e
-        finally:
-            final_db.close()
+        # The session held no connection while documents were summarized and
+        # the pool pre-pings connections on checkout, so the final update
+        # reuses it. Expiring reloads the pack in case it was deleted meanwhile.
+        db.expire_all()
+        pack = db.get(SummaryPack, summary_pack_id)
+        if pack:
+            pack.sections = build_pack_sections(sections)
+            pack.status = SummaryPackStatus.DONE
+            db.commit()
+            logger.debug("Final commit successful")
+            logger.info(f"SummaryPack {summary_pack_id} completed successfully")
+        else:
+            logger.error(f"SummaryPack {summary_pack_id} not found during final commit")
 
     except Exception as e:
         logger.error(f"Summary pack generation failed: {e}")
-        print(f"DEBUG: Summary pack generation failed: {e}", flush=True)
         
-        # Try to update status to FAILED using a fresh session
+        # Try to update status to FAILED, discarding whatever the failure left pending
         try:
-            error_db = SessionLocal()
-            pack = error_db.query(SummaryPack).filter(SummaryPack.id == summary_pack_id).first()
+            db.rollback()
+            pack = db.get(SummaryPack, summary_pack_id)
             if pack:
                 pack.status = SummaryPackStatus.FAILED
                 pack.error_message = str(e)
-                error_db.commit()
-            error_db.close()
+                db.commit()
         except Exception as update_error:
             logger.error(f"Failed to update status to FAILED: {update_error}")
-            
-    # Note: db.close() is handled above or in the finally block of the first session if we didn't close it
-    # But since we closed it explicitly, we don't need a global finally for db
+    finally:
+        db.close()
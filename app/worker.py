@@ -0,0 +1,81 @@
+"""Celery worker for durable background jobs.
+
+Only used when CELERY_BROKER_URL is set; otherwise the API runs these jobs
+in-process. Start a worker with:
+
+    celery -A app.worker.celery_app worker --loglevel=info
+
+PPTX to PDF conversion runs on its own queue, so it can be served by
+separate workers (with LibreOffice or PowerPoint installed) scaled on its
+depth:
+
+    celery -A app.worker.celery_app worker -Q pptx --loglevel=info
+"""
+import logging
+from uuid import UUID
+
+from botocore.exceptions import BotoCoreError
+from celery import Celery
+
+from app.config import settings
+from app.services.ingestion import (
+    ACTIVE_JOB_RECHECK_SECONDS, IngestionStartError, run_document_ingestion, run_pptx_conversion,
+    mark_document_error
+)
+from app.services.job_tracker import ACTIVE_JOB_TTL_SECONDS
+from app.services.summary_service import generate_summary_pack_task
+from app.services.discovery_service import generate_discovery_questions_task
+
+logger = logging.getLogger(__name__)
+
+PPTX_QUEUE = "pptx"
+
+celery_app = Celery(
+    "rag_api",
+    broker=settings.CELERY_BROKER_URL,
+    backend=settings.CELERY_RESULT_BACKEND
+)
+celery_app.conf.update(
+    # Re-deliver jobs interrupted by a worker crash instead of losing them
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    worker_prefetch_multiplier=1,
+    task_routes={"app.worker.convert_pptx_document": {"queue": PPTX_QUEUE}}
+)
+
+
+# Ingestion retries every ACTIVE_JOB_RECHECK_SECONDS while another job holds
+# the data source, for as long as that job's slot can stay held
+INGESTION_MAX_RETRIES = ACTIVE_JOB_TTL_SECONDS // ACTIVE_JOB_RECHECK_SECONDS
+
+
+@celery_app.task(bind=True, max_retries=INGESTION_MAX_RETRIES)
+def ingest_document(self, document_id: str):
+    """Write a document's KB metadata sidecar and ingest it into Bedrock."""
+    try:
+        run_document_ingestion(UUID(document_id))
+    except (BotoCoreError, IngestionStartError) as e:
+        if self.request.retries >= self.max_retries:
+            logger.error(f"Giving up on ingestion for document {document_id}: {e}")
+            mark_document_error(UUID(document_id), f"Failed to trigger ingestion: {e}")
+            raise
+        # A running job takes minutes, so wait for it rather than backing off
+        raise self.retry(exc=e, countdown=ACTIVE_JOB_RECHECK_SECONDS)
+
+
+@celery_app.task
+def convert_pptx_document(document_id: str, source_s3_key: str):
+    """Convert an uploaded PPTX to PDF, then upload and ingest the PDF."""
+    run_pptx_conversion(UUID(document_id), source_s3_key)
+
+
+@celery_app.task
+def generate_summary_pack(summary_pack_id: str):
+    """Generate a summary pack."""
+    generate_summary_pack_task(UUID(summary_pack_id))
+
+
+@celery_app.task
+def generate_discovery_questions(question_set_id: str):
+    """Generate a discovery question set."""
+    generate_discovery_questions_task(UUID(question_set_id))